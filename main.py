@@ -49,7 +49,7 @@ def write_json_jobfile(job_settings: JobSettings):
         f.write('  },\n')
         f.write('  "extract":{\n')
         f.write('    "max_retries":' + str(job_settings.extract.max_retries)  + ',\n')
-        f.write('    "ollama_url":"' + job_settings.extract.ollama_url  + '",\n')
+        f.write('    "ollama_url":' + json.dumps(job_settings.extract.ollama_url)  + ',\n')
         f.write('    "user_instructions":"' + job_settings.extract.user_instructions  + '"\n')
         f.write('  }\n')
         f.write('}')
@@ -184,6 +184,8 @@ def print_all_settings(job_settings: JobSettings):
         print("#     "+ str(term))
     print("#   Model Name:    "+str(job_settings.model_name))
     print("#   Model Version: "+str(job_settings.model_version))
+    if job_settings.model_cascade:
+        print("#   Model Cascade: " + " -> ".join(tier["model"] for tier in job_settings.model_cascade))
     print("# ")
     
     print("# Filename Information:")
@@ -216,6 +218,10 @@ def print_all_settings(job_settings: JobSettings):
     print("#     " + str(job_settings.extract.user_instructions))
     print("#   Ollama Server: " + str(job_settings.extract.ollama_url))
     print("#   Maximum retries: " + str(job_settings.extract.max_retries))
+    print("#   Papers in flight: " + str(job_settings.extract.max_in_flight))
+    if job_settings.extract.pipeline_workers is not None:
+        print("#   Pipeline workers: " + str(job_settings.extract.pipeline_workers))
+    print("#   Response cache: " + (f"{job_settings.response_cache_mb} MB" if job_settings.response_cache else "off"))
     print("#   Using OpenAI: " + str(job_settings.use_openai))
     if job_settings.use_openai:
         print("#   API Key Present: " + str(bool(job_settings.api_key)))
@@ -280,6 +286,17 @@ def main():
     os.makedirs(os.path.join(os.getcwd(), 'search_info'), exist_ok=True)
     os.makedirs(os.path.join(os.getcwd(), 'results'), exist_ok=True)
 
+    # Make sure every model of an extraction cascade is available as well.
+    for tier in job_settings.model_cascade:
+        if tier["use_openai"]:
+            from src.utils import check_openai_model
+            if check_openai_model(tier["model"], job_settings.api_key):
+                print(f"Unable to access OpenAI model {tier['model']} from model_cascade. Terminating.")
+                AUTO_EPICFAIL = True
+        elif check_model_file(tier["model"]):
+            print(f"Unable to find or obtain model file for {tier['model']} from model_cascade.  Terminating.")
+            AUTO_EPICFAIL = True
+
     if job_settings.use_openai:
         from src.utils import check_openai_model
         if check_openai_model(
@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import deque
+import numpy as np
+from src.utils import print  # Custom print function for logging
+
+# Size of the hashed feature space (unigrams and bigrams of the processed paper text).
+NUM_FEATURES = 2 ** 18
+# The classifier only answers once it has this many verdicts, with at least
+# MIN_PER_CLASS of each answer.
+MIN_VERDICTS = 50
+MIN_PER_CLASS = 10
+# Retrain after this many new verdicts.
+RETRAIN_EVERY = 10
+# Each paper keeps only its strongest features, and only the newest verdicts are kept, so
+# memory, the verdict file and training time stay bounded however many papers are checked.
+MAX_FEATURES_PER_PAPER = 1000
+MAX_SAMPLES = 5000
+# The verdict file is rewritten with the kept verdicts once it has this many more lines.
+COMPACT_AFTER = MAX_SAMPLES
+# Training settings for the logistic regression.
+EPOCHS = 8
+LEARNING_RATE = 0.5
+L2 = 1e-4
+# Share of confident papers still sent to the check model, so new verdicts keep
+# arriving and the classifier's agreement with the model can be tracked.
+AUDIT_RATE = 0.05
+DEFAULT_VERDICT_DIR = os.path.join(os.getcwd(), 'processed_docs', 'check_verdicts')
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def _strongest_features(indices, values, limit=MAX_FEATURES_PER_PAPER):
+    """Keep the ``limit`` largest features, renormalised, with their indices in ascending order."""
+    if len(indices) <= limit:
+        return list(indices), list(values)
+    kept = sorted(sorted(range(len(indices)), key=lambda i: (-values[i], indices[i]))[:limit], key=lambda i: indices[i])
+    kept_values = np.array([values[i] for i in kept], dtype=np.float64)
+    kept_values /= np.linalg.norm(kept_values)
+    return [indices[i] for i in kept], [round(float(v), 5) for v in kept_values]
+
+
+def hashed_features(text):
+    """
+    Turn text into L2-normalised, log-scaled hashed unigram and bigram counts.
+
+    Only the ``MAX_FEATURES_PER_PAPER`` most frequent features are kept.
+
+    Returns:
+    tuple: Two lists, the feature indices and their values.
+    """
+    words = re.findall(r"[a-z0-9]+", str(text).lower())
+    counts = {}
+    for idx, word in enumerate(words):
+        grams = [word]
+        if idx:
+            grams.append(f"{words[idx - 1]} {word}")
+        for gram in grams:
+            feature = int(hashlib.md5(gram.encode("utf-8")).hexdigest()[:8], 16) % NUM_FEATURES
+            counts[feature] = counts.get(feature, 0) + 1
+    if not counts:
+        return [], []
+    indices = sorted(counts)
+    values = np.log1p(np.array([counts[i] for i in indices], dtype=np.float64))
+    values /= np.linalg.norm(values)
+    return _strongest_features(indices, [round(float(v), 5) for v in values])
+
+
+def _fit(samples):
+    """
+    Train the logistic regression on ``(indices, values, label)`` samples with SGD.
+
+    Returns:
+    tuple: The weight vector and the bias.
+    """
+    weights = np.zeros(NUM_FEATURES, dtype=np.float64)
+    bias = 0.0
+    rng = np.random.default_rng(0)
+    arrays = [(np.array(i, dtype=np.int64), np.array(v, dtype=np.float64), y) for i, v, y in samples]
+    for epoch in range(EPOCHS):
+        rate = LEARNING_RATE / (1 + epoch)
+        for sample in rng.permutation(len(arrays)):
+            indices, values, label = arrays[sample]
+            margin = float(np.dot(weights[indices], values)) + bias
+            error = 1.0 / (1.0 + np.exp(-margin)) - label
+            weights[indices] -= rate * (error * values + L2 * weights[indices])
+            bias -= rate * error
+    return weights, bias
+
+
+class CheckClassifier():
+    """
+    A hashed n-gram logistic regression that predicts the check model's verdicts.
+
+    Every verdict of the check model is stored with the paper's features in a JSONL file
+    per check prompt. Once enough verdicts exist, the classifier answers for papers it is
+    confident about and leaves the rest (and a small audit sample) to the check model.
+    Only the newest ``MAX_SAMPLES`` verdicts are kept. Training, including the first fit on
+    verdicts stored by earlier runs, runs on a background thread over a snapshot of them,
+    so checks are not held up while it runs.
+    """
+    def __init__(self, path, confidence=0.95):
+        self.path = path
+        self.confidence = confidence
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self.file_lines = 0
+        self.training = False
+        self.weights = None
+        self.bias = 0.0
+        self.untrained = 0
+        self.decided = 0
+        self.audited = 0
+        self.agreed = 0
+        self._load()
+        if self._ready():
+            # Stored verdicts are fitted in the background so the registry lock is not held meanwhile.
+            self.training = True
+            self._start_training(list(self.samples))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            # Only the newest lines are parsed; older verdicts would be dropped anyway.
+            lines = deque(f, maxlen=MAX_SAMPLES)
+            self.file_lines = len(lines)
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            indices, values = _strongest_features(record["indices"], record["values"])
+            self.samples.append((indices, values, int(record["verdict"])))
+        print(f"Loaded {len(self.samples)} check verdicts from {self.path}")
+        if self.file_lines >= MAX_SAMPLES:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the verdict file with only the kept verdicts."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            for indices, values, label in self.samples:
+                f.write(json.dumps({"indices": indices, "values": values, "verdict": label}) + "\n")
+        os.replace(tmp_path, self.path)
+        self.file_lines = len(self.samples)
+
+    def _ready(self):
+        positives = sum(label for _, _, label in self.samples)
+        negatives = len(self.samples) - positives
+        return len(self.samples) >= MIN_VERDICTS and min(positives, negatives) >= MIN_PER_CLASS
+
+    def _start_training(self, samples):
+        threading.Thread(target=self._train, args=(samples,), name="check-classifier-train", daemon=True).start()
+
+    def _train(self, samples):
+        # Runs without the lock; only the finished weights are swapped in under it.
+        try:
+            weights, bias = _fit(samples)
+            with self.lock:
+                self.weights, self.bias = weights, bias
+            print(f"Check classifier retrained on {len(samples)} verdicts.")
+        except Exception as err:
+            print(f"Check classifier retraining failed: {err}")
+        finally:
+            with self.lock:
+                self.training = False
+
+    def predict(self, indices, values):
+        """Return the probability that the check model would answer yes, or None if untrained."""
+        with self.lock:
+            if self.weights is None or not indices:
+                return None
+            margin = float(np.dot(self.weights[np.array(indices, dtype=np.int64)], np.array(values))) + self.bias
+        return 1.0 / (1.0 + np.exp(-margin))
+
+    def decide(self, paper_id, text):
+        """
+        Predict the check verdict for a paper.
+
+        Returns:
+        tuple: The verdict (True/False, or None to ask the check model), the features to pass
+            back to ``record`` with the model's verdict, and the classifier's own prediction
+            when a confident paper is audited (otherwise None).
+        """
+        features = hashed_features(text)
+        probability = self.predict(*features)
+        if probability is None:
+            return None, features, None
+        verdict = None
+        if probability >= self.confidence:
+            verdict = True
+        elif probability <= 1 - self.confidence:
+            verdict = False
+        if verdict is None:
+            print(f"Check classifier unsure about {paper_id} (p(yes)={probability:.3f}); asking the check model.")
+            return None, features, None
+        # Audit a stable subset of confident papers with the check model.
+        audit = int(hashlib.md5(paper_id.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF < AUDIT_RATE
+        if audit:
+            with self.lock:
+                self.audited += 1
+            print(f"Check classifier predicts {'yes' if verdict else 'no'} for {paper_id} (p(yes)={probability:.3f}); auditing with the check model.")
+            return None, features, verdict
+        with self.lock:
+            self.decided += 1
+        print(f"Check classifier answered {'yes' if verdict else 'no'} for {paper_id} (p(yes)={probability:.3f}); skipping the check model.")
+        return verdict, features, None
+
+    def record(self, features, verdict, predicted=None):
+        """Store a verdict of the check model and retrain once enough new verdicts have arrived."""
+        indices, values = features
+        if not indices:
+            return
+        label = 1 if verdict else 0
+        snapshot = None
+        with self.lock:
+            if predicted is not None:
+                self.agreed += int(predicted == bool(verdict))
+                print(f"Check classifier agreed with {self.agreed}/{self.audited} audited verdicts.")
+            self.samples.append((indices, values, label))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"indices": indices, "values": values, "verdict": label}) + "\n")
+            self.file_lines += 1
+            if self.file_lines >= MAX_SAMPLES + COMPACT_AFTER:
+                self._compact()
+            self.untrained += 1
+            retrain = self.untrained >= RETRAIN_EVERY or (self.weights is None and self._ready())
+            if retrain and not self.training and self._ready():
+                self.training = True
+                self.untrained = 0
+                snapshot = list(self.samples)
+        if snapshot is not None:
+            self._start_training(snapshot)
+
+    def summary(self):
+        """Return counts of stored verdicts, skipped check calls and audit agreement."""
+        with self.lock:
+            return {
+                "verdicts": len(self.samples),
+                "trained": self.weights is not None,
+                "checks_skipped": self.decided,
+                "audited": self.audited,
+                "audit_agreed": self.agreed,
+            }
+
+
+def get_check_classifier(job_settings):
+    """Return the CheckClassifier for the job's check model and check prompt, creating it on first use."""
+    key = hashlib.sha1(
+        f"{job_settings.check_model_name_version}\n{job_settings.check_prompt}".encode("utf-8")
+    ).hexdigest()[:16]
+    with _classifiers_lock:
+        classifier = _classifiers.get(key)
+        if classifier is None:
+            classifier = CheckClassifier(
+                os.path.join(DEFAULT_VERDICT_DIR, f"{key}.jsonl"),
+                job_settings.extract.check_classifier_confidence,
+            )
+            _classifiers[key] = classifier
+        return classifier
@@ -9,6 +9,7 @@ from src.utils import (
     generate_prompt,
     generate_check_prompt,
     truncate_text,
+    estimate_tokens,
     get_out_id,
     get_model_info,
     prepend_target_column,
@@ -17,8 +18,10 @@ from src.utils import (
     normalize_target_type,
     get_segmented_multimodal_images,
     generate_double_check_prompt,
+    schema_to_json_schema,
+    build_paper_digest,
 )
-from src.document_reader import doc_to_elements
+from src.document_reader import doc_to_elements, PDF_BACKENDS
 
 
 class ScrapeSettings():
@@ -63,14 +66,69 @@ class ExtractSettings():
         self.headers = None
         self.prompt = None
         self.examples = None
+        self.max_in_flight = 1
+        self.queue_size = None
+        self.pipeline_workers = None
+        self.keep_alive = "30m"
+        self.repair = True
+        self.structured_output = False
+        self.parallel_retries = 1
+        self.relevance_threshold = None
+        self.check_classifier = False
+        self.check_classifier_confidence = 0.95
+        self.check_mode = "full"
+        self.check_batch_size = 1
+        self.speculative_pass_rate = None
+        self.phase_window = 0
+        self.adaptive_concurrency = 0
+        self.json_schema = None
     def _parse_from_json(self,json):
         for key, val in json.items():
             if key.lower() == "max_retries":
                 self.max_retries = int(val)
             elif key.lower() == "ollama_url":
-                self.ollama_url = str(val)
+                self.ollama_url = [str(url) for url in val] if isinstance(val, list) else str(val)
             elif key.lower() == "user_instructions":
                 self.user_instructions = str(val)
+            elif key.lower() == "max_in_flight":
+                self.max_in_flight = max(1, int(val))
+            elif key.lower() == "queue_size":
+                self.queue_size = max(1, int(val))
+            elif key.lower() == "keep_alive":
+                self.keep_alive = val
+            elif key.lower() == "repair":
+                self.repair = bool(str(val).lower() == "y")
+            elif key.lower() == "structured_output":
+                self.structured_output = bool(str(val).lower() == "y")
+            elif key.lower() == "parallel_retries":
+                self.parallel_retries = max(1, int(val))
+            elif key.lower() == "relevance_threshold":
+                self.relevance_threshold = float(val)
+            elif key.lower() == "check_classifier":
+                self.check_classifier = bool(str(val).lower() == "y")
+            elif key.lower() == "check_classifier_confidence":
+                self.check_classifier_confidence = min(0.999, max(0.5, float(val)))
+            elif key.lower() == "check_batch_size":
+                self.check_batch_size = max(1, int(val))
+            elif key.lower() == "speculative_pass_rate":
+                self.speculative_pass_rate = None if val is None else min(1.0, max(0.0, float(val)))
+            elif key.lower() == "phase_window":
+                self.phase_window = max(0, int(val))
+            elif key.lower() == "adaptive_concurrency":
+                self.adaptive_concurrency = max(0, int(val))
+            elif key.lower() == "check_mode":
+                if str(val).lower() in {"full", "digest"}:
+                    self.check_mode = str(val).lower()
+                else:
+                    print(f"Check mode '{val}' not recognized; using '{self.check_mode}'. \n")
+            elif key.lower() == "pipeline":
+                # Worker count per pipeline stage, e.g. {"parse": 4, "extract": 2, "validate": 8}
+                self.pipeline_workers = {}
+                for stage, count in dict(val).items():
+                    if stage.lower() in {"parse", "check", "decimer", "extract", "validate"}:
+                        self.pipeline_workers[stage.lower()] = max(1, int(count))
+                    else:
+                        print(f"Pipeline stage '{stage}' not recognized. \n")
             else:
                 print(f"Extract setting '{key}' not recognized. \n")
 
@@ -106,7 +164,7 @@ class DoubleCheckSettings():
             if key.lower() == "max_retries":
                 self.max_retries = int(val)
             elif key.lower() == "ollama_url":
-                self.ollama_url = str(val)
+                self.ollama_url = [str(url) for url in val] if isinstance(val, list) else str(val)
             else:
                 print(f"Double-check setting '{key}' not recognized. \n")
 
@@ -122,6 +180,8 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
         self.run_double_check = False
         self.concurrent = False
         self.use_hi_res = False
+        self.pdf_backend = "pdfminer"
+        self.parse_workers = 1
         self.use_multimodal = False
         self.use_thinking = False
         self.use_decimer = False
@@ -144,7 +204,30 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
         self.api_key = None
         self.check_prompt = ""
         self.double_check_prompt = ""
+        self.extraction_queue = None
+        self.response_cache = False
+        self.response_cache_mb = 1024
+        self.response_cache_path = None
+        self.model_cascade = []
 
+    def _parse_model_tier(self, tier):
+        """
+        Turn a ``model_cascade`` entry into ``{"model": ..., "use_openai": ...}``.
+
+        Entries are either a model name, which uses the job's backend, or a dict
+        such as ``{"model": "gpt-4o-mini", "use_openai": "y"}``.
+        """
+        if isinstance(tier, dict):
+            model = str(tier.get("model", ""))
+            use_openai = str(tier.get("use_openai", "y" if self.use_openai else "n")).lower() == "y"
+        else:
+            model = str(tier)
+            use_openai = self.use_openai
+        if use_openai:
+            model = model.split(":", 1)[0]
+        elif ":" not in model:
+            model += ":latest"
+        return {"model": model, "use_openai": use_openai}
 
     def _update_model_name_version(self, model_name_version):
         """Set ``model_name_version`` respecting OpenAI naming."""
@@ -195,6 +278,13 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
                 self.concurrent = bool(val.lower() == "y")
             elif key.lower() == "use_hi_res":
                 self.use_hi_res = bool(val.lower() == "y")
+            elif key.lower() == "pdf_backend":
+                if str(val).lower() in PDF_BACKENDS:
+                    self.pdf_backend = str(val).lower()
+                else:
+                    print(f"PDF backend '{val}' not recognized; using '{self.pdf_backend}'. \n")
+            elif key.lower() == "parse_workers":
+                self.parse_workers = max(1, int(val))
             elif key.lower() == "use_multimodal":
                 self.use_multimodal = bool(val.lower() == "y")
             elif key.lower() == "use_thinking":
@@ -215,6 +305,16 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
                 self.api_key = str(val)
             elif key.lower() == "skip_check":
                 self.skip_check = bool(val.lower() == "y")
+            elif key.lower() == "model_cascade":
+                # Extraction models tried in order, e.g. ["gemma3:4b", "qwen:32b", {"model": "gpt-4o", "use_openai": "y"}]
+                tiers = val if isinstance(val, list) else str(val).split(",")
+                self.model_cascade = [self._parse_model_tier(tier) for tier in tiers if tier]
+            elif key.lower() == "response_cache":
+                self.response_cache = bool(val.lower() == "y")
+            elif key.lower() == "response_cache_mb":
+                self.response_cache_mb = max(1, int(val))
+            elif key.lower() == "response_cache_path":
+                self.response_cache_path = str(val)
             elif key.lower() == "target_type":
                 # Accept: small_molecule (default), protein, peptide, polymer, reaction, general.
                 self.target_type = normalize_target_type(val)
@@ -270,7 +370,10 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
             self.extract.user_instructions,
             self.extract.key_columns,
             self.target_type,
+            structured_output=self.extract.structured_output,
         )
+        if self.extract.structured_output:
+            self.extract.json_schema = schema_to_json_schema(self.extract.schema_data)
         self.extract.examples = generate_examples(
             self.extract.schema_data, target_type=self.target_type
         )
@@ -297,7 +400,7 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
             self.model_name = self.model_name_version
             self.check_model_name_version = self.check_model_name_version.split(":", 1)[0]
             self.check_model_name = self.check_model_name_version
-        if self.use_openai and self.api_key:
+        if self.api_key and (self.use_openai or any(tier["use_openai"] for tier in self.model_cascade)):
             os.environ["OPENAI_API_KEY"] = self.api_key
 
         # Special case: use all locally downloaded papers
@@ -311,13 +414,19 @@ class JobSettings(): ## Contains subsettings as well for each of the job types.
 
 
 class PromptData():
-    def __init__(self, model_name_version, check_model_name_version, use_openai=False, api_key=None, use_hi_res=False, use_multimodal=False, use_thinking=False, use_decimer_segmentation=False):
+    def __init__(self, model_name_version, check_model_name_version, use_openai=False, api_key=None, use_hi_res=False, use_multimodal=False, use_thinking=False, use_decimer_segmentation=False, keep_alive=None, json_schema=None, check_mode="full", check_keywords=None, ollama_url="http://localhost:11434", pdf_backend="pdfminer"):
         self.model = model_name_version
         self.check_model_name_version = check_model_name_version
         self.use_openai = use_openai  # Track if using OpenAI API
         self.stream = False
-        info = get_model_info(model_name_version, use_openai=use_openai, api_key=api_key)
+        info = get_model_info(model_name_version, ollama_url=ollama_url, use_openai=use_openai, api_key=api_key)
         ctx_len = info["context_length"]
+        # Check prompts are sized for the check model, which may have a smaller context.
+        self.check_ctx_len = ctx_len
+        if check_model_name_version and check_model_name_version != model_name_version:
+            self.check_ctx_len = get_model_info(
+                check_model_name_version, ollama_url=ollama_url, use_openai=use_openai, api_key=api_key
+            )["context_length"]
         self.supports_thinking = "thinking" in info["capabilities"]
         if use_openai:
             self.supports_vision = bool(use_multimodal)
@@ -341,8 +450,19 @@ class PromptData():
                         }
         self.prompt = ""
         self.paper_content = ""
+        # File name (under scraped_docs) of the loaded paper, so a larger-context tier can re-read it.
+        self.paper_file = None
+        self.paper_prefix = ""
+        self.check_paper_prefix = ""
+        self.base_prompt = ""
+        self.base_check_prompt = ""
         self.check_prompt = ""
+        self.keep_alive = keep_alive
+        self.json_schema = json_schema
+        self.check_mode = check_mode
+        self.check_keywords = check_keywords or []
         self.use_hi_res = use_hi_res
+        self.pdf_backend = pdf_backend
         self.use_multimodal = use_multimodal
         self.use_thinking = use_thinking
         self.use_decimer_segmentation = use_decimer_segmentation
@@ -351,6 +471,8 @@ class PromptData():
         self.si_images = []
         self.segment_images = []
         self.segment_notes = []
+        # PromptData objects for the extraction tiers of a model cascade, built on first use.
+        self.tier_data = {}
 
     def _load_images_from_dir(self, directory):
         imgs = []
@@ -378,9 +500,28 @@ class PromptData():
             print(f"Found {len(imgs)} images in {directory}")
         return imgs
 
-    def _refresh_paper_content(self, file, prompt, check_prompt, check_only=False):
+    def _content_budget(self, check=False):
+        """Number of tokens of paper text that fit in the extraction prompt, or with ``check`` the check prompt."""
+        ctx_len = self.check_ctx_len if check else self.options["num_ctx"]
+        return max(1024, int(ctx_len * 0.75))
+
+    def _parse_budget(self):
+        """
+        Token budget to stop parsing at, or None to parse whole documents.
+
+        Multimodal jobs need every figure of the paper, so only text-only jobs stop early.
+        """
+        return None if self.use_multimodal else self._content_budget()
+
+    def _refresh_paper_content(self, file, prompt, check_prompt, check_only=False, content=None):
+        """
+        Load a paper and build the prompts around it. Returns True if it could not be loaded.
+
+        ``content`` is text the caller already got from ``doc_to_elements`` with the same
+        flags (and images, for a multimodal load); the document is then not parsed again.
+        """
         file_path = os.path.join(os.getcwd(), 'scraped_docs', file)
-        content_budget = max(1024, int(self.options["num_ctx"] * 0.75))
+        content_budget = self._content_budget()
         
         """ Supposed to only go once, doesn't...
         if self.first_print:
@@ -392,13 +533,13 @@ class PromptData():
         # Load text first; skip image extraction when only checking
         multimodal = False if check_only else self.use_multimodal
         try:
-            self.paper_content = truncate_text(
-                doc_to_elements(file_path, self.use_hi_res, multimodal),
-                max_tokens=content_budget,
-            )
+            if content is None:
+                content = doc_to_elements(file_path, self.use_hi_res, multimodal, self.pdf_backend, self._parse_budget())
+            self.paper_content = truncate_text(content, max_tokens=content_budget)
         except Exception as err:
             print(f"Unable to process {file} into plaintext due to {err}")
             return True
+        self.paper_file = file
 
         if not check_only and self.use_multimodal and self.supports_vision:
             paper_id = os.path.splitext(os.path.basename(file))[0]
@@ -418,7 +559,7 @@ class PromptData():
             self.si_images = []
             for si_file in si_files:
                 try:
-                    doc_to_elements(si_file, self.use_hi_res, self.use_multimodal)
+                    doc_to_elements(si_file, self.use_hi_res, self.use_multimodal, self.pdf_backend)
                 except Exception as err:
                     print(f"Unable to process {si_file} for images due to {err}")
                     continue
@@ -438,6 +579,54 @@ class PromptData():
             self.si_images = []
             self.segment_images = []
             self.segment_notes = []
+        self.base_prompt = prompt
+        self.base_check_prompt = check_prompt
+        self._build_prompts(check_only=check_only)
+        return False
+
+    def _adopt_paper(self, other):
+        """
+        Take over the loaded paper, images and base prompts of another PromptData and rebuild the prompts.
+
+        ``other.paper_content`` was cut to the other model's budget, so when this model has a
+        larger budget the paper text is read again and cut to this budget instead.
+
+        Returns:
+        bool: True if the paper text was read again rather than copied from ``other``.
+        """
+        content_budget = self._content_budget()
+        content = other.paper_content
+        reloaded = False
+        if other.paper_file and content_budget > other._content_budget():
+            file_path = os.path.join(os.getcwd(), 'scraped_docs', other.paper_file)
+            try:
+                content = doc_to_elements(file_path, self.use_hi_res, False, self.pdf_backend, self._parse_budget())
+                reloaded = True
+            except Exception as err:
+                print(f"Unable to re-read {other.paper_file} for a larger context ({err}); using the shorter text.")
+        self.paper_content = truncate_text(content, max_tokens=content_budget, buffer=min(3500, content_budget // 4))
+        self.paper_file = other.paper_file
+        if self.use_multimodal and self.supports_vision:
+            self.images = list(other.images)
+            self.si_images = list(other.si_images)
+            self.segment_images = list(other.segment_images)
+            self.segment_notes = list(other.segment_notes)
+        self.base_prompt = other.base_prompt
+        self.base_check_prompt = other.base_check_prompt
+        self._build_prompts()
+        return reloaded
+
+    def _build_prompts(self, check_only=False):
+        """
+        Assemble the check and extraction prompts around the current ``paper_content``.
+
+        Both prompts (and the double-check prompts) start with the exact same
+        ``paper_prefix`` so that the model server can reuse the evaluated paper
+        tokens from one call to the next instead of processing the paper again.
+        Everything that varies between calls comes after the prefix.
+        """
+        content_budget = self._content_budget()
+        self.paper_prefix = f"Paper Contents:\n{self.paper_content}\n\n"
         segment_note_block = ""
         if self.segment_notes:
             max_segment_notes = 200
@@ -447,35 +636,49 @@ class PromptData():
                     f"... ({len(self.segment_notes) - max_segment_notes} additional segment notes omitted)"
                 )
             joined = "\n".join(f"- {note}" for note in notes)
-            segment_note_block = (
-                "\n\nSegment metadata for DECIMER sub-images (the sub-images are also included as multimodal inputs):\n"
-                f"{joined}"
+            segment_note_block = truncate_text(
+                "Segment metadata for DECIMER sub-images (the sub-images are also included as multimodal inputs):\n"
+                f"{joined}\n\n",
+                max_tokens=max(512, content_budget - estimate_tokens(self.paper_content)),
+                buffer=0,
             )
-        paper_with_segment_notes = truncate_text(
-            f"{self.paper_content}{segment_note_block}",
-            max_tokens=content_budget,
-        )
         note = ""
         if check_only and self.use_multimodal and self.supports_vision:
             note = (
-                "\nNote: you are not being shown images at this stage, but they "
+                "Note: you are not being shown images at this stage, but they "
                 "will be provided if extraction proceeds. Consider this when "
-                "deciding if relevant information is present."
+                "deciding if relevant information is present.\n\n"
             )
         self.prompt = (
-            f"Paper Contents:\n{paper_with_segment_notes}\n\n{prompt}\n\nAgain, please make sure to respond only in the specified format exactly as described, or you will cause errors.\nResponse:"
+            f"{self.paper_prefix}{segment_note_block}{self.base_prompt}\n\nAgain, please make sure to respond only in the specified format exactly as described, or you will cause errors.\nResponse:"
         )
+        # Prompts for the check model keep the same prefix unless the check model has a smaller context.
+        self.check_paper_prefix = self.paper_prefix
+        check_budget = self._content_budget(check=True)
+        if check_budget < content_budget:
+            check_content = truncate_text(self.paper_content, max_tokens=check_budget, buffer=min(3500, check_budget // 4))
+            self.check_paper_prefix = f"Paper Contents:\n{check_content}\n\n"
+        check_prefix = self.check_paper_prefix
+        if self.check_mode == "digest":
+            # The check only needs to spot relevance, so it sees a short digest instead of the paper.
+            digest = build_paper_digest(self.paper_content, self.check_keywords)
+            check_prefix = f"Paper Digest (title, abstract, headings, captions and key sentences):\n{digest}\n\n"
         self.check_prompt = (
-            f"Paper Contents:\n{self.paper_content}{note}\n\n{check_prompt}\n\nAgain, please only answer 'yes' or 'no' (without quotes) to let me know if we should extract information from this paper using the costly api call"
+            f"{check_prefix}{note}{self.base_check_prompt}\n\nAgain, please only answer 'yes' or 'no' (without quotes) to let me know if we should extract information from this paper using the costly api call"
         )
-        return False
-    
-    def _refresh_data(self, retry_count):
+
+    def _retry_options(self, retry_count):
+        """Return a copy of ``options`` with the sampling settings used for ``retry_count``, leaving ``options`` untouched."""
+        options = dict(self.options)
         if self.use_openai:
-            self.options["temperature"] = min(0.7 + 0.1 * retry_count, 1.0)
+            options["temperature"] = min(0.7 + 0.1 * retry_count, 1.0)
         else:
-            self.options["temperature"] = 0.35 * retry_count
-            self.options["repeat_penalty"] = 1.1 + 0.1 * retry_count
+            options["temperature"] = 0.35 * retry_count
+            options["repeat_penalty"] = 1.1 + 0.1 * retry_count
+        return options
+
+    def _refresh_data(self, retry_count):
+        self.options.update(self._retry_options(retry_count))
 
     def __dict__(self):
         data = {
@@ -485,12 +688,16 @@ class PromptData():
             "think": self.use_thinking and self.supports_thinking,
             "prompt": self.prompt,
         }
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+        if self.json_schema is not None:
+            data["format"] = self.json_schema
         if self.use_multimodal and self.supports_vision:
             data["images"] = self.images + self.si_images + self.segment_images
         return data
                 
     def __check__(self):
-        ctx_len = self.options.get("num_ctx", 32768)
+        ctx_len = self.check_ctx_len
         data = {
             "model": self.check_model_name_version,
             "stream": self.stream,
@@ -508,6 +715,8 @@ class PromptData():
             "think": False,
             "prompt": self.check_prompt,
         }
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
         if self.use_multimodal and self.supports_vision:
             data["images"] = self.images
         return data
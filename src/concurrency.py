@@ -0,0 +1,195 @@
+import time
+import threading
+from collections import deque
+import requests
+from src.utils import print, estimate_tokens  # Custom print function for logging
+
+# Seconds between log lines with the current limit and throughput.
+LOG_INTERVAL = 60
+# Latency is compared per token of work (prompt plus response), so long papers do not look
+# like overload. It is "rising" when the recent average exceeds the baseline by this factor.
+LATENCY_TOLERANCE = 1.5
+# Generated tokens are produced one forward pass at a time, so each costs about as much
+# time as this many prompt tokens.
+OUTPUT_TOKEN_WEIGHT = 20
+# Weight of the recent latency average.
+FAST_ALPHA = 0.3
+# The baseline follows this percentile of the last BASELINE_WINDOW latencies of the same kind
+# of request down at once, but only drifts up slowly, so sustained overload does not become
+# the new normal. No decisions are made on latency before BASELINE_WINDOW samples.
+BASELINE_PERCENTILE = 0.25
+BASELINE_WINDOW = 20
+BASELINE_DRIFT = 0.01
+# Multiplicative decrease on overload errors and on rising latency.
+ERROR_BACKOFF = 0.5
+LATENCY_BACKOFF = 0.8
+# HTTP status codes that mean the server is overloaded.
+OVERLOAD_STATUS = {429, 500, 503}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def is_overload_error(err):
+    """Return True if a failed request points at an overloaded or crashed server."""
+    if isinstance(err, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if "timeout" in type(err).__name__.lower():
+        return True
+    response = getattr(err, "response", None)
+    status = getattr(response, "status_code", None) or getattr(err, "status_code", None)
+    return status in OVERLOAD_STATUS
+
+
+def request_work(prompt, response):
+    """Return the size of a request in prompt-token equivalents, for comparing latencies."""
+    return estimate_tokens(str(prompt or "")) + OUTPUT_TOKEN_WEIGHT * estimate_tokens(str(response or ""))
+
+
+class LatencyStats():
+    """Recent latencies of one kind of request."""
+    def __init__(self):
+        self.fast = None
+        self.round_trip = 0.0
+        self.recent = deque(maxlen=BASELINE_WINDOW)
+        self.low = None
+
+    def add(self, elapsed, sample):
+        """Record a request that took ``elapsed`` seconds, ``sample`` per unit of work."""
+        self.fast = sample if self.fast is None else FAST_ALPHA * sample + (1 - FAST_ALPHA) * self.fast
+        self.round_trip = elapsed if not self.recent else FAST_ALPHA * elapsed + (1 - FAST_ALPHA) * self.round_trip
+        self.recent.append(sample)
+        if len(self.recent) < BASELINE_WINDOW:
+            return
+        candidate = sorted(self.recent)[int(BASELINE_PERCENTILE * (len(self.recent) - 1))]
+        if self.low is None or candidate < self.low:
+            self.low = candidate
+        else:
+            self.low += BASELINE_DRIFT * (candidate - self.low)
+
+    def baseline(self):
+        """Return the baseline latency per unit of work, or None while there are too few samples."""
+        return self.low
+
+
+class AdaptiveLimiter():
+    """
+    AIMD limit on the number of LLM requests in flight.
+
+    The limit grows by one after a full limit's worth of requests complete with stable
+    latency, is cut by ``LATENCY_BACKOFF`` when latency rises and by ``ERROR_BACKOFF`` on
+    overload errors (HTTP 429/500/503, timeouts, refused connections). Latency is divided
+    by the work of the request (see ``request_work``) and compared with a baseline that
+    follows a low percentile of recent requests of the same model and output length down
+    at once and up only slowly. Check and extraction requests are compared with their own
+    kind, and short and long papers with each other. At most one
+    decrease is applied per round of in-flight requests.
+    """
+    def __init__(self, max_limit, name=""):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.limit = 1.0
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.latency = {}
+        self.last_decrease = 0.0
+        self.window_start = time.monotonic()
+        self.window_completed = 0
+        self.window_errors = 0
+        self.window_latency = 0.0
+
+    def acquire(self):
+        """Wait for a free slot and return the start time to pass to ``release``."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, kind=None, error=None, work=None):
+        """
+        Free a slot and adjust the limit from the request's latency or error.
+
+        ``work`` is the size of the request (see ``request_work``); latency is compared per
+        unit of work when it is given.
+        """
+        elapsed = time.monotonic() - started
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if error is not None and is_overload_error(error):
+                self.window_errors += 1
+                self._decrease(now, ERROR_BACKOFF, f"{type(error).__name__}")
+            elif error is None:
+                self.window_completed += 1
+                self.window_latency += elapsed
+                stats = self.latency.setdefault(kind, LatencyStats())
+                stats.add(elapsed, elapsed / max(1, work) if work else elapsed)
+                baseline = stats.baseline()
+                if baseline is not None and stats.fast > baseline * LATENCY_TOLERANCE:
+                    self._decrease(now, LATENCY_BACKOFF, f"latency {stats.fast / baseline:.1f}x the recent baseline")
+                elif self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            if now - self.window_start >= LOG_INTERVAL:
+                self._log(now)
+            self.condition.notify_all()
+
+    def _decrease(self, now, factor, reason):
+        # Requests sent before the last decrease still reflect the old limit, so only
+        # back off once per round trip.
+        if now - self.last_decrease < self._round_trip():
+            return
+        self.last_decrease = now
+        old_limit = int(self.limit)
+        self.limit = max(1.0, self.limit * factor)
+        if int(self.limit) != old_limit:
+            print(f"Lowering {self.name} concurrency from {old_limit} to {int(self.limit)} ({reason}).")
+
+    def _round_trip(self):
+        if not self.latency:
+            return 0.0
+        return max(stats.round_trip for stats in self.latency.values())
+
+    def _log(self, now):
+        minutes = (now - self.window_start) / 60
+        completed = self.window_completed
+        avg_latency = self.window_latency / completed if completed else 0.0
+        print(
+            f"{self.name} concurrency {int(self.limit)} (max {self.max_limit}): "
+            f"{completed / minutes:.1f} requests/min, average latency {avg_latency:.1f}s, "
+            f"{self.window_errors} overload errors."
+        )
+        self.window_start = now
+        self.window_completed = 0
+        self.window_errors = 0
+        self.window_latency = 0.0
+
+    def summary(self):
+        """Return the current limit, its upper bound and the requests in flight."""
+        with self.condition:
+            return {
+                "limit": int(self.limit),
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+            }
+
+
+def get_concurrency_limiter(job_settings, backend):
+    """
+    Return the AdaptiveLimiter for a backend ("openai" or an Ollama URL setting), or None.
+
+    Only active when ``extract.adaptive_concurrency`` is set; its value is the upper bound on
+    requests in flight.
+    """
+    max_limit = job_settings.extract.adaptive_concurrency
+    if not max_limit:
+        return None
+    key = (str(backend), max_limit)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            name = "OpenAI" if backend == "openai" else "Ollama"
+            limiter = AdaptiveLimiter(max_limit, name)
+            _limiters[key] = limiter
+            print(f"Adapting {name} concurrency between 1 and {max_limit} requests.")
+        return limiter
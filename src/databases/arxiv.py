@@ -2,8 +2,8 @@ import os
 import requests
 import time
 from bs4 import BeautifulSoup
-from src.extract import extract
-from src.utils import (doi_to_filename, is_file_processed, write_to_csv, begin_ollama_server)
+from src.extract import submit_for_extraction
+from src.utils import (doi_to_filename, is_file_processed)
 from src.classes import JobSettings
 
 
@@ -99,35 +99,8 @@ def arxiv_search(job_settings: JobSettings, search_terms, repository):
                     if os.path.exists(file_path):
                         print(f"{filename} already downloaded.")
                         if job_settings.concurrent and not is_file_processed(job_settings.files.csv, filename):
-                            print(f"{filename} not extracted for this task; performing extraction...")
-                            restart_tries = 0
-                            while restart_tries < 2:
-                                try:
-                                    extracted_data = extract(file_path, job_settings)
-                                    if extracted_data:
-                                        print(f"Successfully extracted data from {filename}")
-                                        restart_tries = 2
-                                        break
-                                    else:
-                                        print(f"Failed to extract data from {filename}")
-                                        failed_result = [["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                            os.path.splitext(os.path.basename(file_path))[0]]]
-                                        write_to_csv(failed_result, job_settings.extract.headers,
-                                                     filename=job_settings.files.csv)
-                                        restart_tries = 2
-                                        break
-                                except Exception as e:
-                                    if '500' in str(e):
-                                        restart_tries += 1
-                                        
-                                        print("Ollama either crashed, or the model you are trying to use is too large, trying to restart...")
-                                        
-                                        # Start ollama server
-                                        begin_ollama_server()
-                                        
-                                    else:
-                                        print(f"Error extracting data from {filename}: {e}")
-                                        break
+                            print(f"{filename} not extracted for this task; queueing extraction...")
+                            submit_for_extraction(job_settings, file_path)
                         continue
 
                     retry_count = 0
@@ -164,35 +137,7 @@ def arxiv_search(job_settings: JobSettings, search_terms, repository):
                                             print(f"Failed to download SI {supp_url}: {e}")
 
                                 if job_settings.concurrent:
-                                    concurrent_tries = 0
-                                    while concurrent_tries < 2:
-                                        try:
-                                            extracted_data = extract(file_path, job_settings)
-                                            if extracted_data:
-                                                print(f"Successfully extracted data from {filename}")
-                                                concurrent_tries = 2
-                                                break
-                                            else:
-                                                print(f"Failed to extract data from {filename}")
-                                                failed_result = [
-                                                    ["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                                        os.path.splitext(os.path.basename(file_path))[0]]]
-                                                write_to_csv(failed_result, job_settings.extract.headers,
-                                                             filename=job_settings.files.csv)
-                                                concurrent_tries = 2
-                                                break
-                                        except Exception as e:
-                                            if '500' in str(e):
-                                                print("Ollama either crashed, or the model you are trying to use is too large, trying to restart...")
-                                                
-                                                # Start ollama server
-                                                begin_ollama_server()
-                                                
-                                                concurrent_tries += 1
-                                                
-                                            else:
-                                                print(f"Error extracting data from {filename}: {e}")
-                                                break
+                                    submit_for_extraction(job_settings, file_path)
                                 break
                             else:
                                 print(f"No PDF link found for {filename}. Skipping.")
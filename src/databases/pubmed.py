@@ -4,12 +4,8 @@ import time
 import xml.etree.ElementTree as ET
 
 from src.classes import JobSettings
-from src.extract import extract
-from src.utils import (
-    is_file_processed,
-    write_to_csv,
-    begin_ollama_server,
-)
+from src.extract import submit_for_extraction
+from src.utils import is_file_processed
 
 def download_pubmed_si(pmcid, root):
     """Download supplementary files for a given PubMed Central article."""
@@ -137,68 +133,15 @@ def pubmed_search(job_settings: JobSettings, search_terms): # concurrent=False,
                         scraped_files.extend(si_files)
 
                     if job_settings.concurrent:
-                        concurrent_tries = 0
-                        while concurrent_tries < 2:
-                            try:
-                                extracted_data = extract(file_path, job_settings)
-                                if extracted_data:
-                                    print(f"Successfully extracted data from {filename}")
-                                    concurrent_tries = 2
-                                    break
-                                else:
-                                    print(f"Failed to extract data from {filename}")
-                                    failed_result = [["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                        os.path.splitext(os.path.basename(file_path))[0]]]
-                                    write_to_csv(failed_result, job_settings.extract.headers,
-                                                 filename=job_settings.files.csv)
-                                    concurrent_tries = 2
-                                    break
-                            except Exception as e:
-                                if '500' in str(e):
-                                    print("Ollama either crashed, or the model you are trying to use is too large, trying to restart...")
-                                    
-                                    # Start ollama server
-                                    begin_ollama_server()
-                                    
-                                    concurrent_tries += 1
-                                    
-                                else:
-                                    print(f"Error extracting data from {filename}: {e}")
-                                    break
+                        submit_for_extraction(job_settings, file_path)
                 else:
                     print(f"Full text not available for UID {uid}. Skipping.")
 
                 time.sleep(1 / 2)
 
             elif (not is_file_processed(job_settings.files.csv, filename)) and job_settings.concurrent:
-                print(f"{filename} already downloaded, but not extracted from for this task; performing extraction...")
-                restart_tries = 0
-                while restart_tries < 2:
-                    try:
-                        extracted_data = extract(file_path, job_settings)
-                        if extracted_data:
-                            print(f"Successfully extracted data from {filename}")
-                            restart_tries = 2
-                            break
-                        else:
-                            print(f"Failed to extract data from {filename}")
-                            failed_result = [["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                os.path.splitext(os.path.basename(file_path))[0]]]
-                            write_to_csv(failed_result, job_settings.extract.headers, filename=job_settings.files.csv)
-                            restart_tries = 2
-                            break
-                    except Exception as e:
-                        if '500' in str(e):
-                            restart_tries += 1
-                            
-                            print("Ollama either crashed, or the model you are trying to use is too large, trying to restart...")
-                            
-                            # Start ollama server
-                            begin_ollama_server()
-                            
-                        else:
-                            print(f"Error extracting data from {filename}: {e}")
-                            break
+                print(f"{filename} already downloaded, but not extracted from for this task; queueing extraction...")
+                submit_for_extraction(job_settings, file_path)
 
         return scraped_files
     else:
@@ -11,8 +11,8 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from src.extract import extract
-from src.utils import (get_chrome_driver, is_file_processed, write_to_csv)
+from src.extract import submit_for_extraction
+from src.utils import (get_chrome_driver, is_file_processed)
 from src.classes import JobSettings
 
 def scrape_scienceopen(job_settings:JobSettings, search_terms):  # retmax, concurrent=False, schema_file=None, user_instructions=None, model_name_version=None
@@ -151,19 +151,8 @@ def scrape_scienceopen(job_settings:JobSettings, search_terms):  # retmax, concu
                 if os.path.exists(file_path):
                     print(f"{filename} already exists.")
                     if job_settings.concurrent and not is_file_processed(job_settings.files.csv, filename):
-                        print(f"{filename} not extracted for this task; performing extraction...")
-                        try:
-                            extracted_data = extract(file_path, job_settings)
-                            if extracted_data:
-                                print(f"Successfully extracted data from {filename}")
-                            else:
-                                print(f"Failed to extract data from {filename}")
-                                failed_result = [["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                    os.path.splitext(os.path.basename(file_path))[0]]]
-                                write_to_csv(failed_result, job_settings.extract.headers,
-                                             filename=job_settings.files.csv)
-                        except Exception as e:
-                            print(f"Error extracting data from {filename}: {e}")
+                        print(f"{filename} not extracted for this task; queueing extraction...")
+                        submit_for_extraction(job_settings, file_path)
                     continue
 
                 try:
@@ -185,18 +174,7 @@ def scrape_scienceopen(job_settings:JobSettings, search_terms):  # retmax, concu
                         file.write(f"{link}\n")
 
                     if job_settings.concurrent:
-                        try:
-                            extracted_data = extract(file_path, job_settings)
-                            if extracted_data:
-                                print(f"Successfully extracted data from {filename}")
-                            else:
-                                print(f"Failed to extract data from {filename}")
-                                failed_result = [["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                    os.path.splitext(os.path.basename(file_path))[0]]]
-                                write_to_csv(failed_result, job_settings.extract.headers,
-                                             filename=job_settings.files.csv)
-                        except Exception as e:
-                            print(f"Error extracting data from {filename}: {e}")
+                        submit_for_extraction(job_settings, file_path)
 
                 except Exception as e:
                     print(f"Error occurred while downloading PDF for article: {link}")
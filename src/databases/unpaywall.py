@@ -3,8 +3,8 @@ import requests
 import time
 import json
 from datetime import datetime
-from src.extract import extract
-from src.utils import (doi_to_filename, is_file_processed, write_to_csv)
+from src.extract import submit_for_extraction
+from src.utils import (doi_to_filename, is_file_processed)
 from src.classes import JobSettings
 
 def read_api_count():
@@ -186,19 +186,8 @@ def unpaywall_search(job_settings:JobSettings): #, query_chunks, retmax, email,
                 if any([os.path.exists(pdf_path),os.path.exists(json_path)]):
                     print(f"Files for DOI {doi} already exist.")
                     if job_settings.concurrent and not is_file_processed(job_settings.files.csv, pdf_filename):
-                        print(f"{pdf_filename} not extracted for this task; performing extraction...")
-                        try:
-                            extracted_data = extract(pdf_path, job_settings)
-                            if extracted_data:
-                                print(f"Successfully extracted data from {pdf_filename}")
-                            else:
-                                print(f"Failed to extract data from {pdf_filename}")
-                                failed_result = [["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                    os.path.splitext(os.path.basename(pdf_path))[0]]]
-                                write_to_csv(failed_result, job_settings.extract.headers,
-                                             filename=job_settings.files.csv)
-                        except Exception as e:
-                            print(f"Error extracting data from {pdf_filename}: {e}")
+                        print(f"{pdf_filename} not extracted for this task; queueing extraction...")
+                        submit_for_extraction(job_settings, pdf_path)
                     continue
 
                 print(f"Now fetching data for DOI {doi}...")
@@ -233,19 +222,7 @@ def unpaywall_search(job_settings:JobSettings): #, query_chunks, retmax, email,
                             total_downloaded += 1
 
                             if job_settings.concurrent:
-                                try:
-                                    extracted_data = extract(pdf_path, job_settings)
-                                    if extracted_data:
-                                        print(f"Successfully extracted data from {pdf_filename}")
-                                    else:
-                                        print(f"Failed to extract data from {pdf_filename}")
-                                        failed_result = [
-                                            ["failed" for _ in range(job_settings.extract.num_columns)] + [
-                                                os.path.splitext(os.path.basename(pdf_path))[0]]]
-                                        write_to_csv(failed_result, job_settings.extract.headers,
-                                                     filename=job_settings.files.csv)
-                                except Exception as e:
-                                    print(f"Error extracting data from {pdf_filename}: {e}")
+                                submit_for_extraction(job_settings, pdf_path)
 
                 # Save metadata as JSON
                 doi_data_str = json.dumps(doi_data, indent=4)
@@ -1,11 +1,12 @@
-# Import necessary libraries and modules
+# Import necessary libraries and modules
 from unstructured.staging.base import convert_to_dict
 from unstructured.partition.auto import partition
 import logging
 import os
 import subprocess
-from src.utils import xml_to_string, elements_to_string
+from src.utils import jats_to_text, elements_to_string, estimate_tokens
 from src.utils import print  # Custom print function for logging
+from src.text_cleanup import BoilerplateFilter, clean_pages, is_section_heading, remove_running_lines, repeated_edge_blocks
 
 from xml.etree import ElementTree as ET
 import requests
@@ -13,13 +14,169 @@ import tarfile
 import io
 import re
 from html import unescape
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import builtins
+import hashlib
+import json
+import threading
 from PIL import Image
+import pdfminer
+from pdfminer.high_level import extract_pages
+from pdfminer.image import ImageWriter
+from pdfminer.layout import LAParams, LTTextContainer, LTImage, LTFigure
 
 # Configure logging to minimize output from the 'unstructured' library
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.CRITICAL)
 
 
+PROCESSED_DOCS_DIR = os.path.join(os.getcwd(), 'processed_docs')
+# Parsed text is stored under the hash of the document and the extractor settings.
+TEXT_CACHE_DIR = os.path.join(PROCESSED_DOCS_DIR, 'text')
+# Append-only record of which file (path, size, mtime) maps to which cache key.
+MANIFEST_PATH = os.path.join(PROCESSED_DOCS_DIR, 'manifest.jsonl')
+# Bump the version of an extractor whenever a change to it alters its output, so old
+# cache entries are no longer used.
+EXTRACTOR_VERSIONS = {
+    "pdfminer": f"4-{pdfminer.__version__}",
+    "pdf2txt": "3",
+    "xml": "3",
+    "unstructured": "3",
+}
+
+_manifest = {}
+_manifest_offset = 0
+_manifest_lock = threading.Lock()
+
+# Images with a side shorter than this (in pixels) are logos, icons and rules, not figures.
+MIN_IMAGE_SIDE = 150
+# Ways of turning a PDF into text: pdfminer in this process, or the pdf2txt.py command.
+PDF_BACKENDS = ("pdfminer", "pdf2txt")
+
+
+def _filter_images(output_dir):
+    """Delete images in ``output_dir`` that cannot be read or are smaller than MIN_IMAGE_SIDE."""
+    for fname in os.listdir(output_dir):
+        fpath = os.path.join(output_dir, fname)
+        if not os.path.isfile(fpath) or fname.endswith(".html"):
+            continue
+        try:
+            with Image.open(fpath) as im:
+                w, h = im.size
+        except Exception as err:
+            print(f"Failed to read {fpath}: {err}; deleting")
+            os.remove(fpath)
+            continue
+        if min(w, h) < MIN_IMAGE_SIDE:
+            print(f"Deleting {fname}: {w}x{h} < {MIN_IMAGE_SIDE}px threshold")
+            os.remove(fpath)
+
+
+def iter_pdfminer_pages(pdf_path, output_dir):
+    """
+    Yield the text blocks of each page of a PDF as pdfminer lays them out.
+
+    Figures become ``[image name]`` blocks; their images are only written to ``output_dir``
+    if they are at least MIN_IMAGE_SIDE pixels on both sides. Parsing stops when the
+    caller stops iterating, so later pages are never laid out.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    image_writer = ImageWriter(output_dir)
+
+    def walk(item, blocks):
+        if isinstance(item, LTTextContainer):
+            blocks.append(item.get_text())
+        elif isinstance(item, LTImage):
+            width, height = getattr(item, "srcsize", (None, None))
+            if width is not None and height is not None and min(width, height) < MIN_IMAGE_SIDE:
+                return
+            try:
+                blocks.append(f" [{image_writer.export_image(item)}] ")
+            except Exception as err:
+                print(f"Failed to export image {item.name} from {pdf_path}: {err}")
+        elif isinstance(item, LTFigure):
+            for child in item:
+                walk(child, blocks)
+
+    for page in extract_pages(pdf_path, laparams=LAParams()):
+        blocks = []
+        for item in page:
+            walk(item, blocks)
+        yield blocks
+
+
+def pdfminer_extract(pdf_path, output_dir, max_tokens=None, buffer=3500):
+    """
+    Extract the text of a PDF with pdfminer in this process, keeping references to its figures.
+
+    Produces the same output as ``pdf2txt_extract`` (text with ``[image name]`` markers where
+    figures are, whitespace collapsed) without writing and re-reading an HTML file. The
+    reference list, back matter, running headers/footers, page numbers and licence notices
+    are stripped (see ``src.text_cleanup``).
+
+    With ``max_tokens`` set, pages are parsed only until the remaining text reaches that many
+    estimated tokens. If the text ends up over ``max_tokens - buffer``, it is cut back to the
+    last section heading within that limit, when there is one in its second half, so the
+    text does not stop mid-section.
+
+    Running lines are removed before the boilerplate filter sees the pages, as in
+    ``clean_pages``, so a journal header on a reference page does not end the reference
+    list. While streaming, the budget is counted with a provisional filter that skips
+    blocks already seen at a page edge.
+
+    Returns:
+    str or tuple: The text, or with ``max_tokens`` set, the text and whether the whole
+        document was read.
+    """
+    pages = []
+    complete = True
+    try:
+        if max_tokens is None:
+            pages = list(iter_pdfminer_pages(pdf_path, output_dir))
+        else:
+            provisional = BoilerplateFilter()
+            seen_edges = set()
+            tokens = 0
+            for blocks in iter_pdfminer_pages(pdf_path, output_dir):
+                pages.append(blocks)
+                repeated = repeated_edge_blocks(blocks, seen_edges)
+                for idx, block in enumerate(blocks):
+                    if idx not in repeated and provisional.keep(block):
+                        tokens += estimate_tokens(block)
+                if tokens >= max_tokens:
+                    complete = False
+                    break
+    except Exception as err:
+        print(f"Error extracting text from {pdf_path} with pdfminer: {err}")
+        return ("", True) if max_tokens is not None else ""
+
+    _filter_images(output_dir)
+    block_filter = BoilerplateFilter()
+    pages = remove_running_lines(pages, block_filter.removed)
+    pages = [[block for block in blocks if block_filter.keep(block)] for blocks in pages]
+    if max_tokens is not None:
+        limit = max_tokens - buffer
+        boundaries = []
+        tokens = 0
+        for page_idx, blocks in enumerate(pages):
+            for idx, block in enumerate(blocks):
+                if is_section_heading(block):
+                    boundaries.append((page_idx, idx, tokens))
+                tokens += estimate_tokens(block)
+        fitting = [(page, block) for page, block, at_tokens in boundaries if limit // 2 <= at_tokens <= limit]
+        if tokens > limit and fitting:
+            page, block = fitting[-1]
+            pages = pages[:page] + [pages[page][:block]]
+    if block_filter.removed:
+        print(f"Removed boilerplate from {os.path.basename(pdf_path)}: {dict(block_filter.removed)}")
+    text = re.sub(r"\s+", " ", "".join(block for page in pages for block in page)).strip()
+    if max_tokens is None:
+        return text
+    if not complete:
+        print(f"Stopped parsing {os.path.basename(pdf_path)} once it reached the {max_tokens} token budget.")
+    return text, complete
+
+
 def pdf2txt_extract(pdf_path, output_dir):
     """Run pdf2txt.py in HTML mode, returning text and filtering out small images."""
     os.makedirs(output_dir, exist_ok=True)
@@ -54,20 +211,7 @@ def pdf2txt_extract(pdf_path, output_dir):
         return ""
 
     # Filter images by size
-    for fname in os.listdir(output_dir):
-        fpath = os.path.join(output_dir, fname)
-        if not os.path.isfile(fpath) or fname.endswith(".html"):
-            continue
-        try:
-            with Image.open(fpath) as im:
-                w, h = im.size
-        except Exception as err:
-            print(f"Failed to read {fpath}: {err}; deleting")
-            os.remove(fpath)
-            continue
-        if min(w, h) < 150:
-            print(f"Deleting {fname}: {w}x{h} < 150px threshold")
-            os.remove(fpath)
+    _filter_images(output_dir)
 
     text_content = ""
     if os.path.exists(html_file):
@@ -75,90 +219,101 @@ def pdf2txt_extract(pdf_path, output_dir):
             html_data = hf.read()
         # Replace image tags with file names
         html_data = re.sub(r'<img[^>]*src="([^">]+)"[^>]*>', r' [\1] ', html_data)
-        html_data = re.sub(r"<[^>]+>", " ", html_data)
-        text_content = unescape(re.sub(r"\s+", " ", html_data)).strip()
+        # Split into pages (at the page anchors) and text boxes, so boilerplate can be stripped
+        pages = []
+        for page_html in re.split(r'<a name="\d+">', html_data):
+            blocks = []
+            for box in re.split(r"</div>", page_html):
+                block = unescape(re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", box))).strip()
+                if block:
+                    blocks.append(block + " ")
+            pages.append(blocks)
+        blocks, removed = clean_pages(pages)
+        if removed:
+            print(f"Removed boilerplate from {os.path.basename(pdf_path)}: {dict(removed)}")
+        text_content = re.sub(r"\s+", " ", "".join(blocks)).strip()
         os.remove(html_file)
 
     return text_content
-
-
+
+
 def extract_images_from_pubmed_xml(xml_string, output_dir):
     """Download images for a PubMed Central article using the OA package.
 
     Returns the number of images downloaded.
     """
     os.makedirs(output_dir, exist_ok=True)
-
-    try:
-        root = ET.fromstring(xml_string)
-    except Exception as err:
-        print(f"Unable to parse XML for image extraction: {err}")
+
+    try:
+        root = ET.fromstring(xml_string)
+    except Exception as err:
+        print(f"Unable to parse XML for image extraction: {err}")
         return 0
-
-    pmcid_elem = root.find(".//article-id[@pub-id-type='pmcid']")
-    if pmcid_elem is None or not pmcid_elem.text:
-        print("PMCID not found in XML; cannot download images")
+
+    pmcid_elem = root.find(".//article-id[@pub-id-type='pmcid']")
+    if pmcid_elem is None or not pmcid_elem.text:
+        print("PMCID not found in XML; cannot download images")
         return 0
-
-    pmcid = pmcid_elem.text.strip()
-    oa_url = f"https://www.ncbi.nlm.nih.gov/pmc/utils/oa/oa.fcgi?id={pmcid}"
-    try:
-        response = requests.get(oa_url)
-        response.raise_for_status()
-        oa_root = ET.fromstring(response.text)
-    except Exception as err:
-        print(f"Failed to fetch OA package link for {pmcid}: {err}")
+
+    pmcid = pmcid_elem.text.strip()
+    oa_url = f"https://www.ncbi.nlm.nih.gov/pmc/utils/oa/oa.fcgi?id={pmcid}"
+    try:
+        response = requests.get(oa_url)
+        response.raise_for_status()
+        oa_root = ET.fromstring(response.text)
+    except Exception as err:
+        print(f"Failed to fetch OA package link for {pmcid}: {err}")
         return 0
-
-    link_elem = oa_root.find(".//record/link[@format='tgz']")
-    if link_elem is None:
-        link_elem = oa_root.find(".//record/link[@format='tar.gz']")
-    if link_elem is None or not link_elem.attrib.get("href"):
-        print(f"No OA package available for {pmcid}")
+
+    link_elem = oa_root.find(".//record/link[@format='tgz']")
+    if link_elem is None:
+        link_elem = oa_root.find(".//record/link[@format='tar.gz']")
+    if link_elem is None or not link_elem.attrib.get("href"):
+        print(f"No OA package available for {pmcid}")
         return 0
-
-    tar_url = link_elem.attrib["href"].replace("ftp://", "https://")
-    try:
-        tar_resp = requests.get(tar_url)
-        tar_resp.raise_for_status()
-    except Exception as err:
-        print(f"Failed to download OA package for {pmcid}: {err}")
+
+    tar_url = link_elem.attrib["href"].replace("ftp://", "https://")
+    try:
+        tar_resp = requests.get(tar_url)
+        tar_resp.raise_for_status()
+    except Exception as err:
+        print(f"Failed to download OA package for {pmcid}: {err}")
         return 0
-
+
     img_count = 0
     try:
         with tarfile.open(fileobj=io.BytesIO(tar_resp.content), mode="r:gz") as tar:
             for member in tar.getmembers():
                 if not member.isfile():
                     continue
-                if not re.search(r"\.(jpg|jpeg|png|gif|tif|tiff)$",
-                                 member.name, re.IGNORECASE):
-                    continue
-
-                extracted = tar.extractfile(member)
-                if extracted is None:
-                    continue
-
-                # ── read the raw bytes once ───────────────────────────────────────────
-                img_bytes = extracted.read()
-
-                # ── probe the image size in memory (no temp file needed) ─────────────
-                try:
-                    with Image.open(io.BytesIO(img_bytes)) as im:
-                        w, h = im.size
-                except Exception as err:
-                    print(f"Skipped {member.name}: could not read image ({err})")
-                    continue
-
-                # ── keep only “real” figures ─────────────────────────────────────────
-                if min(w, h) < 150:
-                    # optionally: also check area, dpi, or aspect ratio here
-                    # e.g. if w * h < 40_000:  continue
-                    print(f"Skipped {member.name}: {w}×{h} < 150 px threshold")
-                    continue
-
-                # ── write out the image; naming is unchanged ─────────────────────────
-                out_path = os.path.join(output_dir, os.path.basename(member.name))
+                if not re.search(r"\.(jpg|jpeg|png|gif|tif|tiff)$",
+                                 member.name, re.IGNORECASE):
+                    continue
+
+                extracted = tar.extractfile(member)
+                if extracted is None:
+                    continue
+
+                # ── read the raw bytes once ───────────────────────────────────────────
+                img_bytes = extracted.read()
+
+                # ── probe the image size in memory (no temp file needed) ─────────────
+                try:
+                    with Image.open(io.BytesIO(img_bytes)) as im:
+                        w, h = im.size
+                except Exception as err:
+                    print(f"Skipped {member.name}: could not read image ({err})")
+                    continue
+
+                # ── keep only “real” figures ─────────────────────────────────────────
+                if min(w, h) < 150:
+                    # optionally: also check area, dpi, or aspect ratio here
+                    # e.g. if w * h < 40_000:  continue
+                    print(f"Skipped {member.name}: {w}×{h} < 150 px threshold")
+                    continue
+
+                # ── write out the image; naming is unchanged ─────────────────────────
+                out_path = os.path.join(output_dir, os.path.basename(member.name))
                 with open(out_path, "wb") as f:
                     f.write(img_bytes)
                 img_count += 1
@@ -171,37 +326,127 @@ def extract_images_from_pubmed_xml(xml_string, output_dir):
     else:
         print(f"Extracted {img_count} images from OA package for {pmcid}")
     return img_count
-
-
-def doc_to_elements(file, use_hi_res=False, use_multimodal=False):
-    """
-    Convert a document file to a structured text format.
-
-    Args:
-    file (str): Path to the input file.
-    use_hi_res (bool): Flag to use high-resolution processing for PDFs.
-
-    Returns:
-    str: Formatted text content of the document.
-    """
-    # Create a directory for processed documents if it doesn't exist
-    processed_docs_dir = os.path.join(os.getcwd(), 'processed_docs')
-    os.makedirs(processed_docs_dir, exist_ok=True)
-
-    # Generate the path for the processed file
-    processed_file = os.path.splitext(os.path.basename(file))[0] + '.txt'
-    processed_file_path = os.path.join(processed_docs_dir, processed_file)
-
-    # Base name used for image directory
-    paper_id = os.path.splitext(os.path.basename(file))[0]
-    images_dir = os.path.join(os.getcwd(), 'images', paper_id)
-
-    # If the file has already been processed, load its content
-    formatted_output = None
-    if os.path.exists(processed_file_path):
-        with open(processed_file_path, 'r') as f:
-            formatted_output = f.read()
-
+
+
+def _extractor_config(file, use_hi_res=False, pdf_backend="pdfminer"):
+    """Return the extractor used for ``file`` with its version and the options that change its text."""
+    if file.endswith('.pdf'):
+        extractor = "pdf2txt" if pdf_backend == "pdf2txt" else "pdfminer"
+    elif file.endswith('.xml'):
+        extractor = "xml"
+    else:
+        extractor = "unstructured"
+    return f"{extractor}:{EXTRACTOR_VERSIONS[extractor]}:hi_res={bool(use_hi_res)}"
+
+
+def _read_manifest():
+    """Read manifest lines appended since the last call (possibly by other processes)."""
+    global _manifest_offset
+    if not os.path.exists(MANIFEST_PATH):
+        return
+    with open(MANIFEST_PATH, "r") as f:
+        f.seek(_manifest_offset)
+        for line in f:
+            if not line.endswith("\n"):
+                # A line still being written by another process.
+                break
+            _manifest_offset += len(line.encode("utf-8"))
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            _manifest[(record["path"], record["config"])] = record
+
+
+def _manifest_key(path, config, stat):
+    """Return the cache key the manifest has for an unchanged file, or None."""
+    with _manifest_lock:
+        _read_manifest()
+        record = _manifest.get((path, config))
+    if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+        return record["key"]
+    return None
+
+
+def document_cache_key(file, use_hi_res=False, pdf_backend="pdfminer"):
+    """
+    Return the processed_docs cache key for a document.
+
+    The key is a hash of the file contents and the extractor settings (see
+    ``_extractor_config``). Files whose size and modification time match the manifest
+    reuse the recorded key; other files are hashed and recorded.
+    """
+    path = os.path.abspath(file)
+    config = _extractor_config(file, use_hi_res, pdf_backend)
+    stat = os.stat(path)
+    key = _manifest_key(path, config, stat)
+    if key is not None:
+        return key
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            content_hash.update(chunk)
+    key = hashlib.sha256(f"{content_hash.hexdigest()}\n{config}".encode("utf-8")).hexdigest()
+    record = {"path": path, "config": config, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "key": key}
+    with _manifest_lock:
+        os.makedirs(PROCESSED_DOCS_DIR, exist_ok=True)
+        with open(MANIFEST_PATH, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        _manifest[(path, config)] = record
+    return key
+
+
+def _cached_text_path(key):
+    return os.path.join(TEXT_CACHE_DIR, key[:2], f"{key}.txt")
+
+
+def _write_cached_text(key, text):
+    """Write parsed text to the cache atomically, so readers never see a partial file."""
+    text_path = _cached_text_path(key)
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+    tmp_path = f"{text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, text_path)
+
+
+def doc_to_elements(file, use_hi_res=False, use_multimodal=False, pdf_backend="pdfminer", max_tokens=None):
+    """
+    Convert a document file to a structured text format.
+
+    Parsed text is cached in processed_docs under a hash of the file contents and the
+    extractor settings (see ``document_cache_key``), so a changed file or extractor is
+    parsed again while unchanged files are read back.
+
+    Args:
+    file (str): Path to the input file.
+    use_hi_res (bool): Flag to use high-resolution processing for PDFs.
+    pdf_backend (str): "pdfminer" to parse PDFs in this process, or "pdf2txt" to run pdf2txt.py.
+    max_tokens (int): Token budget of the caller. PDFs parsed with pdfminer stop once the
+        budget is met (see ``pdfminer_extract``); such partial text is cached per budget.
+
+    Returns:
+    str: Formatted text content of the document.
+    """
+    cache_key = document_cache_key(file, use_hi_res, pdf_backend)
+    processed_file_path = _cached_text_path(cache_key)
+    streamed = max_tokens is not None and file.endswith('.pdf') and pdf_backend != "pdf2txt"
+    partial_key = None
+    if streamed and not os.path.exists(processed_file_path):
+        # A complete parse is always preferred; otherwise use the text parsed for this budget.
+        partial_key = _partial_key(cache_key, max_tokens)
+        processed_file_path = _cached_text_path(partial_key)
+
+    # Base name used for image directory
+    paper_id = os.path.splitext(os.path.basename(file))[0]
+    images_dir = os.path.join(os.getcwd(), 'images', paper_id)
+
+    # If the file has already been processed, load its content
+    formatted_output = None
+    if os.path.exists(processed_file_path):
+        with open(processed_file_path, 'r') as f:
+            formatted_output = f.read()
+
     xml_content = None
 
     if formatted_output is None:
@@ -210,29 +455,32 @@ def doc_to_elements(file, use_hi_res=False, use_multimodal=False):
 
         # Process PDF files
         if file.endswith('.pdf'):
-            formatted_output = pdf2txt_extract(file, images_dir)
-
-        # Process XML files
+            if pdf_backend == "pdf2txt":
+                formatted_output = pdf2txt_extract(file, images_dir)
+            elif partial_key is not None:
+                formatted_output, complete = pdfminer_extract(file, images_dir, max_tokens)
+                if complete:
+                    partial_key = None
+            else:
+                formatted_output = pdfminer_extract(file, images_dir)
+
+        # Process XML files
         elif file.endswith('.xml'):
-            with open(file, 'r') as f:
-                xml_content = f.read()
-            formatted_output = xml_to_string(xml_content)
-            with open(processed_file_path, 'w') as f:
-                f.write(formatted_output)
-        else:
-            f = open(file, 'rb')
-            try:
-                elements = partition(file)
-            except Exception as e:
-                print(f"Unstructured failed because of {e}")
-
-        if elements is not None and not formatted_output:
-            formatted_output = elements_to_string(convert_to_dict(elements))
-
-        if formatted_output:
-            with open(processed_file_path, 'w') as f:
-                f.write(formatted_output)
-
+            formatted_output, sections = jats_to_text(file)
+            print(f"Converted {file} with {len(sections)} sections.")
+        else:
+            f = open(file, 'rb')
+            try:
+                elements = partition(file)
+            except Exception as e:
+                print(f"Unstructured failed because of {e}")
+
+        if elements is not None and not formatted_output:
+            formatted_output = elements_to_string(convert_to_dict(elements))
+
+        if formatted_output:
+            _write_cached_text(partial_key or cache_key, formatted_output)
+
     # If multimodal, ensure images are available
     if use_multimodal:
         if file.endswith('.xml'):
@@ -241,5 +489,60 @@ def doc_to_elements(file, use_hi_res=False, use_multimodal=False):
                     xml_content = f.read()
             count = extract_images_from_pubmed_xml(xml_content, images_dir)
             print(f"Image extraction complete for {file}: {count} images saved to {images_dir}")
-
-    return formatted_output
+
+    return formatted_output
+
+
+def init_parse_worker(log_file):
+    """Point the custom print function of a parse process at the parent's log file."""
+    builtins.a = log_file
+
+
+def _partial_key(cache_key, max_tokens):
+    return hashlib.sha256(f"{cache_key}\nmax_tokens={max_tokens}".encode("utf-8")).hexdigest()
+
+
+def is_parsed(file, use_hi_res=False, pdf_backend="pdfminer", max_tokens=None):
+    """
+    Return True if ``file`` already has text in the processed_docs cache.
+
+    Only the manifest and the file's size and modification time are checked, so this
+    does not read or hash the file. With ``max_tokens``, text parsed for that budget counts.
+    """
+    path = os.path.abspath(file)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    key = _manifest_key(path, _extractor_config(file, use_hi_res, pdf_backend), stat)
+    if key is None:
+        return False
+    if os.path.exists(_cached_text_path(key)):
+        return True
+    return max_tokens is not None and os.path.exists(_cached_text_path(_partial_key(key, max_tokens)))
+
+
+def parse_documents(files, use_hi_res=False, pdf_backend="pdfminer", workers=1, max_tokens=None):
+    """
+    Parse documents into the processed_docs cache on a pool of processes.
+
+    Files that are already cached are skipped. Later ``doc_to_elements`` calls for these
+    files only read the cached text back. ``max_tokens`` is passed on to ``doc_to_elements``.
+
+    Returns:
+    int: The number of files parsed.
+    """
+    pending = [file for file in files if not is_parsed(file, use_hi_res, pdf_backend, max_tokens)]
+    if not pending:
+        return 0
+    print(f"Parsing {len(pending)} documents on {workers} processes.")
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_parse_worker, initargs=(builtins.a,)) as pool:
+        futures = {pool.submit(doc_to_elements, file, use_hi_res, False, pdf_backend, max_tokens): file for file in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                future.result()
+            except Exception as err:
+                print(f"Unable to process {futures[future]} into plaintext due to {err}")
+            if done % 100 == 0:
+                print(f"Parsed {done}/{len(pending)} documents.")
+    return len(pending)
@@ -1,19 +1,31 @@
 import sys
 import os
 import csv
+import re
 import requests
-import json
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from src.utils import (
-    generate_prompt,
     parse_llm_response,
+    parse_json_response,
     validate_result,
     write_to_csv,
     list_files_in_directory,
     begin_ollama_server,
     extract_smiles_for_paper,
+    generate_repair_prompt,
+    build_paper_digest,
+    estimate_tokens,
 )
 from src.classes import JobSettings,PromptData
-from openai import OpenAI
+from src.llm import generate, unload_model
+from src.run_report import get_run_report
+from src.relevance import get_relevance_scorer, build_query_terms, save_relevance_stats, LOG_EVERY
+from src.check_classifier import get_check_classifier
+from src.ollama_supervisor import get_ollama_supervisor
+from src.document_reader import parse_documents
 
 
 def _is_skippable_row(row, paper_col):
@@ -26,6 +38,36 @@ def _is_skippable_row(row, paper_col):
     return all_null or has_failed
 
 
+def _new_prompt_data(job_settings: JobSettings, use_thinking=None, model_tier=None, keep_alive=None):
+    """
+    Build a PromptData object for the job's models (or one ``model_cascade`` tier) and input settings.
+
+    ``keep_alive`` overrides ``extract.keep_alive``.
+    """
+    return PromptData(
+        model_name_version=model_tier["model"] if model_tier else job_settings.model_name_version,
+        check_model_name_version=job_settings.check_model_name_version,
+        use_openai=model_tier["use_openai"] if model_tier else job_settings.use_openai,
+        api_key=job_settings.api_key,
+        use_hi_res=job_settings.use_hi_res,
+        use_multimodal=job_settings.use_multimodal,
+        use_thinking=job_settings.use_thinking if use_thinking is None else use_thinking,
+        use_decimer_segmentation=job_settings.use_decimer_segmentation,
+        keep_alive=job_settings.extract.keep_alive if keep_alive is None else keep_alive,
+        json_schema=job_settings.extract.json_schema,
+        check_mode=job_settings.extract.check_mode,
+        check_keywords=build_query_terms(job_settings) if job_settings.extract.check_mode == "digest" else None,
+        ollama_url=job_settings.extract.ollama_url,
+        pdf_backend=job_settings.pdf_backend,
+    )
+
+
+def _start_local_server(job_settings: JobSettings, model):
+    """Start the local Ollama server if needed and load ``model`` before any work is sent."""
+    if begin_ollama_server():
+        get_ollama_supervisor().warm_up(model, job_settings.extract.keep_alive)
+
+
 def batch_double_check(job_settings: JobSettings):
     def resolve_paper_filename(paper_id):
         candidates = [f"{paper_id}.pdf", f"{paper_id}.txt", f"{paper_id}.xml", paper_id]
@@ -35,18 +77,10 @@ def batch_double_check(job_settings: JobSettings):
         return f"{paper_id}.pdf"
 
     if not job_settings.use_openai:
-        begin_ollama_server()
+        # Every request of this pass is a check (PromptData.__check__), so load the check model.
+        _start_local_server(job_settings, job_settings.check_model_name_version)
 
-    data = PromptData(
-        model_name_version=job_settings.model_name_version,
-        check_model_name_version=job_settings.check_model_name_version,
-        use_openai=job_settings.use_openai,
-        api_key=job_settings.api_key,
-        use_hi_res=job_settings.use_hi_res,
-        use_multimodal=job_settings.use_multimodal,
-        use_thinking=False,
-        use_decimer_segmentation=job_settings.use_decimer_segmentation,
-    )
+    data = _new_prompt_data(job_settings, use_thinking=False)
 
     with open(job_settings.files.source_csv, "r", newline="", encoding="utf-8") as src_f:
         reader = csv.DictReader(src_f)
@@ -89,13 +123,15 @@ def batch_double_check(job_settings: JobSettings):
             if job_settings.use_decimer:
                 new_text, _ = extract_smiles_for_paper(paper_file, data.paper_content)
                 data.paper_content = new_text
+                data._build_prompts()
             cached_paper = paper_id
 
         row_repr = ", ".join(
             [f'{h}="{str(base_row.get(h, "")).strip()}"' for h in headers if h not in {"double_check"}]
         )
+        # Every row of the same paper shares the paper prefix, so only the row is new work for the model.
         prompt = (
-            f"Paper Contents:\n{data.paper_content}\n\n"
+            f"{data.check_paper_prefix}"
             f"{job_settings.double_check_prompt}\n\n"
             f"Candidate row to verify:\n{row_repr}\n\n"
             "Does this row exist in the paper? Respond with exactly yes or no.\nResponse:"
@@ -105,46 +141,10 @@ def batch_double_check(job_settings: JobSettings):
         decision = "no"
         while retry_count < job_settings.double_check.max_retries:
             try:
-                if job_settings.use_openai:
-                    client = OpenAI()
-                    parts = [{"type": "input_text", "text": prompt}]
-                    if job_settings.use_multimodal:
-                        for img in data.images + data.si_images + data.segment_images:
-                            parts.append(
-                                {"type": "input_image", "image_url": f"data:image/png;base64,{img}"}
-                            )
-                    try:
-                        resp = client.responses.create(
-                            model=job_settings.check_model_name,
-                            input=[{"role": "user", "content": parts}],
-                        )
-                        model_answer = resp.output_text
-                    except Exception:
-                        content_parts = [{"type": "text", "text": prompt}]
-                        if job_settings.use_multimodal:
-                            for img in data.images + data.si_images + data.segment_images:
-                                content_parts.append(
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {"url": f"data:image/png;base64,{img}"},
-                                    }
-                                )
-                        completion = client.chat.completions.create(
-                            model=job_settings.check_model_name,
-                            messages=[{"role": "user", "content": content_parts}],
-                        )
-                        model_answer = completion.choices[0].message.content
-                else:
-                    payload = data.__check__()
-                    payload["prompt"] = prompt
-                    payload["images"] = data.images + data.si_images + data.segment_images
-                    response = requests.post(
-                        f"{job_settings.double_check.ollama_url}/api/generate",
-                        json=payload,
-                    )
-                    response.raise_for_status()
-                    model_answer = response.json()["response"]
-
+                payload = data.__check__()
+                payload["prompt"] = prompt
+                payload["images"] = data.images + data.si_images + data.segment_images
+                model_answer = generate(job_settings, payload, job_settings.double_check.ollama_url)
                 decision = "yes" if str(model_answer).strip().lower() == "yes" else "no"
                 break
             except Exception as err:
@@ -184,6 +184,794 @@ def get_files_to_process(job_settings:JobSettings):
     # Filter out already processed papers and return list.
     return [file for file in files_to_process if os.path.splitext(os.path.basename(file))[0] not in processed_papers]
 
+
+def _clean_null_values(parsed_result):
+    """Normalise the placeholder spellings models use for missing values to 'null' in place."""
+    for row in parsed_result:
+        for idx, item in enumerate(row):
+            try:
+                if any([
+                    item.lower().replace(" ", "") == 'null',
+                    item in ['', '""', "''"],
+                    item.strip().lower().replace('"', '').replace("'", "") == 'no information found'
+                ]):
+                    row[idx] = 'null'
+            except Exception:
+                pass
+
+
+def _row_key(job_settings: JobSettings, row):
+    """Return the identity of a validated row: its key column values, or the whole row if there are none."""
+    # Polymer identity depends on the full row (not just target column),
+    # so skip key-based deduplication in polymer mode.
+    if not job_settings.extract.key_columns or job_settings.target_type == "polymer":
+        return tuple(str(value) for value in row)
+    return tuple(row[i - 1] for i in job_settings.extract.key_columns)
+
+
+def _filter_key_duplicates(job_settings: JobSettings, validated_result):
+    """Drop rows that repeat the key column values of an earlier row."""
+    if not job_settings.extract.key_columns or job_settings.target_type == "polymer":
+        return validated_result
+    key_values = set()
+    filtered_result = []
+    for row in validated_result:
+        key = _row_key(job_settings, row)
+        if key not in key_values:
+            key_values.add(key)
+            filtered_result.append(row)
+    return filtered_result
+
+
+class RowAccumulator():
+    """
+    Collect the rows of one paper that passed validation on any attempt.
+
+    Rows are deduplicated with ``_row_key``, so a retry only contributes rows that
+    earlier attempts did not already produce.
+    """
+    def __init__(self, job_settings: JobSettings):
+        self.job_settings = job_settings
+        self.rows = []
+        self.keys = set()
+
+    def add(self, rows):
+        """Add validated rows and return how many of them were new."""
+        added = 0
+        for row in rows or []:
+            key = _row_key(self.job_settings, row)
+            if key not in self.keys:
+                self.keys.add(key)
+                self.rows.append(row)
+                added += 1
+        return added
+
+    def is_done(self, rejected, retry_count, added):
+        """
+        Decide whether another attempt is worthwhile.
+
+        The paper is finished once some rows are kept and either the last attempt had
+        no rejected rows, or it was a retry that added nothing new.
+        """
+        if not self.rows:
+            return False
+        return rejected == 0 or (retry_count > 0 and added == 0)
+
+
+def _write_failed_row(job_settings: JobSettings, file_path):
+    """Record a paper as failed so resumed runs do not pick it up again."""
+    failed_result = ["failed" for _ in range(job_settings.extract.num_columns)]
+    failed_result.append(os.path.splitext(os.path.basename(file_path))[0])
+    write_to_csv([failed_result], job_settings.extract.headers, filename=job_settings.files.csv)
+
+
+def _parse_check(check_result):
+    """Turn the check model's answer into a verdict."""
+    print(f"Check result was '{check_result}'")
+    return str(check_result).strip().lower().startswith("yes")
+
+
+def _run_check(job_settings: JobSettings, data: PromptData):
+    """Ask the check model whether the paper loaded in ``data`` is worth a full extraction."""
+    verdict = _parse_check(generate(job_settings, data.__check__()))
+    _get_pass_rate(job_settings).record(verdict)
+    return verdict
+
+
+# Number of recent check model verdicts the speculation policy looks at, and how many
+# it needs before it speculates at all.
+SPECULATION_WINDOW = 50
+SPECULATION_MIN_VERDICTS = 10
+
+_pass_rates = {}
+_pass_rates_lock = threading.Lock()
+
+
+class CheckPassRate():
+    """
+    Rolling pass rate of the check model, and the slots for speculative extractions.
+
+    Speculation is only worth it when most papers pass the check, since every paper the
+    check rejects wastes the extraction request sent alongside it.
+    """
+    def __init__(self, slots=1):
+        self.verdicts = deque(maxlen=SPECULATION_WINDOW)
+        self.slots = threading.BoundedSemaphore(max(1, slots))
+        self.lock = threading.Lock()
+        self.speculated = 0
+        self.discarded = 0
+
+    def record(self, verdict):
+        """Add a verdict of the check model to the window."""
+        with self.lock:
+            self.verdicts.append(bool(verdict))
+
+    def rate(self):
+        """Return the pass rate over the window, or None until enough verdicts have been seen."""
+        with self.lock:
+            if len(self.verdicts) < SPECULATION_MIN_VERDICTS:
+                return None
+            return sum(self.verdicts) / len(self.verdicts)
+
+    def record_speculation(self, discarded):
+        """Count a speculative extraction, and whether its result had to be thrown away."""
+        with self.lock:
+            self.speculated += 1
+            self.discarded += int(discarded)
+
+    def summary(self):
+        """Return the current pass rate and the speculation counts."""
+        rate = self.rate()
+        with self.lock:
+            return {
+                "check_pass_rate": round(rate, 4) if rate is not None else None,
+                "speculated": self.speculated,
+                "discarded": self.discarded,
+            }
+
+
+def _get_pass_rate(job_settings: JobSettings):
+    """Return the CheckPassRate for the job's check model and check prompt, creating it on first use."""
+    key = f"{job_settings.check_model_name_version}\n{job_settings.check_prompt}"
+    with _pass_rates_lock:
+        pass_rate = _pass_rates.get(key)
+        if pass_rate is None:
+            pass_rate = CheckPassRate(job_settings.extract.max_in_flight)
+            _pass_rates[key] = pass_rate
+        return pass_rate
+
+
+def _passes_relevance_gate(job_settings: JobSettings, data: PromptData, file_path):
+    """
+    Score the paper loaded in ``data`` against the job's terms and reject it if it is clearly off-topic.
+
+    Only active when ``extract.relevance_threshold`` is set. Papers are never rejected before
+    the scorer has seen enough documents for stable IDF values.
+    """
+    threshold = job_settings.extract.relevance_threshold
+    if threshold is None:
+        return True
+    scorer = get_relevance_scorer(job_settings)
+    paper_id = os.path.splitext(os.path.basename(file_path))[0]
+    score = scorer.score(data.paper_content, paper_id)
+    passed = not scorer.gate_ready() or score >= threshold
+    print(f"Relevance score for {os.path.basename(file_path)}: {score:.3f} (threshold {threshold})")
+    if not passed:
+        scorer.record_rejection()
+        print(f"Relevance gate rejected {os.path.basename(file_path)}; skipping the check model.")
+    distribution = scorer.distribution()
+    if distribution["papers"] % LOG_EVERY == 0:
+        print(f"Relevance score distribution: {distribution}")
+        get_run_report(job_settings).update_section("relevance", distribution)
+    return passed
+
+
+def _local_check(job_settings: JobSettings, data: PromptData, file_path):
+    """
+    Try to decide the check for the paper loaded in ``data`` without the check model.
+
+    Returns:
+    tuple: The verdict (None if the check model has to decide) and the classifier state to
+        hand to ``_record_check`` together with the check model's verdict.
+    """
+    if not _passes_relevance_gate(job_settings, data, file_path):
+        return False, None
+    if not job_settings.extract.check_classifier:
+        return None, None
+    classifier = get_check_classifier(job_settings)
+    paper_id = os.path.splitext(os.path.basename(file_path))[0]
+    verdict, features, predicted = classifier.decide(paper_id, data.paper_content)
+    if verdict is not None:
+        get_run_report(job_settings).update_section("check_classifier", classifier.summary())
+        return verdict, None
+    return None, (features, predicted)
+
+
+def _record_check(job_settings: JobSettings, classifier_state, verdict):
+    """Feed a verdict of the check model back to the check classifier, if it is in use."""
+    if classifier_state is None:
+        return
+    classifier = get_check_classifier(job_settings)
+    features, predicted = classifier_state
+    classifier.record(features, verdict, predicted)
+    get_run_report(job_settings).update_section("check_classifier", classifier.summary())
+
+
+def _check_paper(job_settings: JobSettings, data: PromptData, file_path):
+    """
+    Decide whether to extract a paper.
+
+    The local relevance gate runs first, then the learned check classifier (if enabled),
+    and the check model is only asked when neither is confident. Its verdicts are fed
+    back to the classifier.
+    """
+    verdict, classifier_state = _local_check(job_settings, data, file_path)
+    if verdict is not None:
+        return verdict
+    verdict = _run_check(job_settings, data)
+    _record_check(job_settings, classifier_state, verdict)
+    return verdict
+
+
+def _should_speculate(job_settings: JobSettings, pass_rate):
+    """Return True if the first extraction attempt should be sent alongside the check."""
+    threshold = job_settings.extract.speculative_pass_rate
+    if threshold is None or job_settings.use_decimer:
+        return False
+    rate = pass_rate.rate()
+    return rate is not None and rate >= threshold
+
+
+def _speculative_check(job_settings: JobSettings, data: PromptData, file_path):
+    """
+    Decide whether to extract a paper, sending the first extraction attempt alongside the check.
+
+    Speculation only happens when ``extract.speculative_pass_rate`` is set, the recent pass
+    rate of the check model reaches it and a speculation slot is free; otherwise this is
+    ``_check_paper``. While speculating, ``data`` is loaded with the full paper as soon as
+    the check request is sent. If the check says no, the extraction is cancelled if it has
+    not been sent yet and its response is discarded otherwise.
+
+    Returns:
+    tuple: The verdict and, when speculating on a paper that passed, the future of the
+        first extraction attempt (to hand to ``_extract_with_cascade``).
+    """
+    verdict, classifier_state = _local_check(job_settings, data, file_path)
+    if verdict is not None:
+        return verdict, None
+    pass_rate = _get_pass_rate(job_settings)
+    if not _should_speculate(job_settings, pass_rate) or not pass_rate.slots.acquire(blocking=False):
+        verdict = _run_check(job_settings, data)
+        _record_check(job_settings, classifier_state, verdict)
+        return verdict, None
+
+    print(f"Speculatively extracting {file_path} while it is checked (recent pass rate {pass_rate.rate():.0%}).")
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        check_future = executor.submit(generate, job_settings, data.__check__())
+        first_attempt = None
+        if data._refresh_paper_content(
+            file_path,
+            job_settings.extract.prompt,
+            job_settings.check_prompt,
+            check_only=False,
+        ):
+            # data still holds the check-only content; leave loading the paper to the normal path.
+            print(f"Unable to load {file_path} for speculative extraction; waiting for the check.")
+        else:
+            tier_data = _tier_prompt_data(job_settings, data, 0)
+            first_attempt = executor.submit(_generate_attempt, job_settings, tier_data, 0)
+        verdict = _parse_check(check_future.result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        pass_rate.slots.release()
+    pass_rate.record(verdict)
+    _record_check(job_settings, classifier_state, verdict)
+    if first_attempt is None:
+        return verdict, None
+    pass_rate.record_speculation(discarded=not verdict)
+    get_run_report(job_settings).update_section("speculation", pass_rate.summary())
+    if not verdict:
+        first_attempt.cancel()
+        print(f"Discarding the speculative extraction of {file_path}.")
+        return False, None
+    return True, first_attempt
+
+
+def _run_batched_check(job_settings: JobSettings, data: PromptData, digests):
+    """
+    Ask the check model about several papers in one request.
+
+    Returns:
+    list: One verdict per digest, True/False, or None where the answer could not be read.
+    """
+    sections = "\n\n".join(f"Paper {idx}:\n{digest}" for idx, digest in enumerate(digests, start=1))
+    prompt = (
+        f"Below are digests (title, abstract, headings, captions and key sentences) of {len(digests)} papers.\n\n"
+        f"{sections}\n\n"
+        f"{job_settings.check_prompt}\n\n"
+        f"Answer this question separately for each paper. Respond with exactly {len(digests)} lines, "
+        f"one per paper, in the form '<paper number>: yes' or '<paper number>: no', and nothing else."
+    )
+    payload = data.__check__()
+    payload["prompt"] = prompt
+    payload["options"] = dict(payload["options"], num_predict=8 * len(digests) + 16)
+    payload.pop("images", None)
+    answer = generate(job_settings, payload)
+    print(f"Batched check result was:\n{answer}")
+    verdicts = [None] * len(digests)
+    for number, reply in re.findall(r"(\d+)\s*[:.)\-]\s*(yes|no)", str(answer).lower()):
+        idx = int(number) - 1
+        if 0 <= idx < len(digests) and verdicts[idx] is None:
+            verdicts[idx] = reply == "yes"
+    return verdicts
+
+
+def _batch_check(job_settings: JobSettings, data: PromptData, files):
+    """
+    Check a window of papers, packing the digests of several papers into each check request.
+
+    Papers are first put through the local checks. The remaining digests are grouped up to
+    ``extract.check_batch_size`` papers and the check model's context budget. Papers whose
+    answer cannot be read from a batched reply are checked on their own, as is every paper
+    when ``extract.check_batch_size`` is one.
+
+    Returns:
+    dict: file -> verdict, or None for papers that could not be loaded.
+    """
+    keywords = build_query_terms(job_settings)
+    verdicts = {}
+    pending = []
+    for file in files:
+        if data._refresh_paper_content(file, job_settings.extract.prompt, job_settings.check_prompt, check_only=True):
+            verdicts[file] = None
+            continue
+        if job_settings.extract.check_batch_size == 1:
+            verdicts[file] = _check_paper(job_settings, data, file)
+            continue
+        verdict, classifier_state = _local_check(job_settings, data, file)
+        if verdict is not None:
+            verdicts[file] = verdict
+            continue
+        pending.append((file, build_paper_digest(data.paper_content, keywords), classifier_state))
+
+    budget = data._content_budget(check=True) - estimate_tokens(job_settings.check_prompt) - 256
+    groups = []
+    group, used = [], 0
+    for item in pending:
+        cost = estimate_tokens(item[1]) + 8
+        if group and (len(group) >= job_settings.extract.check_batch_size or used + cost > budget):
+            groups.append(group)
+            group, used = [], 0
+        group.append(item)
+        used += cost
+    if group:
+        groups.append(group)
+
+    for group in groups:
+        print(f"Checking {len(group)} papers in one request.")
+        try:
+            answers = _run_batched_check(job_settings, data, [digest for _, digest, _ in group])
+        except Exception as err:
+            print(f"Batched check failed: {type(err).__name__} - {err}")
+            answers = [None] * len(group)
+        for (file, _, classifier_state), verdict in zip(group, answers):
+            if verdict is None:
+                print(f"No batched answer for {file}; checking it on its own.")
+                data._refresh_paper_content(file, job_settings.extract.prompt, job_settings.check_prompt, check_only=True)
+                verdict = _run_check(job_settings, data)
+            _record_check(job_settings, classifier_state, verdict)
+            verdicts[file] = verdict
+    return verdicts
+
+
+def _prepare_extraction(job_settings: JobSettings, data: PromptData, file_path):
+    """Run the optional DECIMER pass and rebuild the extraction prompt around its output."""
+    if not job_settings.use_decimer:
+        print("DECIMER extraction disabled")
+        return
+    print("Attempting to pull SMILES from images in paper...")
+    new_text, locations = extract_smiles_for_paper(file_path, data.paper_content)
+    data.paper_content = new_text
+    data._build_prompts()
+    if locations:
+        parts = []
+        for smi, snip in locations:
+            snippet = snip.replace("\n", " ").strip()
+            parts.append(f"{smi} -> '{snippet}'")
+        loc_str = "; ".join(parts)
+        print(f"Inserted SMILES with context: {loc_str}")
+
+
+def _generate_attempt(job_settings: JobSettings, data: PromptData, retry_count):
+    """Send the extraction prompt held in ``data`` using the sampling settings for this retry."""
+    data._refresh_data(retry_count)
+    result = generate(job_settings, data.__dict__(), use_openai=data.use_openai, attempt=retry_count)
+    print(f"Unparsed Result:\n{result}")
+    return result
+
+
+def _generate_sample(job_settings: JobSettings, data: PromptData, retry_count):
+    """Send the extraction prompt with the sampling settings of ``retry_count`` without touching ``data.options``."""
+    payload = data.__dict__()
+    payload["options"] = data._retry_options(retry_count)
+    return generate(job_settings, payload, use_openai=data.use_openai, attempt=retry_count)
+
+
+def _parallel_retry_round(job_settings: JobSettings, data: PromptData, file_path, accumulator, first_retry, allow_verification=True):
+    """
+    Send up to ``extract.parallel_retries`` retry samples, one per retry temperature.
+
+    At most ``extract.max_in_flight`` samples are in flight at once; the next one is only
+    sent when an earlier one comes back. Samples are validated as they come back and their
+    rows merged into ``accumulator``. As soon as the accumulator is done no further samples
+    are sent, and the responses of those already in flight are ignored.
+
+    Returns:
+    tuple: The number of retries used (samples actually sent) and whether the paper is finished.
+    """
+    last_retry = min(first_retry + job_settings.extract.parallel_retries, job_settings.extract.max_retries)
+    pending = list(range(first_retry, last_retry))
+    width = min(len(pending), max(1, job_settings.extract.max_in_flight))
+    print(f"Sending {len(pending)} retry samples for {file_path}, {width} at a time.")
+    executor = ThreadPoolExecutor(max_workers=width)
+    futures = {}
+    sent = 0
+    done = False
+
+    def send_next():
+        nonlocal sent
+        retry_count = pending.pop(0)
+        futures[executor.submit(_generate_sample, job_settings, data, retry_count)] = retry_count
+        sent += 1
+
+    try:
+        for _ in range(width):
+            send_next()
+        while futures and not done:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                retry_count = futures.pop(future)
+                try:
+                    result = future.result()
+                    print(f"Unparsed Result (retry {retry_count}):\n{result}")
+                    validated_result, rejected = _validate_attempt(job_settings, result, allow_verification)
+                except Exception as e:
+                    _report_attempt_error(file_path, e)
+                else:
+                    added = accumulator.add(validated_result)
+                    if accumulator.is_done(rejected, retry_count, added):
+                        done = True
+                        break
+                if pending:
+                    send_next()
+    finally:
+        executor.shutdown(wait=False)
+    return sent, done
+
+
+def _should_repair(job_settings: JobSettings, result):
+    """
+    Return True if a failed response is worth sending back for a reformat.
+
+    Structured output already guarantees the format, so its failures are left to a full retry.
+    """
+    return job_settings.extract.repair and not job_settings.extract.structured_output and bool(str(result or "").strip())
+
+
+def _repair_attempt(job_settings: JobSettings, data: PromptData, result):
+    """
+    Ask the model to reformat a response that did not parse or validate.
+
+    Only the schema header and the bad response are sent, at temperature 0 and without
+    images, so the paper is not evaluated again. The context size is left unchanged so
+    Ollama does not have to reload the model.
+    """
+    payload = data.__dict__()
+    payload["prompt"] = generate_repair_prompt(
+        job_settings.extract.schema_data, result, job_settings.extract.examples
+    )
+    payload["options"] = dict(payload["options"], temperature=0)
+    payload["think"] = False
+    payload.pop("images", None)
+    repaired = generate(job_settings, payload, use_openai=data.use_openai)
+    print(f"Repaired Result:\n{repaired}")
+    return repaired
+
+
+def _validate_attempt(job_settings: JobSettings, result, allow_verification=True):
+    """
+    Parse a raw model response and validate its rows against the schema.
+
+    Returns:
+    tuple: The validated rows (empty if nothing usable was found) and the number of
+        parsed rows that were rejected.
+    """
+    if job_settings.extract.structured_output:
+        parsed_result = parse_json_response(result, job_settings.extract.schema_data)
+    else:
+        parsed_result = parse_llm_response(result, job_settings.extract.num_columns)
+    if not parsed_result:
+        print("Parsed Result empty, trying again")
+        return [], 0
+    print(f"Parsed Result:\n{parsed_result}")
+
+    _clean_null_values(parsed_result)
+
+    validated_result = validate_result(
+        parsed_result,
+        job_settings.extract.schema_data,
+        job_settings.extract.examples,
+        job_settings.extract.key_columns,
+        job_settings.target_type,
+        verify_target=allow_verification,
+        assume_water=job_settings.assume_water,
+    )
+    print(f"Validated Result:\n{validated_result}")
+    if not validated_result:
+        print("Result failed to validate, trying again.")
+    return validated_result, len(parsed_result) - len(validated_result)
+
+
+def _record_rows(job_settings: JobSettings, validated_result, file_path):
+    """Deduplicate validated rows, tag them with the paper name and append them to the results CSV."""
+    validated_result = _filter_key_duplicates(job_settings, validated_result)
+
+    # Add paper filename to each row
+    for row in validated_result:
+        row.append(os.path.splitext(os.path.basename(file_path))[0])
+
+    # Write results to CSV
+    write_to_csv(validated_result, job_settings.extract.headers, filename=job_settings.files.csv)
+    return validated_result
+
+
+def _report_attempt_error(file_path, e):
+    """Print the details of an exception raised during an extraction attempt."""
+    if isinstance(e, requests.exceptions.RequestException) and hasattr(e, "response") and e.response is not None:
+        print(f"Ollama response:\n{e.response.text}")
+    print(f"Error processing {file_path}: {type(e).__name__} - {str(e)}")
+
+
+def _extract_with_retries(job_settings: JobSettings, data: PromptData, file_path, allow_verification=True, first_attempt=None):
+    """
+    Run the extraction prompt held in ``data`` until a response validates or retries run out.
+
+    A response that does not parse or validate is first sent back for a cheap reformat
+    (see ``_repair_attempt``); the paper is only re-extracted if that also fails.
+    Rows that validate on any attempt are kept (see ``RowAccumulator``), and a paper
+    whose response had some rejected rows is retried until a retry adds nothing new.
+    With ``extract.parallel_retries`` above one, retries after the first attempt are
+    sent as parallel samples (see ``_parallel_retry_round``). A ``first_attempt`` future
+    (see ``_speculative_check``) is used in place of generating the first attempt.
+
+    Validated rows are deduplicated, tagged with the paper name and appended to the
+    results CSV.
+
+    Returns:
+    list or None: The rows written to the CSV, or None if every attempt failed.
+    """
+    accumulator = RowAccumulator(job_settings)
+    retry_count = 0
+    while retry_count < job_settings.extract.max_retries:
+        if retry_count > 0 and job_settings.extract.parallel_retries > 1:
+            used, done = _parallel_retry_round(job_settings, data, file_path, accumulator, retry_count, allow_verification)
+            retry_count += used
+            if done:
+                break
+            continue
+        try:
+            if retry_count == 0 and first_attempt is not None:
+                result = first_attempt.result()
+            else:
+                result = _generate_attempt(job_settings, data, retry_count)
+            validated_result, rejected = _validate_attempt(job_settings, result, allow_verification)
+            if not validated_result and _should_repair(job_settings, result):
+                print("Asking the model to reformat its response before retrying the paper.")
+                result = _repair_attempt(job_settings, data, result)
+                validated_result, rejected = _validate_attempt(job_settings, result, allow_verification)
+            added = accumulator.add(validated_result)
+            if accumulator.is_done(rejected, retry_count, added):
+                break
+            if accumulator.rows:
+                print(f"Keeping {len(accumulator.rows)} valid rows; retrying for the {rejected} rejected ones.")
+            retry_count += 1
+        except Exception as e:
+            _report_attempt_error(file_path, e)
+            retry_count += 1
+            print(f"Retrying ({retry_count}/{job_settings.extract.max_retries})...")
+    if accumulator.rows:
+        return _record_rows(job_settings, accumulator.rows, file_path)
+    return None
+
+
+def _extraction_tiers(job_settings: JobSettings):
+    """Return the extraction models to try in order: the ``model_cascade``, or just the job's model."""
+    if job_settings.model_cascade:
+        return job_settings.model_cascade
+    return [{"model": job_settings.model_name_version, "use_openai": job_settings.use_openai}]
+
+
+def _tier_prompt_data(job_settings: JobSettings, data: PromptData, tier_index):
+    """
+    Return the PromptData used to extract the paper loaded in ``data`` with a cascade tier.
+
+    Without a cascade this is ``data`` itself. Otherwise each tier has its own PromptData,
+    kept on ``data`` for reuse, which takes over the already parsed paper and images. A tier
+    with a larger context re-reads the paper up to its own budget, and the DECIMER pass (if
+    enabled) is run again on that longer text.
+    """
+    if not job_settings.model_cascade:
+        return data
+    tier_data = data.tier_data.get(tier_index)
+    if tier_data is None:
+        tier_data = _new_prompt_data(
+            job_settings, model_tier=job_settings.model_cascade[tier_index], keep_alive=data.keep_alive
+        )
+        data.tier_data[tier_index] = tier_data
+    if tier_data._adopt_paper(data) and job_settings.use_decimer:
+        _prepare_extraction(job_settings, tier_data, tier_data.paper_file)
+    return tier_data
+
+
+def _extract_with_cascade(job_settings: JobSettings, data: PromptData, file_path, allow_verification=True, first_attempt=None):
+    """
+    Extract a paper with each model of the cascade in turn until one produces validated rows.
+
+    A tier is only given up once it exhausts its retries without a validated row. The outcome
+    of every tier tried is recorded in the run report. ``first_attempt`` is a speculative
+    first attempt of the first tier.
+
+    Returns:
+    list or None: The rows written to the CSV, or None if every tier failed.
+    """
+    tiers = _extraction_tiers(job_settings)
+    report = get_run_report(job_settings)
+    for tier_index, tier in enumerate(tiers):
+        if len(tiers) > 1:
+            print(f"Extracting {file_path} with model tier {tier_index + 1}/{len(tiers)} ({tier['model']})")
+        tier_data = _tier_prompt_data(job_settings, data, tier_index)
+        validated_result = _extract_with_retries(
+            job_settings, tier_data, file_path, allow_verification, first_attempt if tier_index == 0 else None
+        )
+        report.record_tier(tier_index, tier["model"], bool(validated_result))
+        if validated_result:
+            return validated_result
+    return None
+
+
+def _extract_checked_file(job_settings: JobSettings, data: PromptData, file, allow_verification, reload=True, first_attempt=None):
+    """
+    Extract and record a paper whose check verdict is known, writing a failed row if nothing validates.
+
+    ``reload`` loads the full paper (with images) into ``data``; it can be skipped when ``data``
+    already holds it, as it does after a speculative ``first_attempt``.
+    """
+    validated_result = None
+    if allow_verification:
+        if reload and first_attempt is None and data._refresh_paper_content(
+            file,
+            job_settings.extract.prompt,
+            job_settings.check_prompt,
+            check_only=False,
+        ):
+            print(f"Unable to load {file} for extraction; skipping it.")
+            return
+        _prepare_extraction(job_settings, data, file)
+        validated_result = _extract_with_cascade(job_settings, data, file, allow_verification, first_attempt)
+    else:
+        print(f"Check rejected {file}; skipping extraction.")
+
+    if not validated_result:
+        print(f"Failed to extract data from {file} after {job_settings.extract.max_retries} retries.")
+        _write_failed_row(job_settings, file)
+
+
+def _process_file(job_settings: JobSettings, data: PromptData, file):
+    """Check, extract and record a single paper for ``batch_extract``."""
+    print(f"Now processing {file}")
+    if data._refresh_paper_content(
+        file,
+        job_settings.extract.prompt,
+        job_settings.check_prompt,
+        check_only=not job_settings.skip_check,
+    ):
+        return
+
+    first_attempt = None
+    if job_settings.skip_check:
+        allow_verification = True
+    else:
+        # Use a check prompt to lower cost
+        allow_verification, first_attempt = _speculative_check(job_settings, data, file)
+    _extract_checked_file(job_settings, data, file, allow_verification, not job_settings.skip_check, first_attempt)
+
+
+def _for_each_file(job_settings: JobSettings, data: PromptData, files, func, max_in_flight=1):
+    """
+    Call ``func(job_settings, data, file)`` for every file, keeping up to ``max_in_flight`` running.
+
+    Sequential calls reuse ``data``; worker threads each build their own PromptData with the
+    same ``keep_alive``.
+    """
+    if max_in_flight == 1:
+        for file in files:
+            func(job_settings, data, file)
+        return
+
+    print(f"Keeping up to {max_in_flight} papers in flight.")
+    worker_state = threading.local()
+
+    def process(file):
+        if not hasattr(worker_state, "data"):
+            worker_state.data = _new_prompt_data(job_settings, keep_alive=data.keep_alive)
+        func(job_settings, worker_state.data, file)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {executor.submit(process, file): file for file in files}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as err:
+                print(f"Error processing {futures[future]}: {type(err).__name__} - {err}")
+
+
+def _phase_ordered(job_settings: JobSettings):
+    """
+    Return True if ``batch_extract`` should run the check and extraction models in separate phases.
+
+    This only helps when the check model differs from a local extraction model, since Ollama
+    would otherwise swap the two models on every paper.
+    """
+    if job_settings.extract.phase_window <= 1 or job_settings.skip_check:
+        return False
+    local_models = {tier["model"] for tier in _extraction_tiers(job_settings) if not tier["use_openai"]}
+    return bool(local_models - {job_settings.check_model_name_version})
+
+
+def _extract_in_check_windows(job_settings: JobSettings, data: PromptData, files, max_in_flight=1, phase_ordered=False):
+    """
+    Process papers in windows: check the whole window with batched check requests, then extract it.
+
+    With ``phase_ordered`` the window is run in two phases: every check with the check model,
+    then every extraction with the extraction model(s). Models are kept loaded for the whole
+    phase (``keep_alive`` -1) and unloaded explicitly when it ends, so each window pays for
+    one load of each model instead of two per paper.
+    """
+    window_size = max(job_settings.extract.check_batch_size, job_settings.extract.phase_window)
+    if phase_ordered:
+        data.keep_alive = -1
+        local_models = []
+        for tier in _extraction_tiers(job_settings):
+            if not tier["use_openai"] and tier["model"] not in local_models:
+                local_models.append(tier["model"])
+    for start in range(0, len(files), window_size):
+        window = files[start:start + window_size]
+        print(f"Checking papers {start + 1}-{start + len(window)} of {len(files)}")
+        verdicts = _batch_check(job_settings, data, window)
+        passed = []
+        for file in window:
+            if verdicts.get(file) is None:
+                continue
+            if verdicts[file]:
+                passed.append(file)
+            else:
+                _extract_checked_file(job_settings, data, file, False)
+        if phase_ordered and not job_settings.use_openai:
+            # Checks go to the job's backend; an OpenAI check model has nothing to unload.
+            unload_model(job_settings, job_settings.check_model_name_version)
+        _for_each_file(
+            job_settings,
+            data,
+            passed,
+            lambda job, worker_data, file: _extract_checked_file(job, worker_data, file, True),
+            max_in_flight,
+        )
+        if phase_ordered and passed:
+            for model in local_models:
+                unload_model(job_settings, model)
+
+
 def batch_extract(job_settings: JobSettings):
     '''
     Batch extraction function for processing multiple papers.
@@ -193,6 +981,17 @@ def batch_extract(job_settings: JobSettings):
     needs to load the model once. However, it requires pre-downloaded papers and
     a specific file structure.
 
+    When ``extract.max_in_flight`` is greater than one, that many papers are
+    processed at once on a thread pool so the model server is never left idle
+    waiting on a single round trip. Each worker thread keeps its own PromptData.
+    When ``extract.pipeline`` is set, papers instead go through the staged
+    ExtractionPipeline with a separate worker pool per stage. When
+    ``extract.check_batch_size`` is above one, papers are checked in batches
+    before a window of them is extracted. When ``extract.phase_window`` is set
+    and the check model differs from the extraction model, each window is
+    checked with the check model before any of it is extracted with the main
+    model, so the models are swapped once per window instead of per paper.
+
     Args:
     job_settings (JobSettings): A JobSettings object containing configuration parameters.
 
@@ -202,218 +1001,39 @@ def batch_extract(job_settings: JobSettings):
 
     # Check for Ollama binary and start server when using local models
     if not job_settings.use_openai:
-        begin_ollama_server()
+        first_model = job_settings.model_name_version if job_settings.skip_check else job_settings.check_model_name_version
+        _start_local_server(job_settings, first_model)
 
-    data = PromptData(
-        model_name_version=job_settings.model_name_version,
-        check_model_name_version=job_settings.check_model_name_version,
-        use_openai=job_settings.use_openai,
-        api_key=job_settings.api_key,
-        use_hi_res=job_settings.use_hi_res,
-        use_multimodal=job_settings.use_multimodal,
-        use_thinking=job_settings.use_thinking,
-        use_decimer_segmentation=job_settings.use_decimer_segmentation,
-    )
+    data = _new_prompt_data(job_settings)
 
     # Determine which files to process
     files_to_process = get_files_to_process(job_settings)
 
     print(f"Found {len(files_to_process)} files to process, starting!")
 
-    # Process each file
-    for file in files_to_process:
-        print(f"Now processing {file}")
-        retry_count = 0
-        success = False
-        if job_settings.skip_check:
-            if data._refresh_paper_content(
-                file,
-                job_settings.extract.prompt,
-                job_settings.check_prompt,
-                check_only=False,
-            ):
-                continue
-            check_result = "yes"
-            allow_verification = True
-        else:
-            if data._refresh_paper_content(
-                file,
-                job_settings.extract.prompt,
-                job_settings.check_prompt,
-                check_only=True,
-            ):
-                continue
-            # Use a check prompt to lower cost
-            check_response = requests.post(
-                f"{job_settings.extract.ollama_url}/api/generate", json=data.__check__()
-            )
-            check_response.raise_for_status()
-            check_result = check_response.json()["response"]
-            print(f"Check result was '{check_result}'")
-            allow_verification = str(check_result).strip().lower().startswith("yes")
-
-        if allow_verification:
-            if not job_settings.skip_check:
-                data._refresh_paper_content(
-                    file,
-                    job_settings.extract.prompt,
-                    job_settings.check_prompt,
-                    check_only=False,
-                )
-
-            if job_settings.use_decimer:
-                print("Attempting to pull SMILES from images in paper...")
-                new_text, locations = extract_smiles_for_paper(file, data.paper_content)
-                data.paper_content = new_text
-                base_prompt = generate_prompt(
-                    job_settings.extract.schema_data,
-                    job_settings.extract.user_instructions,
-                    job_settings.extract.key_columns,
-                    job_settings.target_type,
-                )
-                data.prompt = (
-                    f"Paper Contents:\n{data.paper_content}\n\n{base_prompt}\n\nAgain, please make sure to respond only in the specified format exactly as described, or you will cause errors.\nResponse:"
-                )
-                if locations:
-                    parts = []
-                    for smi, snip in locations:
-                        snippet = snip.replace("\n", " ").strip()
-                        parts.append(f"{smi} -> '{snippet}'")
-                    loc_str = "; ".join(parts)
-                    print(f"Inserted SMILES with context: {loc_str}")
-            else:
-                print("DECIMER extraction disabled")
-        else:
-            print("No SMILES found")
-            data.images = []
-            data.si_images = []
-
-        # Attempt extraction with retries
-        while retry_count < job_settings.extract.max_retries and not success:
-            data._refresh_data(retry_count)
-            try:
-                if check_result == "yes" or check_result == "Yes":
-                    if job_settings.use_openai:
-                        client = OpenAI()
-                        parts = [{"type": "input_text", "text": data.prompt}]
-                        if job_settings.use_multimodal:
-                            for img in data.images + data.si_images:
-                                parts.append(
-                                    {
-                                        "type": "input_image",
-                                        "image_url": f"data:image/png;base64,{img}",
-                                    }
-                                )
-                        try:
-                            resp = client.responses.create(
-                                model=job_settings.model_name,
-                                input=[{"role": "user", "content": parts}],
-                            )
-                            result = resp.output_text
-                        except Exception as err:
-                            print(f"Responses endpoint failed: {err}. Falling back to chat completions.")
-                            content_parts = [{"type": "text", "text": data.prompt}]
-                            if job_settings.use_multimodal:
-                                for img in data.images + data.si_images:
-                                    content_parts.append(
-                                        {
-                                            "type": "image_url",
-                                            "image_url": {"url": f"data:image/png;base64,{img}"},
-                                        }
-                                    )
-                            completion = client.chat.completions.create(
-                                model=job_settings.model_name,
-                                messages=[{"role": "user", "content": content_parts}],
-                            )
-                            result = completion.choices[0].message.content
-                    else:
-                        # Use Ollama API
-                        response = requests.post(f"{job_settings.extract.ollama_url}/api/generate", json=data.__dict__())
-                        response.raise_for_status()
-                        result = response.json()["response"]
-                else:
-                    result = ", ".join(["null" for _ in range(job_settings.extract.num_columns)])
-
-                print("Unparsed result:")
-                print(result)
-
-                # Parse and validate the result
-                parsed_result = parse_llm_response(result, job_settings.extract.num_columns)
-                if not parsed_result:
-                    print("Parsed result empty, trying again")
-                    retry_count += 1
-                    continue
-
-                print("Parsed result:")
-                print(parsed_result)
-
-                # Clean up 'null' values
-                for row in parsed_result:
-                    for idx, item in enumerate(row):
-                        try:
-                            if item.lower().replace(" ", "") == 'null' or item == '' or item == '""' or item == "''" or item.strip().lower().replace('"', '').replace("'", "") == 'no information found':
-                                row[idx] = 'null'
-                        except Exception:
-                            pass
-
-                validated_result = validate_result(
-                    parsed_result,
-                    job_settings.extract.schema_data,
-                    job_settings.extract.examples,
-                    job_settings.extract.key_columns,
-                    job_settings.target_type,
-                    verify_target=allow_verification,
-                    assume_water=job_settings.assume_water,
-                )
-
-                if validated_result:
-                    print("Validated result:")
-                    print(validated_result)
-
-                    paper_filename = os.path.splitext(os.path.basename(file))[0]
-
-                    # Filter results based on key columns.
-                    # Polymer identity depends on the full row (not just target column),
-                    # so skip key-based deduplication in polymer mode.
-                    if job_settings.extract.key_columns and job_settings.target_type != "polymer":
-                        key_values = set()
-                        filtered_result = []
-                        for row in validated_result:
-                            key = tuple(row[i - 1] for i in job_settings.extract.key_columns)
-                            if key not in key_values:
-                                key_values.add(key)
-                                filtered_result.append(row)
-                        validated_result = filtered_result
-
-                    # Add paper filename to each row
-                    for row in validated_result:
-                        row.append(paper_filename)
-
-                    # Write results to CSV
-                    write_to_csv(validated_result, job_settings.extract.headers, filename=job_settings.files.csv)
-
-                    success = True
-                else:
-                    print("Result failed to validate, trying again.")
-                    retry_count += 1
-
-            except ValueError as e:
-                print(f"Validation failed for {file}: {str(e)}")
-                retry_count += 1
-                print(f"Retrying ({retry_count}/{job_settings.extract.max_retries})...")
+    if job_settings.parse_workers > 1 and job_settings.extract.pipeline_workers is None:
+        parse_documents(
+            [os.path.join(os.getcwd(), 'scraped_docs', file) for file in files_to_process],
+            job_settings.use_hi_res,
+            job_settings.pdf_backend,
+            job_settings.parse_workers,
+            data._parse_budget(),
+        )
 
-            except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError) as e:
-                if isinstance(e, requests.exceptions.RequestException) and hasattr(e, "response") and e.response is not None:
-                    print(f"Ollama response:\n{e.response.text}")
-                print(f"Error processing {file}: {type(e).__name__} - {str(e)}")
-                retry_count += 1
-                print(f"Retrying ({retry_count}/{job_settings.extract.max_retries})...")
+    max_in_flight = max(1, job_settings.extract.max_in_flight)
+    if job_settings.extract.pipeline_workers is not None:
+        from src.pipeline import ExtractionPipeline
+        ExtractionPipeline(job_settings, job_settings.extract.pipeline_workers).run(files_to_process)
+    elif _phase_ordered(job_settings):
+        print(f"Running checks and extractions in phases of {job_settings.extract.phase_window} papers.")
+        _extract_in_check_windows(job_settings, data, files_to_process, max_in_flight, phase_ordered=True)
+    elif job_settings.extract.check_batch_size > 1 and not job_settings.skip_check:
+        _extract_in_check_windows(job_settings, data, files_to_process, max_in_flight)
+    else:
+        _for_each_file(job_settings, data, files_to_process, _process_file, max_in_flight)
 
-        if not success:
-            print(f"Failed to extract data from {file} after {job_settings.extract.max_retries} retries.")
-            failed_result = ["failed" for _ in range(job_settings.extract.num_columns)]
-            failed_result.append(os.path.splitext(os.path.basename(file))[0])
-            write_to_csv([failed_result], job_settings.extract.headers, filename=job_settings.files.csv)
+    # os.execl below skips exit handlers, so write the relevance statistics now.
+    save_relevance_stats()
 
     # If not in auto mode, restart the script
     if not job_settings.auto:
@@ -432,26 +1052,12 @@ def extract(file_path, job_settings:JobSettings):
     Returns:
     list or None: Validated results if successful, None if extraction fails.
     '''
-    data = PromptData(
-        model_name_version=job_settings.model_name_version,
-        check_model_name_version=job_settings.check_model_name_version,
-        use_openai=job_settings.use_openai,
-        api_key=job_settings.api_key,
-        use_hi_res=job_settings.use_hi_res,
-        use_multimodal=job_settings.use_multimodal,
-        use_thinking=job_settings.use_thinking,
-        use_decimer_segmentation=job_settings.use_decimer_segmentation,
-    )
+    data = _new_prompt_data(job_settings)
 
     # Prepare prompt data
     data._refresh_paper_content(
         file_path,
-        generate_prompt(
-            job_settings.extract.schema_data,
-            job_settings.extract.user_instructions,
-            job_settings.extract.key_columns,
-            job_settings.target_type,
-        ),
+        job_settings.extract.prompt,
         check_prompt=job_settings.check_prompt,
         check_only=not job_settings.skip_check,
     )
@@ -464,182 +1070,114 @@ def extract(file_path, job_settings:JobSettings):
         return validated_result
 
 
-def single_file_extract(job_settings: JobSettings, data: PromptData, file_path):
-    retry_count = 0
+def _extract_and_record(job_settings: JobSettings, file_path):
+    """
+    Run ``extract`` on a downloaded paper, recording a failed row if nothing validates.
+
+    Requests lost to an Ollama crash are resent by the server's supervisor. If the paper
+    still fails and the supervisor finds the local server down, it is restarted and the
+    paper retried once before giving up.
+    """
+    filename = os.path.basename(file_path)
+    restart_tries = 0
+    while restart_tries < 2:
+        try:
+            extracted_data = extract(file_path, job_settings)
+            if extracted_data:
+                print(f"Successfully extracted data from {filename}")
+            else:
+                print(f"Failed to extract data from {filename}")
+                _write_failed_row(job_settings, file_path)
+            return
+        except Exception as e:
+            supervisor = get_ollama_supervisor()
+            if (
+                not job_settings.use_openai
+                and isinstance(e, requests.exceptions.RequestException)
+                and supervisor.manages(job_settings.extract.ollama_url)
+                and supervisor.recover(supervisor.generation)
+            ):
+                restart_tries += 1
+                print(f"Ollama was restarted; retrying {filename}.")
+            else:
+                print(f"Error extracting data from {filename}: {e}")
+                return
+
+
+class ExtractionQueue():
+    """
+    Bounded work queue feeding downloaded papers to a pool of extraction workers.
+
+    Scrapers call ``submit`` as soon as a file is on disk and carry on downloading.
+    When extraction falls behind, ``submit`` blocks once ``max_size`` papers are
+    waiting, which throttles the scrapers instead of letting the backlog grow.
+    """
+    def __init__(self, job_settings: JobSettings, num_workers=1, max_size=2):
+        self.job_settings = job_settings
+        self.queue = queue.Queue(maxsize=max(1, max_size))
+        self.submitted = set()
+        self.lock = threading.Lock()
+        self.workers = []
+        for idx in range(max(1, num_workers)):
+            worker = threading.Thread(target=self._worker, name=f"extract-worker-{idx}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _worker(self):
+        while True:
+            file_path = self.queue.get()
+            try:
+                if file_path is None:
+                    return
+                _extract_and_record(self.job_settings, file_path)
+            finally:
+                self.queue.task_done()
 
+    def submit(self, file_path):
+        """Queue a paper for extraction, blocking while the queue is full."""
+        with self.lock:
+            if file_path in self.submitted:
+                return
+            self.submitted.add(file_path)
+        print(f"Queued {os.path.basename(file_path)} for extraction ({self.queue.qsize()} waiting)")
+        self.queue.put(file_path)
+
+    def close(self):
+        """Wait for every queued paper to finish, then stop the workers."""
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+def submit_for_extraction(job_settings: JobSettings, file_path):
+    """Hand a downloaded paper to the job's extraction queue, or extract it inline if there is none."""
+    if job_settings.extraction_queue is not None:
+        job_settings.extraction_queue.submit(file_path)
+    else:
+        _extract_and_record(job_settings, file_path)
+
+
+def single_file_extract(job_settings: JobSettings, data: PromptData, file_path):
+    first_attempt = None
     if job_settings.skip_check:
-        check_result = "yes"
         allow_verification = True
     else:
         # Use a check prompt to lower cost
-        check_response = requests.post(
-            f"{job_settings.extract.ollama_url}/api/generate", json=data.__check__()
-        )
-        check_response.raise_for_status()
-        check_result = check_response.json()["response"]
-        print(f"Check result was '{check_result}'")
-        allow_verification = str(check_result).strip().lower().startswith("yes")
+        allow_verification, first_attempt = _speculative_check(job_settings, data, file_path)
 
-    if allow_verification:
-        if not job_settings.skip_check:
-            data._refresh_paper_content(
-                file_path,
-                generate_prompt(
-                    job_settings.extract.schema_data,
-                    job_settings.extract.user_instructions,
-                    job_settings.extract.key_columns,
-                    job_settings.target_type,
-                ),
-                check_prompt=job_settings.check_prompt,
-                check_only=False,
-            )
-        if job_settings.use_decimer:
-            print("Attempting to pull SMILES from images in paper...")
-            new_text, locations = extract_smiles_for_paper(file_path, data.paper_content)
-            data.paper_content = new_text
-            base_prompt = generate_prompt(
-                job_settings.extract.schema_data,
-                job_settings.extract.user_instructions,
-                job_settings.extract.key_columns,
-                job_settings.target_type,
-            )
-            data.prompt = (
-                f"Paper Contents:\n{data.paper_content}\n\n{base_prompt}\n\nAgain, please make sure to respond only in the specified format exactly as described, or you will cause errors.\nResponse:"
-            )
-            if locations:
-                parts = []
-                for smi, snip in locations:
-                    snippet = snip.replace("\n", " ").strip()
-                    parts.append(f"{smi} -> '{snippet}'")
-                loc_str = "; ".join(parts)
-                print(f"Inserted SMILES with context: {loc_str}")
-        else:
-            print("DECIMER extraction disabled")
-    else:
-        print("No SMILES found")
+    if not allow_verification:
+        print(f"Check rejected {file_path}; skipping extraction.")
         data.images = []
         data.si_images = []
-    
-    while retry_count < job_settings.extract.max_retries:
-        data._refresh_data(retry_count)
-        try:
-            if check_result == "yes" or check_result == "Yes":
-                if job_settings.use_openai:
-                    client = OpenAI()
-                    parts = [{"type": "input_text", "text": data.prompt}]
-                    if job_settings.use_multimodal:
-                        for img in data.images + data.si_images:
-                            parts.append(
-                                {
-                                    "type": "input_image",
-                                    "image_url": f"data:image/png;base64,{img}",
-                                }
-                            )
-                    try:
-                        resp = client.responses.create(
-                            model=job_settings.model_name,
-                            input=[{"role": "user", "content": parts}],
-                        )
-                        result = resp.output_text
-                    except Exception as err:
-                        print(f"Responses endpoint failed: {err}. Falling back to chat completions.")
-                        content_parts = [{"type": "text", "text": data.prompt}]
-                        if job_settings.use_multimodal:
-                            for img in data.images + data.si_images:
-                                content_parts.append(
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {"url": f"data:image/png;base64,{img}"},
-                                    }
-                                )
-                        completion = client.chat.completions.create(
-                            model=job_settings.model_name,
-                            messages=[{"role": "user", "content": content_parts}],
-                        )
-                        result = completion.choices[0].message.content
-                else:
-                    # Use Ollama API
-                    response = requests.post(f"{job_settings.extract.ollama_url}/api/generate", json=data.__dict__())
-                    response.raise_for_status()
-                    result = response.json()["response"]
-            else:
-                result = ", ".join(["null" for _ in range(job_settings.extract.num_columns)])
-
-            print(f"Unparsed Result:\n{result}")
-
-            # Parse and validate the result
-            parsed_result = parse_llm_response(result, job_settings.extract.num_columns)
-            if not parsed_result:
-                print("Parsed Result empty, trying again")
-                retry_count += 1
-                continue
-            print(f"Parsed Result:\n{parsed_result}")
-
-            # Clean up 'null' values
-            for row in parsed_result:
-                for idx, item in enumerate(row):
-                    try:
-                        if any([
-                            item.lower().replace(" ", "") == 'null',
-                            item in ['', '""', "''"],
-                            item.strip().lower().replace('"', '').replace("'", "") == 'no information found'
-                        ]):
-                            row[idx] = 'null'
-                    except Exception:
-                        pass
-
-            validated_result = validate_result(
-                parsed_result,
-                job_settings.extract.schema_data,
-                job_settings.extract.examples,
-                job_settings.extract.key_columns,
-                job_settings.target_type,
-                verify_target=allow_verification,
-                assume_water=job_settings.assume_water,
-            )
-            print(f"Validated Result:\n{validated_result}")
-            if not validated_result:
-                print("Result failed to validate, trying again.")
-                retry_count += 1
-                continue
-
-            if validated_result:
-                # Filter results based on key columns.
-                # Polymer identity depends on the full row (not just target column),
-                # so skip key-based deduplication in polymer mode.
-                if job_settings.extract.key_columns and job_settings.target_type != "polymer":
-                    key_values = set()
-                    filtered_result = []
-                    for row in validated_result:
-                        key = tuple(row[i - 1] for i in job_settings.extract.key_columns)
-                        if key not in key_values:
-                            key_values.add(key)
-                            filtered_result.append(row)
-                    validated_result = filtered_result
-
-                # Add paper filename to each row
-                for row in validated_result:
-                    row.append(os.path.splitext(os.path.basename(file_path))[0])
-
-                # Write results to CSV
-                write_to_csv(validated_result, job_settings.extract.headers, filename=job_settings.files.csv)
-                return validated_result
+        return None
 
-        except Exception as e:
-            if isinstance(e, requests.exceptions.RequestException) and hasattr(e, "response") and e.response is not None:
-                print(f"Ollama response:\n{e.response.text}")
-            print(f"Error processing {file_path}: {type(e).__name__} - {str(e)}")
-            retry_count += 1
-            print(f"Retrying ({retry_count}/{job_settings.extract.max_retries})...")
-    return None
-    def resolve_paper_filename(paper_id):
-        candidates = [
-            f"{paper_id}.pdf",
-            f"{paper_id}.txt",
-            f"{paper_id}.xml",
-            paper_id,
-        ]
-        for cand in candidates:
-            if os.path.isfile(os.path.join(os.getcwd(), "scraped_docs", cand)):
-                return cand
-        return f"{paper_id}.pdf"
+    if not job_settings.skip_check and first_attempt is None:
+        data._refresh_paper_content(
+            file_path,
+            job_settings.extract.prompt,
+            check_prompt=job_settings.check_prompt,
+            check_only=False,
+        )
+    _prepare_extraction(job_settings, data, file_path)
+    return _extract_with_cascade(job_settings, data, file_path, allow_verification, first_attempt)
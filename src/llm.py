@@ -0,0 +1,142 @@
+import hashlib
+import requests
+from openai import OpenAI
+from src.utils import print  # Custom print function for logging
+from src.llm_cache import get_response_cache, response_cache_key
+from src.ollama_router import get_ollama_router
+from src.concurrency import get_concurrency_limiter, request_work
+from src.ollama_supervisor import get_ollama_supervisor
+
+
+# Number of leading prompt characters used to group requests for OpenAI prompt caching.
+# Prompts start with the paper text, so this identifies the paper being processed.
+PROMPT_CACHE_PREFIX_CHARS = 4096
+
+
+def _openai_generate(model, prompt, images=None, json_schema=None):
+    """
+    Send a prompt (and optional base64 images) to the OpenAI API.
+
+    The Responses endpoint is tried first; if it fails the request falls back to
+    chat completions so older models keep working. Requests for the same paper
+    share a ``prompt_cache_key`` so OpenAI routes them to the same prompt cache.
+    When ``json_schema`` is given the response is constrained with structured outputs.
+    """
+    images = images or []
+    cache_key = hashlib.sha1(prompt[:PROMPT_CACHE_PREFIX_CHARS].encode("utf-8")).hexdigest()
+    client = OpenAI()
+    parts = [{"type": "input_text", "text": prompt}]
+    for img in images:
+        parts.append({"type": "input_image", "image_url": f"data:image/png;base64,{img}"})
+    responses_kwargs = {}
+    chat_kwargs = {}
+    if json_schema is not None:
+        responses_kwargs["text"] = {
+            "format": {"type": "json_schema", "name": "extraction", "schema": json_schema, "strict": True}
+        }
+        chat_kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "extraction", "schema": json_schema, "strict": True},
+        }
+    try:
+        resp = client.responses.create(
+            model=model,
+            input=[{"role": "user", "content": parts}],
+            extra_body={"prompt_cache_key": cache_key},
+            **responses_kwargs,
+        )
+        return resp.output_text
+    except Exception as err:
+        print(f"Responses endpoint failed: {err}. Falling back to chat completions.")
+        content_parts = [{"type": "text", "text": prompt}]
+        for img in images:
+            content_parts.append(
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img}"}}
+            )
+        completion = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": content_parts}],
+            **chat_kwargs,
+        )
+        return completion.choices[0].message.content
+
+
+def _ollama_generate(ollama_url, payload):
+    """
+    POST a payload to the /api/generate endpoint of an Ollama server and return the response text.
+
+    ``ollama_url`` may be a list of servers, in which case the request is routed by
+    ``OllamaRouter``. If the local server crashed, it is restarted and the request resent
+    (see ``OllamaSupervisor.call``).
+    """
+    router = get_ollama_router(ollama_url)
+    response = get_ollama_supervisor().call(ollama_url, router.post, "/api/generate", payload)
+    return response.json()["response"]
+
+
+def unload_model(job_settings, model, ollama_url=None):
+    """Ask every Ollama server of the job to unload ``model`` right away (``keep_alive`` 0) to free its memory."""
+    for url in get_ollama_router(ollama_url or job_settings.extract.ollama_url).urls():
+        try:
+            response = requests.post(f"{url}/api/generate", json={"model": model, "keep_alive": 0})
+            response.raise_for_status()
+            print(f"Unloaded {model} from {url}")
+        except requests.exceptions.RequestException as err:
+            print(f"Unable to unload {model} from {url}: {err}")
+
+
+def generate(job_settings, payload, ollama_url=None, use_openai=None, attempt=0):
+    """
+    Run a single generation request against the backend configured for the job.
+
+    Responses are looked up in, and stored to, the job's response cache (if enabled),
+    so identical requests on a re-run are answered without calling the model. Retries
+    (``attempt`` above zero) bypass the cache, since they rely on sampling to get a
+    different answer than the attempts before them. With
+    ``extract.adaptive_concurrency`` set, requests wait for a slot of the backend's
+    ``AdaptiveLimiter``.
+
+    Args:
+    job_settings (JobSettings): Job settings, used to pick OpenAI or Ollama.
+    payload (dict): An Ollama style payload, as built by ``PromptData.__dict__``
+        or ``PromptData.__check__``.
+    ollama_url (str or list): Ollama server(s) to use; defaults to ``job_settings.extract.ollama_url``.
+    use_openai (bool): Backend for this request; defaults to ``job_settings.use_openai``.
+        Model cascades set it per tier.
+    attempt (int): Retry number of an extraction request; 0 for first attempts and all other requests.
+
+    Returns:
+    str: The raw text returned by the model.
+    """
+    if use_openai is None:
+        use_openai = job_settings.use_openai
+    if use_openai:
+        images = payload.get("images", []) if job_settings.use_multimodal else []
+        payload = dict(payload, images=images)
+
+    cache = get_response_cache(job_settings) if attempt == 0 else None
+    key = None
+    if cache is not None:
+        key = response_cache_key("openai" if use_openai else "ollama", payload)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    ollama_url = ollama_url or job_settings.extract.ollama_url
+    limiter = get_concurrency_limiter(job_settings, "openai" if use_openai else ollama_url)
+    started = limiter.acquire() if limiter is not None else None
+    kind = (payload.get("model"), payload.get("options", {}).get("num_predict"))
+    try:
+        if use_openai:
+            response = _openai_generate(payload["model"], payload["prompt"], payload["images"], payload.get("format"))
+        else:
+            response = _ollama_generate(ollama_url, payload)
+    except Exception as err:
+        if limiter is not None:
+            limiter.release(started, kind, err)
+        raise
+    if limiter is not None:
+        limiter.release(started, kind, work=request_work(payload.get("prompt"), response))
+    if cache is not None and response is not None:
+        cache.put(key, payload.get("model", ""), response)
+    return response
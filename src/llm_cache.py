@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from src.utils import print  # Custom print function for logging
+
+# Default location and size limit of the on-disk response cache.
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), 'llm_cache', 'responses.sqlite')
+DEFAULT_CACHE_MB = 1024
+# When the cache grows past its limit, least recently used entries are removed until
+# it is back under this fraction of the limit, so eviction does not run on every write.
+EVICTION_TARGET = 0.9
+
+# Payload fields that do not change what the model answers.
+_IGNORED_FIELDS = {"stream", "keep_alive"}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def response_cache_key(backend, payload):
+    """
+    Compute the cache key for a generation request.
+
+    Args:
+    backend (str): "ollama" or "openai".
+    payload (dict): The Ollama style payload sent to ``src.llm.generate``.
+
+    Returns:
+    str: A SHA-256 hex digest of the model, options, prompt and image digests.
+    """
+    fields = {k: v for k, v in payload.items() if k not in _IGNORED_FIELDS and k != "images"}
+    fields["backend"] = backend
+    fields["images"] = [hashlib.sha256(str(img).encode("utf-8")).hexdigest() for img in payload.get("images") or []]
+    blob = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache():
+    """
+    A content-addressed SQLite store of model responses.
+
+    Entries are keyed by ``response_cache_key`` and evicted least recently used first once
+    the stored responses exceed ``max_mb``. One connection is shared by all threads of a
+    process and guarded by a lock; separate processes rely on SQLite's own file locking.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_mb=DEFAULT_CACHE_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None if it is not cached."""
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, model, response):
+        """Store a response and evict old entries if the cache is over its size limit."""
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self.conn.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICTION_TARGET)
+        removed = 0
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        self.conn.commit()
+        print(f"Response cache over {self.max_bytes // (1024 * 1024)} MB; evicted {removed} entries.")
+
+
+def get_response_cache(job_settings):
+    """
+    Return the process-wide ResponseCache for a job, or None if caching is disabled.
+
+    The cache lives in a module-level registry rather than on ``job_settings`` so the
+    settings object stays picklable for worker processes.
+    """
+    if not job_settings.response_cache:
+        return None
+    path = job_settings.response_cache_path or DEFAULT_CACHE_PATH
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path, job_settings.response_cache_mb)
+            _caches[path] = cache
+            print(f"Using LLM response cache at {path}")
+        return cache
@@ -0,0 +1,147 @@
+import threading
+import requests
+from src.utils import print  # Custom print function for logging
+
+# Seconds between /api/tags probes of every endpoint.
+PROBE_INTERVAL = 30
+PROBE_TIMEOUT = 5
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def as_url_list(ollama_url):
+    """Return the Ollama endpoints of an ``ollama_url`` setting, which is a URL or a list of URLs."""
+    if isinstance(ollama_url, (list, tuple)):
+        urls = [str(url).strip().rstrip("/") for url in ollama_url]
+    else:
+        urls = [str(ollama_url).strip().rstrip("/")]
+    return [url for url in urls if url]
+
+
+class OllamaEndpoint():
+    """Routing state of one Ollama server."""
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        # Models reported by /api/tags, or None before the first successful probe.
+        self.models = None
+
+
+class OllamaRouter():
+    """
+    Client-side router spreading requests over several Ollama servers.
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests among
+    those that have the model. Endpoints are probed with ``/api/tags`` every
+    ``PROBE_INTERVAL`` seconds on a background thread. An endpoint that fails to connect or
+    answers with a server error is marked unhealthy until its next successful probe, and
+    the request is retried on the next endpoint.
+    """
+    def __init__(self, urls):
+        self.endpoints = [OllamaEndpoint(url) for url in urls]
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        if len(self.endpoints) > 1:
+            self.probe()
+            threading.Thread(target=self._probe_loop, name="ollama-router-probe", daemon=True).start()
+
+    def _probe_loop(self):
+        while not self.stop_event.wait(PROBE_INTERVAL):
+            self.probe()
+
+    def probe(self):
+        """Refresh the health and model list of every endpoint."""
+        for endpoint in self.endpoints:
+            try:
+                response = requests.get(f"{endpoint.url}/api/tags", timeout=PROBE_TIMEOUT)
+                response.raise_for_status()
+                models = set()
+                for model in response.json().get("models", []):
+                    name = model.get("name") or model.get("model")
+                    if name:
+                        models.add(name)
+                        if name.endswith(":latest"):
+                            models.add(name[:-len(":latest")])
+                healthy = True
+            except (requests.exceptions.RequestException, ValueError) as err:
+                models = None
+                healthy = False
+                if endpoint.healthy:
+                    print(f"Ollama endpoint {endpoint.url} failed its health probe: {err}")
+            with self.lock:
+                if healthy and not endpoint.healthy:
+                    print(f"Ollama endpoint {endpoint.url} is healthy again.")
+                endpoint.healthy = healthy
+                if models is not None:
+                    endpoint.models = models
+
+    def _choose(self, model, tried):
+        """Pick the least loaded endpoint for ``model``, preferring healthy ones that have it."""
+        candidates = [e for e in self.endpoints if e not in tried]
+        if not candidates:
+            return None
+        for prefer in (
+            lambda e: e.healthy and (e.models is None or model is None or model in e.models),
+            lambda e: e.healthy,
+            lambda e: True,
+        ):
+            preferred = [e for e in candidates if prefer(e)]
+            if preferred:
+                return min(preferred, key=lambda e: e.outstanding)
+
+    def post(self, path, payload):
+        """
+        POST ``payload`` to ``path`` on the best endpoint, failing over to the others.
+
+        Returns:
+        requests.Response: The first response that was not a server error.
+        """
+        model = payload.get("model")
+        tried = []
+        last_error = None
+        while True:
+            with self.lock:
+                endpoint = self._choose(model, tried)
+                if endpoint is None:
+                    raise last_error
+                endpoint.outstanding += 1
+            tried.append(endpoint)
+            try:
+                response = requests.post(f"{endpoint.url}{path}", json=payload)
+                if response.status_code == 404 and model is not None and endpoint.models is not None:
+                    with self.lock:
+                        endpoint.models.discard(model)
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as err:
+                last_error = err
+                status = err.response.status_code if getattr(err, "response", None) is not None else None
+                if status is not None and status < 500 and status != 404:
+                    raise
+                if status is None or status >= 500:
+                    with self.lock:
+                        endpoint.healthy = False
+                if len(tried) < len(self.endpoints):
+                    print(f"Ollama endpoint {endpoint.url} failed ({err}); trying another endpoint.")
+            finally:
+                with self.lock:
+                    endpoint.outstanding -= 1
+
+    def urls(self):
+        """Return the URLs of all endpoints."""
+        return [endpoint.url for endpoint in self.endpoints]
+
+
+def get_ollama_router(ollama_url):
+    """Return the OllamaRouter for an ``ollama_url`` setting, creating it on first use."""
+    urls = tuple(as_url_list(ollama_url)) or ("http://localhost:11434",)
+    with _routers_lock:
+        router = _routers.get(urls)
+        if router is None:
+            router = OllamaRouter(urls)
+            _routers[urls] = router
+            if len(urls) > 1:
+                print(f"Routing Ollama requests over {len(urls)} endpoints: {', '.join(urls)}")
+        return router
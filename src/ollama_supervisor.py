@@ -0,0 +1,179 @@
+import os
+import time
+import random
+import shutil
+import threading
+import subprocess
+import requests
+from src.utils import print, download_ollama  # Custom print function for logging
+
+LOCAL_OLLAMA_URL = "http://localhost:11434"
+# Readiness probing: first delay, largest delay and total time to wait for the server.
+READY_FIRST_DELAY = 0.25
+READY_MAX_DELAY = 4
+READY_TIMEOUT = 180
+# Restart backoff: base delay, doubled per consecutive restart up to the maximum, with +/-50% jitter.
+RESTART_BASE_DELAY = 2
+RESTART_MAX_DELAY = 60
+# A restart more than this many seconds after the previous one resets the backoff.
+RESTART_RESET_AFTER = 600
+# How often a request is resent after the server was recovered.
+MAX_REQUEUES = 2
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+
+def _is_local(url):
+    return any(host in str(url) for host in ("localhost", "127.0.0.1", "0.0.0.0"))
+
+
+class OllamaSupervisor():
+    """
+    Owns the local Ollama server process.
+
+    ``ensure_running`` starts the server if nothing answers on the local port and waits for
+    it to become ready, so work is never dispatched to a server that is still starting.
+    Crashes are detected from the process exiting (or the server no longer answering), and
+    ``recover`` restarts it with jittered exponential backoff. Only one thread restarts the
+    server; the others wait and then resend their request. Models loaded with ``warm_up``
+    are loaded again after a restart.
+    """
+    def __init__(self, url=LOCAL_OLLAMA_URL):
+        self.url = url
+        self.process = None
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.last_restart = 0.0
+        # Bumped on every (re)start, so threads can tell whether someone else already recovered.
+        self.generation = 0
+        self.warm_models = {}
+
+    def is_ready(self):
+        """Return True if the server answers its root endpoint."""
+        try:
+            return requests.get(self.url, timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def crashed(self):
+        """Return True if the server process started by the supervisor has exited."""
+        return self.process is not None and self.process.poll() is not None
+
+    def _start(self):
+        if not os.path.isfile('ollama') and shutil.which("ollama") is None:
+            print("ollama binary not found. Downloading the latest release...")
+            download_ollama()
+        command = ["./ollama", "serve"] if os.path.isfile('ollama') else ["ollama", "serve"]
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        self.generation += 1
+        print(f"Started Ollama server (pid {self.process.pid}).")
+
+    def _wait_ready(self):
+        delay = READY_FIRST_DELAY
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.is_ready():
+                return True
+            if self.crashed():
+                print(f"Ollama server exited with code {self.process.returncode} while starting.")
+                return False
+            time.sleep(delay)
+            delay = min(READY_MAX_DELAY, delay * 2)
+        print(f"Ollama server did not become ready within {READY_TIMEOUT} seconds.")
+        return False
+
+    def ensure_running(self):
+        """Start the server if it is not answering and wait until it is ready."""
+        with self.lock:
+            if self.is_ready():
+                print("Ollama is running.")
+                return True
+            if self.process is None or self.crashed():
+                self._start()
+            return self._wait_ready()
+
+    def warm_up(self, model, keep_alive=None):
+        """Load ``model`` with an empty request so the first real request does not pay for the load."""
+        payload = {"model": model}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        self.warm_models[model] = keep_alive
+        try:
+            response = requests.post(f"{self.url}/api/generate", json=payload)
+            response.raise_for_status()
+            print(f"Loaded {model} into Ollama.")
+        except requests.exceptions.RequestException as err:
+            print(f"Unable to warm up {model}: {err}")
+
+    def manages(self, ollama_url):
+        """Return True if requests to ``ollama_url`` go to the local server this supervisor owns."""
+        urls = ollama_url if isinstance(ollama_url, (list, tuple)) else [ollama_url]
+        return any(_is_local(url) for url in urls)
+
+    def recover(self, generation):
+        """
+        Restart the server after a failed request, unless it is healthy or was already restarted.
+
+        Args:
+        generation (int): ``self.generation`` as read before the failed request was sent.
+
+        Returns:
+        bool: True if the server is ready and the request should be resent.
+        """
+        with self.lock:
+            if self.generation != generation:
+                # Another thread restarted the server while this request was failing.
+                return self.is_ready()
+            if not self.crashed() and self.is_ready():
+                return False
+            now = time.monotonic()
+            if now - self.last_restart > RESTART_RESET_AFTER:
+                self.restarts = 0
+            delay = min(RESTART_MAX_DELAY, RESTART_BASE_DELAY * 2 ** self.restarts) * random.uniform(0.5, 1.5)
+            self.restarts += 1
+            self.last_restart = now
+            if self.crashed():
+                print(f"Ollama server exited with code {self.process.returncode}; restarting in {delay:.1f}s.")
+            else:
+                print(f"Ollama server stopped answering; restarting in {delay:.1f}s.")
+                if self.process is not None:
+                    self.process.kill()
+                    self.process.wait()
+            time.sleep(delay)
+            self._start()
+            if not self._wait_ready():
+                return False
+        for model, keep_alive in list(self.warm_models.items()):
+            self.warm_up(model, keep_alive)
+        return True
+
+    def call(self, ollama_url, func, *args):
+        """
+        Run a request against the server, resending it after a crash-triggered restart.
+
+        Requests to remote servers, and failures other than dropped connections and server
+        errors, are passed through unchanged.
+        """
+        requeues = 0
+        while True:
+            generation = self.generation
+            try:
+                return func(*args)
+            except requests.exceptions.RequestException as err:
+                status = err.response.status_code if getattr(err, "response", None) is not None else None
+                if not self.manages(ollama_url) or (status is not None and status < 500) or requeues >= MAX_REQUEUES:
+                    raise
+                if not self.recover(generation):
+                    raise
+                requeues += 1
+                print(f"Resending request after Ollama recovered ({requeues}/{MAX_REQUEUES}).")
+
+
+def get_ollama_supervisor():
+    """Return the process-wide OllamaSupervisor."""
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = OllamaSupervisor()
+        return _supervisor
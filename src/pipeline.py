@@ -0,0 +1,299 @@
+import os
+import time
+import queue
+import builtins
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from src.classes import JobSettings
+from src.document_reader import doc_to_elements, init_parse_worker
+from src.extract import (
+    RowAccumulator,
+    _extraction_tiers,
+    _tier_prompt_data,
+    _new_prompt_data,
+    _check_paper,
+    _prepare_extraction,
+    _generate_attempt,
+    _parallel_retry_round,
+    _repair_attempt,
+    _should_repair,
+    _validate_attempt,
+    _record_rows,
+    _report_attempt_error,
+    _write_failed_row,
+)
+from src.run_report import get_run_report
+from src.utils import print  # Custom print function for logging
+
+# Order in which a paper moves through the pipeline, and the default worker count per stage.
+STAGE_ORDER = ["parse", "check", "decimer", "extract", "validate", "write"]
+DEFAULT_STAGE_WORKERS = {
+    "parse": 2,
+    "check": 1,
+    "decimer": 1,
+    "extract": 1,
+    "validate": 2,
+    "write": 1,
+}
+# Seconds between queue depth reports in the log.
+QUEUE_LOG_INTERVAL = 30
+
+
+class PaperTask():
+    """A paper travelling through the pipeline, together with its per-paper state."""
+    def __init__(self, file, data, accumulator):
+        self.file = file
+        self.data = data
+        self.accumulator = accumulator
+        self.tier_index = 0
+        self.extract_data = data
+        self.allow_verification = True
+        self.retry_count = 0
+        self.repairing = False
+        self.result = None
+
+
+class Stage():
+    """A named pipeline stage: an unbounded input queue served by a fixed number of worker threads."""
+    def __init__(self, name, func, workers):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue()
+        self.busy = 0
+        self.processed = 0
+        self.lock = threading.Lock()
+
+
+class ExtractionPipeline():
+    """
+    Run the per-paper extraction chain as a set of stages with their own worker pools.
+
+    Each paper moves through parse -> check -> decimer -> extract -> validate -> write.
+    PDF/XML parsing runs in a process pool; the other stages run on threads because they
+    mostly wait on subprocesses, the model server or validation lookups. Failed attempts
+    go from ``validate`` back to ``extract``, first for a reformat of the bad response and
+    then for a full retry, until ``max_retries`` is exhausted.
+
+    The number of papers in the pipeline at once is capped by a pool of PromptData
+    objects, so a slow stage lets its queue grow only up to that cap and every other stage
+    stays busy.
+    """
+    def __init__(self, job_settings: JobSettings, stage_workers=None):
+        self.job_settings = job_settings
+        workers = dict(DEFAULT_STAGE_WORKERS)
+        workers.update(stage_workers or {})
+        workers["write"] = 1  # CSV appends are kept in order by a single writer.
+        self.stages = {
+            "parse": Stage("parse", self._parse, workers["parse"]),
+            "check": Stage("check", self._check, workers["check"]),
+            "decimer": Stage("decimer", self._decimer, workers["decimer"]),
+            "extract": Stage("extract", self._extract, workers["extract"]),
+            "validate": Stage("validate", self._validate, workers["validate"]),
+            "write": Stage("write", self._write, workers["write"]),
+        }
+        self.capacity = sum(stage.workers for stage in self.stages.values()) + job_settings.extract.max_in_flight
+        self.free_data = queue.Queue()
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.all_done = threading.Event()
+        self.process_pool = None
+
+    # Stage functions. Each returns the name of the next stage, or None once the paper is finished.
+
+    def _parse(self, task):
+        file_path = os.path.join(os.getcwd(), 'scraped_docs', task.file)
+        check_only = not self.job_settings.skip_check
+        try:
+            # Parse in a separate process with the flags of the load below (images too, when
+            # there is no check), and hand the text over so the document is parsed once.
+            content = self.process_pool.submit(
+                doc_to_elements,
+                file_path,
+                self.job_settings.use_hi_res,
+                task.data.use_multimodal and not check_only,
+                self.job_settings.pdf_backend,
+                task.data._parse_budget(),
+            ).result()
+        except Exception as err:
+            print(f"Unable to process {task.file} into plaintext due to {err}")
+            return None
+        if task.data._refresh_paper_content(
+            task.file,
+            self.job_settings.extract.prompt,
+            self.job_settings.check_prompt,
+            check_only=check_only,
+            content=content,
+        ):
+            return None
+        return "check"
+
+    def _check(self, task):
+        if self.job_settings.skip_check:
+            return "decimer"
+        task.allow_verification = _check_paper(self.job_settings, task.data, task.file)
+        if not task.allow_verification:
+            print(f"Check rejected {task.file}; skipping extraction.")
+            return "write"
+        task.data._refresh_paper_content(
+            task.file,
+            self.job_settings.extract.prompt,
+            self.job_settings.check_prompt,
+            check_only=False,
+        )
+        return "decimer"
+
+    def _decimer(self, task):
+        _prepare_extraction(self.job_settings, task.data, task.file)
+        task.extract_data = _tier_prompt_data(self.job_settings, task.data, task.tier_index)
+        return "extract"
+
+    def _extract(self, task):
+        if task.retry_count > 0 and not task.repairing and self.job_settings.extract.parallel_retries > 1:
+            return self._parallel_retries(task)
+        try:
+            if task.repairing:
+                task.result = _repair_attempt(self.job_settings, task.extract_data, task.result)
+            else:
+                task.result = _generate_attempt(self.job_settings, task.extract_data, task.retry_count)
+        except Exception as e:
+            _report_attempt_error(task.file, e)
+            return self._retry(task)
+        return "validate"
+
+    def _validate(self, task):
+        try:
+            rows, rejected = _validate_attempt(self.job_settings, task.result, task.allow_verification)
+        except Exception as e:
+            _report_attempt_error(task.file, e)
+            rows, rejected = [], 0
+        if not rows and not task.repairing and _should_repair(self.job_settings, task.result):
+            # Send the bad response back for a reformat before paying for another full extraction.
+            task.repairing = True
+            return "extract"
+        added = task.accumulator.add(rows)
+        if task.accumulator.is_done(rejected, task.retry_count, added):
+            return self._tier_finished(task)
+        return self._retry(task)
+
+    def _parallel_retries(self, task):
+        # Samples are validated inside the round, so the paper skips the validate stage.
+        used, done = _parallel_retry_round(
+            self.job_settings, task.extract_data, task.file, task.accumulator, task.retry_count, task.allow_verification
+        )
+        task.retry_count += used
+        if done or task.retry_count >= self.job_settings.extract.max_retries:
+            return self._tier_finished(task)
+        print(f"Retrying {task.file} ({task.retry_count}/{self.job_settings.extract.max_retries})...")
+        return "extract"
+
+    def _retry(self, task):
+        task.repairing = False
+        task.retry_count += 1
+        if task.retry_count < self.job_settings.extract.max_retries:
+            print(f"Retrying {task.file} ({task.retry_count}/{self.job_settings.extract.max_retries})...")
+            return "extract"
+        return self._tier_finished(task)
+
+    def _tier_finished(self, task):
+        # Record the outcome of the current model tier and escalate to the next one if nothing validated.
+        tiers = _extraction_tiers(self.job_settings)
+        succeeded = bool(task.accumulator.rows)
+        get_run_report(self.job_settings).record_tier(task.tier_index, tiers[task.tier_index]["model"], succeeded)
+        if succeeded or task.tier_index + 1 >= len(tiers):
+            return "write"
+        task.tier_index += 1
+        task.retry_count = 0
+        task.repairing = False
+        task.extract_data = _tier_prompt_data(self.job_settings, task.data, task.tier_index)
+        print(f"Escalating {task.file} to model tier {task.tier_index + 1}/{len(tiers)} ({tiers[task.tier_index]['model']})")
+        return "extract"
+
+    def _write(self, task):
+        if task.accumulator.rows:
+            _record_rows(self.job_settings, task.accumulator.rows, task.file)
+        else:
+            print(f"Failed to extract data from {task.file} after {self.job_settings.extract.max_retries} retries.")
+            _write_failed_row(self.job_settings, task.file)
+        return None
+
+    # Plumbing.
+
+    def _finish(self, task):
+        self.free_data.put(task.data)
+        with self.pending_lock:
+            self.pending -= 1
+            if self.pending == 0:
+                self.all_done.set()
+
+    def _worker(self, stage):
+        while True:
+            task = stage.queue.get()
+            if task is None:
+                return
+            with stage.lock:
+                stage.busy += 1
+            try:
+                next_stage = stage.func(task)
+            except Exception as err:
+                print(f"Pipeline stage '{stage.name}' failed on {task.file}: {type(err).__name__} - {err}")
+                next_stage = "write" if stage.name != "write" else None
+            finally:
+                with stage.lock:
+                    stage.busy -= 1
+                    stage.processed += 1
+            if next_stage is None:
+                self._finish(task)
+            else:
+                self.stages[next_stage].queue.put(task)
+
+    def _log_queues(self):
+        while not self.all_done.wait(QUEUE_LOG_INTERVAL):
+            print("Pipeline queues: " + self.queue_summary())
+
+    def queue_summary(self):
+        """Return a one-line summary of queue depth, busy workers and throughput per stage."""
+        parts = []
+        for name in STAGE_ORDER:
+            stage = self.stages[name]
+            parts.append(f"{name}[queued={stage.queue.qsize()} busy={stage.busy}/{stage.workers} done={stage.processed}]")
+        return ", ".join(parts)
+
+    def run(self, files):
+        """Push every file through the pipeline and block until all of them are recorded."""
+        if not files:
+            return
+        print("Pipeline workers: " + ", ".join(f"{name}={self.stages[name].workers}" for name in STAGE_ORDER))
+        for _ in range(min(self.capacity, len(files))):
+            self.free_data.put(_new_prompt_data(self.job_settings))
+
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=self.stages["parse"].workers,
+            initializer=init_parse_worker,
+            initargs=(builtins.a,),
+        )
+        threads = []
+        for stage in self.stages.values():
+            for idx in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage,), name=f"{stage.name}-{idx}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        monitor = threading.Thread(target=self._log_queues, name="pipeline-monitor", daemon=True)
+        monitor.start()
+
+        start = time.time()
+        with self.pending_lock:
+            self.pending = len(files)
+        for file in files:
+            # Blocks until a paper leaves the pipeline and frees its PromptData.
+            data = self.free_data.get()
+            self.stages["parse"].queue.put(PaperTask(file, data, RowAccumulator(self.job_settings)))
+        self.all_done.wait()
+
+        for stage in self.stages.values():
+            for _ in range(stage.workers):
+                stage.queue.put(None)
+        for thread in threads:
+            thread.join()
+        self.process_pool.shutdown()
+        print(f"Pipeline finished {len(files)} papers in {time.time() - start:.1f}s: {self.queue_summary()}")
@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import math
+import atexit
+import hashlib
+import threading
+from src.utils import print  # Custom print function for logging
+
+# BM25 parameters.
+BM25_K1 = 1.5
+BM25_B = 0.75
+# IDF values are unreliable until enough documents have been seen, so no paper is
+# rejected before this many documents are in the statistics.
+MIN_DOCS_FOR_GATE = 20
+# How often (in papers) the score distribution is written to the log.
+LOG_EVERY = 25
+# How often (in newly counted papers) the statistics are written to disk.
+SAVE_EVERY = 25
+DEFAULT_STATS_PATH = os.path.join(os.getcwd(), 'processed_docs', 'relevance_stats.json')
+
+# Words that say nothing about what a schema is looking for.
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "with", "from", "this", "that", "these", "those",
+    "into", "onto", "than", "then", "there", "their", "they", "them", "which", "while", "where",
+    "when", "what", "who", "whom", "whose", "will", "would", "should", "could", "can", "may",
+    "might", "must", "has", "have", "had", "not", "but", "all", "any", "each", "per", "such",
+    "its", "our", "your", "you", "use", "used", "using", "also", "only", "other", "more", "most",
+    "some", "about", "between", "within", "without", "over", "under", "after", "before",
+    "column", "columns", "value", "values", "paper", "papers", "information", "extract",
+    "extracted", "extraction", "null", "example", "string", "name", "names", "here", "explain",
+    "task", "data", "provide", "given", "found", "please", "number", "type", "description",
+}
+
+_scorers = {}
+_scorers_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lower-case ``text`` and split it into alphanumeric terms, folding simple plurals."""
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", str(text).lower()):
+        if len(term) > 4 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def build_query_terms(job_settings):
+    """
+    Collect the terms describing what a job is looking for.
+
+    The terms come from the schema column names and descriptions, ``user_instructions``
+    and the search terms. Stopwords, numbers and very short tokens are dropped.
+    """
+    parts = [job_settings.extract.user_instructions]
+    parts.extend(job_settings.def_search_terms)
+    parts.extend(job_settings.maybe_search_terms)
+    for column_data in (job_settings.extract.schema_data or {}).values():
+        parts.append(str(column_data.get("name", "")).replace("_", " "))
+        parts.append(column_data.get("description", ""))
+    terms = set()
+    for part in parts:
+        for term in tokenize(part):
+            if len(term) >= 3 and not term.isdigit() and term not in STOPWORDS:
+                terms.add(term)
+    return sorted(terms)
+
+
+class RelevanceScorer():
+    """
+    Score processed papers against the job's query terms with BM25.
+
+    Document frequencies are only kept for the query terms and are updated online with
+    every newly seen paper. They are stored on disk per set of query terms together with
+    the ids of the papers already counted, so IDF values carry over between runs of the
+    same job without a re-run counting its papers twice.
+    """
+    def __init__(self, query_terms, stats_path=DEFAULT_STATS_PATH):
+        self.query_terms = list(query_terms)
+        self.stats_path = stats_path
+        self.stats_key = hashlib.sha1(",".join(self.query_terms).encode("utf-8")).hexdigest()
+        self.lock = threading.Lock()
+        self.num_docs = 0
+        self.total_length = 0
+        self.doc_freq = {term: 0 for term in self.query_terms}
+        self.seen_docs = set()
+        self.unsaved = 0
+        self.scores = []
+        self.rejected = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r") as f:
+                stats = json.load(f).get(self.stats_key)
+        except (OSError, ValueError) as err:
+            print(f"Unable to read relevance statistics from {self.stats_path}: {err}")
+            return
+        if stats:
+            self.num_docs = stats["num_docs"]
+            self.total_length = stats["total_length"]
+            self.doc_freq.update(stats["doc_freq"])
+            self.seen_docs = set(stats.get("docs", []))
+
+    def _save(self):
+        all_stats = {}
+        if os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path, "r") as f:
+                    all_stats = json.load(f)
+            except (OSError, ValueError):
+                all_stats = {}
+        all_stats[self.stats_key] = {
+            "num_docs": self.num_docs,
+            "total_length": self.total_length,
+            "doc_freq": self.doc_freq,
+            "docs": sorted(self.seen_docs),
+        }
+        os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+        tmp_path = f"{self.stats_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(all_stats, f)
+        os.replace(tmp_path, self.stats_path)
+        self.unsaved = 0
+
+    def save(self):
+        """Write the statistics to disk if papers were counted since the last save."""
+        with self.lock:
+            if self.unsaved:
+                self._save()
+
+    def score(self, text, doc_id):
+        """
+        Return the BM25 score of a document for the query terms.
+
+        The document is added to the statistics the first time ``doc_id`` is seen; papers
+        scored again (in this run or a later one) are scored without being counted twice.
+        The statistics are written to disk every ``SAVE_EVERY`` newly counted papers.
+
+        Args:
+        text (str): The document text.
+        doc_id (str): A stable id for the document, such as the paper id.
+
+        Returns:
+        float: The BM25 score.
+        """
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            if term in self.doc_freq:
+                counts[term] = counts.get(term, 0) + 1
+        with self.lock:
+            if doc_id not in self.seen_docs:
+                self.seen_docs.add(doc_id)
+                self.num_docs += 1
+                self.total_length += len(terms)
+                for term in counts:
+                    self.doc_freq[term] += 1
+                self.unsaved += 1
+            avg_length = self.total_length / self.num_docs if self.num_docs else 1
+            score = 0.0
+            for term, tf in counts.items():
+                df = self.doc_freq[term]
+                idf = math.log((self.num_docs - df + 0.5) / (df + 0.5) + 1)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / max(avg_length, 1))
+                score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            self.scores.append(score)
+            if self.unsaved >= SAVE_EVERY:
+                self._save()
+        return score
+
+    def record_rejection(self):
+        """Count a paper rejected by the gate."""
+        with self.lock:
+            self.rejected += 1
+
+    def gate_ready(self):
+        """Return True once enough documents have been seen for scores to be trusted."""
+        return self.num_docs >= MIN_DOCS_FOR_GATE
+
+    def distribution(self):
+        """Return min, quartiles, 10th/90th percentiles and max of the scores seen this run."""
+        with self.lock:
+            scores = sorted(self.scores)
+        if not scores:
+            return {}
+
+        def percentile(p):
+            return round(scores[min(len(scores) - 1, int(p * len(scores)))], 3)
+
+        return {
+            "papers": len(scores),
+            "rejected": self.rejected,
+            "min": round(scores[0], 3),
+            "p10": percentile(0.10),
+            "p25": percentile(0.25),
+            "median": percentile(0.50),
+            "p75": percentile(0.75),
+            "p90": percentile(0.90),
+            "max": round(scores[-1], 3),
+        }
+
+
+def get_relevance_scorer(job_settings):
+    """Return the process-wide RelevanceScorer for the job's query terms, creating it on first use."""
+    query_terms = build_query_terms(job_settings)
+    key = ",".join(query_terms)
+    with _scorers_lock:
+        scorer = _scorers.get(key)
+        if scorer is None:
+            scorer = RelevanceScorer(query_terms)
+            _scorers[key] = scorer
+            atexit.register(scorer.save)
+            print(f"Relevance gate query terms: {', '.join(query_terms)}")
+        return scorer
+
+
+def save_relevance_stats():
+    """Write the statistics of every relevance scorer in use to disk."""
+    with _scorers_lock:
+        scorers = list(_scorers.values())
+    for scorer in scorers:
+        scorer.save()
@@ -0,0 +1,71 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+_reports = {}
+_reports_lock = threading.Lock()
+
+
+class RunReport():
+    """
+    Per-run extraction statistics, written as JSON next to the results CSV.
+
+    The report is rewritten after every update so it stays useful if the run is
+    interrupted. All methods are safe to call from several extraction threads.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.tiers = {}
+        self.sections = {}
+        self.lock = threading.Lock()
+
+    def record_tier(self, tier_index, model, succeeded):
+        """Count one paper attempted by a cascade tier, and whether it produced validated rows."""
+        with self.lock:
+            stats = self.tiers.setdefault(tier_index, {"model": model, "attempted": 0, "succeeded": 0})
+            stats["attempted"] += 1
+            if succeeded:
+                stats["succeeded"] += 1
+            self._write()
+
+    def update_section(self, name, values):
+        """Replace a named section of the report, e.g. the relevance score distribution."""
+        with self.lock:
+            self.sections[name] = values
+            self._write()
+
+    def summary(self):
+        """Return the report contents as a dict."""
+        tiers = []
+        for tier_index in sorted(self.tiers):
+            stats = dict(self.tiers[tier_index])
+            stats["tier"] = tier_index + 1
+            stats["success_rate"] = round(stats["succeeded"] / stats["attempted"], 4) if stats["attempted"] else None
+            tiers.append(stats)
+        summary = {
+            "started": self.started,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "tiers": tiers,
+        }
+        summary.update(self.sections)
+        return summary
+
+    def _write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def get_run_report(job_settings):
+    """Return the RunReport for the job's results CSV, creating it on first use."""
+    path = f"{os.path.splitext(job_settings.files.csv)[0]}_report.json"
+    with _reports_lock:
+        report = _reports.get(path)
+        if report is None:
+            report = RunReport(path)
+            _reports[path] = report
+        return report
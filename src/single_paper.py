@@ -1,10 +1,9 @@
-import subprocess
 import sys
 import os
 import csv
-import requests
-from src.utils import download_ollama
+from src.utils import begin_ollama_server
 from src.classes import JobSettings
+from src.extract import ExtractionQueue
 from itertools import combinations
 
 # URLs for PubMed Central API
@@ -41,33 +40,9 @@ def scrape_and_extract_concurrent(job_settings: JobSettings):
     output_dir = os.path.join(os.getcwd(), 'results')
     os.makedirs(output_dir, exist_ok=True)
     
-    # Ping ollama port to see if it is running
-    try:
-        response = requests.get("http://localhost:11434")
-
-    except Exception:
-        try:
-            response.status_code = 404
-        except Exception:
-            is_ollama_running = False
-        
-    # If so, cool, if not, start it!
-    try:
-        if response.status_code == 200:
-            is_ollama_running = True
-        else:
-            is_ollama_running = False
-    except Exception:
-        is_ollama_running = False
-
-    # Check for Ollama binary and start server if not running
-    if not is_ollama_running:
-        if not os.path.isfile('ollama'):
-            print("ollama binary not found. Downloading the latest release...")
-            download_ollama()
-
-        # Start Ollama server
-        subprocess.Popen(["./ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    # Start the local Ollama server through its supervisor and wait until it answers
+    if not job_settings.use_openai:
+        begin_ollama_server()
 
     # Count processed papers for each source
     source_counts = {
@@ -104,6 +79,13 @@ def scrape_and_extract_concurrent(job_settings: JobSettings):
     scienceopen_retmax = max(0, original_retmax - source_counts['SO'])
     unpaywall_retmax = max(0, original_retmax - source_counts['unpaywall'])
 
+    # Downloads are handed to a pool of extraction workers through a bounded queue,
+    # so scraping carries on while the model works and pauses when it falls behind.
+    num_workers = job_settings.extract.max_in_flight
+    queue_size = job_settings.extract.queue_size or 2 * num_workers
+    print(f"Starting {num_workers} extraction worker(s) with a queue of {queue_size} papers")
+    job_settings.extraction_queue = ExtractionQueue(job_settings, num_workers, queue_size)
+
     for search_terms in all_search_terms:
         # Perform searches and extractions
         if job_settings.scrape.scrape_pubmed and pubmed_retmax > 0:
@@ -145,6 +127,10 @@ def scrape_and_extract_concurrent(job_settings: JobSettings):
                 unpaywall_search(job_settings)
             job_settings.scrape.retmax = original_retmax
 
+    print("Scraping finished; waiting for queued extractions to complete...")
+    job_settings.extraction_queue.close()
+    job_settings.extraction_queue = None
+
     print("Concurrent scraping and extraction completed.")
 
     # If not in auto mode, restart the script
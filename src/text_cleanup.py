@@ -0,0 +1,193 @@
+import re
+from collections import Counter
+
+# Headings that start the reference list.
+REFERENCE_HEADING = re.compile(
+    r"^\s*(?:\d+\.?\s*)?(?:references|bibliography|literature cited|references and notes|works cited|notes and references)\s*:?\s*$",
+    re.IGNORECASE,
+)
+# Blocks inside the reference list that look like citations: numbered entries ("[12] ", "12. ",
+# "(12) "), author-initial entries ("Smith, J. A.", "Smith JA,"), or text with a DOI, "et al."
+# or a year followed by a volume or pages.
+CITATION = re.compile(
+    r"^\s*(?:\[\d{1,4}\]|\(\d{1,4}\)|\d{1,4}\.)\s+\S"
+    r"|^\s*[A-Z][A-Za-z'\-]+,?\s+(?:[A-Z]\.\s*){1,3}[,;&]"
+    r"|^\s*[A-Z][A-Za-z'\-]+\s+[A-Z]{1,3}[,.]"
+    r"|\bdoi\b|\bet al\.|\b(?:19|20)\d{2}[a-z]?\)?\s*[,;:]\s*\d",
+    re.IGNORECASE,
+)
+# Figure, table and scheme captions, which are content wherever they appear.
+CAPTION = re.compile(r"^\s*(?:table|fig(?:ure)?\.?|scheme|chart)\s*S?\d+", re.IGNORECASE)
+# Back-matter sections that say nothing about the science.
+BACK_MATTER_HEADING = re.compile(
+    r"^\s*(?:\d+\.?\s*)?(?:acknowledge?ments?|funding(?: sources| information)?|conflicts? of interest|"
+    r"competing (?:financial )?interests?|declaration of competing interest|author contributions?|"
+    r"credit authorship contribution statement|notes)\s*:?\s*$",
+    re.IGNORECASE,
+)
+SECTION_HEADING = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?|[IVX]+\.)?\s*[A-Z][A-Za-z0-9 &:/\-]{2,80}$")
+PAGE_NUMBER = re.compile(r"^\s*(?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+LICENCE_TEXT = re.compile(
+    r"creative commons|this article is licensed under|open access this article|all rights reserved|"
+    r"©|\(c\) \d{4}|copyright \d{4}|downloaded (?:from|via)|terms and conditions|reprints and permissions|"
+    r"this is an open access article|published by .{0,60} under|distributed under the terms",
+    re.IGNORECASE,
+)
+# Licence and download notices are short; longer blocks that mention them are kept.
+MAX_LICENCE_WORDS = 80
+# Blocks among the first/last RUNNING_LINE_DEPTH of a page that repeat (ignoring digits) on at
+# least this share of pages are running headers or footers.
+RUNNING_LINE_DEPTH = 2
+RUNNING_LINE_SHARE = 0.3
+MIN_PAGES_FOR_RUNNING_LINES = 3
+# Page number offset that matches no block, for documents whose edge numbers do not step with the pages.
+NO_PAGE_NUMBERS = object()
+
+
+def is_section_heading(block):
+    """Return True if a text block looks like a section heading (short, capitalised, no sentence punctuation)."""
+    block = block.strip()
+    return 0 < len(block.split()) <= 10 and not block.endswith(".") and bool(SECTION_HEADING.match(block))
+
+
+class BoilerplateFilter():
+    """
+    Decide block by block whether text is content or boilerplate.
+
+    After a reference heading, drops the blocks that look like citations, so tables, figures
+    and text that the layout puts among or after the references are kept; the reference list
+    ends at the next section heading that is not a caption. Also drops acknowledgement, funding, competing-interest
+    and author-contribution sections (until the next heading or caption) and short licence,
+    copyright and download notices. Page numbers are left to ``remove_running_lines``, which
+    knows where a block sits on its page. Blocks must be fed in document order.
+    ``removed`` counts the dropped blocks by reason.
+    """
+    def __init__(self):
+        self.skipping = None
+        self.removed = Counter()
+
+    def keep(self, block):
+        """Return True if ``block`` is content."""
+        text = block.strip()
+        if not text:
+            return True
+        if REFERENCE_HEADING.match(text):
+            self.skipping = "references"
+            self.removed["references"] += 1
+            return False
+        if BACK_MATTER_HEADING.match(text):
+            self.skipping = "back matter"
+        elif self.skipping == "back matter" and CAPTION.match(text):
+            self.skipping = None
+        elif self.skipping and is_section_heading(text) and not CAPTION.match(text):
+            self.skipping = None
+        if self.skipping == "references":
+            if CITATION.search(text):
+                self.removed["references"] += 1
+                return False
+        elif self.skipping:
+            self.removed[self.skipping] += 1
+            return False
+        if len(text.split()) <= MAX_LICENCE_WORDS and LICENCE_TEXT.search(text):
+            self.removed["licence"] += 1
+            return False
+        return True
+
+
+def _running_line_key(block):
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", block.strip().lower()))
+
+
+def repeated_edge_blocks(blocks, seen):
+    """
+    Return the indices of the blocks at the edges of a page that were at a page edge before.
+
+    For spotting running lines while pages are still streaming in; the page's own edge
+    keys are added to ``seen`` afterwards.
+    """
+    edges = [idx for idx in range(len(blocks)) if idx < RUNNING_LINE_DEPTH or idx >= len(blocks) - RUNNING_LINE_DEPTH]
+    keys = {idx: _running_line_key(blocks[idx]) for idx in edges if re.search(r"[^\W\d_]", blocks[idx])}
+    repeated = {idx for idx, key in keys.items() if key in seen}
+    seen.update(keys.values())
+    return repeated
+
+
+def _page_number(text):
+    match = PAGE_NUMBER.match(text)
+    return int(re.search(r"\d+", text).group()) if match else None
+
+
+def _page_number_offset(pages, text_of):
+    """
+    Return the difference between printed page numbers and page indexes, or None.
+
+    None means every number-only block at a page edge counts as a page number (documents
+    of one page). With several pages, the offset must be shared by at least two pages, and
+    ``NO_PAGE_NUMBERS`` is returned when none is.
+    """
+    if len(pages) < 2:
+        return None
+    offsets = Counter()
+    for page_idx, blocks in enumerate(pages):
+        edge = blocks[:RUNNING_LINE_DEPTH] + blocks[-RUNNING_LINE_DEPTH:]
+        numbers = {_page_number(text_of(block)) for block in edge}
+        offsets.update({number - page_idx for number in numbers if number is not None})
+    if not offsets:
+        return None
+    offset, count = offsets.most_common(1)[0]
+    return offset if count >= 2 else NO_PAGE_NUMBERS
+
+
+def remove_running_lines(pages, removed=None, text_of=None):
+    """
+    Remove running headers, footers and page numbers from a list of pages, each a list of text blocks.
+
+    A block is a running line if it sits among the first or last blocks of a page and the
+    same text (ignoring digits, so page numbers do not matter) does so on many pages. A
+    block is a page number if it is only a number ("12", "Page 3 of 10"), sits among the
+    first or last blocks of a page and, when there are several pages, the numbers step with
+    the pages; numbers inside the page, and numeric table cells that happen to end a page,
+    are kept. ``text_of`` gets the text of a block when blocks are not plain strings.
+    """
+    text_of = text_of or (lambda block: block)
+    page_offset = _page_number_offset(pages, text_of)
+    running = set()
+    if len(pages) >= MIN_PAGES_FOR_RUNNING_LINES:
+        counts = Counter()
+        for blocks in pages:
+            edge = blocks[:RUNNING_LINE_DEPTH] + blocks[-RUNNING_LINE_DEPTH:]
+            # Blocks without letters (page numbers, numeric table cells) all share one key.
+            counts.update({_running_line_key(text_of(block)) for block in edge if re.search(r"[^\W\d_]", text_of(block))})
+        min_pages = max(MIN_PAGES_FOR_RUNNING_LINES, int(RUNNING_LINE_SHARE * len(pages)))
+        running = {key for key, count in counts.items() if count >= min_pages}
+    cleaned = []
+    for page_idx, blocks in enumerate(pages):
+        kept = []
+        for idx, block in enumerate(blocks):
+            at_edge = idx < RUNNING_LINE_DEPTH or idx >= len(blocks) - RUNNING_LINE_DEPTH
+            if at_edge and _page_number(text_of(block)) is not None and (
+                page_offset is None or _page_number(text_of(block)) - page_idx == page_offset
+            ):
+                if removed is not None:
+                    removed["page numbers"] += 1
+                continue
+            if at_edge and _running_line_key(text_of(block)) in running:
+                if removed is not None:
+                    removed["running headers/footers"] += 1
+                continue
+            kept.append(block)
+        cleaned.append(kept)
+    return cleaned
+
+
+def clean_pages(pages):
+    """
+    Strip boilerplate from a whole document given as pages of text blocks.
+
+    Returns:
+    tuple: The content blocks in order, and a Counter of removed blocks by reason.
+    """
+    block_filter = BoilerplateFilter()
+    pages = remove_running_lines(pages, block_filter.removed)
+    blocks = [block for page in pages for block in page if block_filter.keep(block)]
+    return blocks, block_filter.removed
@@ -31,6 +31,8 @@ from rdkit import RDLogger
 import cirpy
 import pubchempy as pcp
 import json
+import threading
+import time
 
 RDLogger.DisableLog('rdApp.error')
 
@@ -40,6 +42,9 @@ EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pmc&i
 ESEARCH_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi'
 EFETCH_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi'
 
+# Serialises appends to results CSVs when several papers are extracted at once.
+_CSV_WRITE_LOCK = threading.Lock()
+
 def splashbanner():
     print("""
 
@@ -345,66 +350,228 @@ def has_multiple_columns(pdf_path):
     # If no tall line of white pixels was found, return False
     return False
 
+# JATS subtrees that are not rendered: the reference list, acknowledgements and publishing metadata.
+JATS_SKIPPED_TAGS = {"ref-list", "ack", "journal-meta", "permissions", "processing-meta"}
+# Children of <article-meta> that are rendered; the others (authors, dates, ids...) are skipped.
+JATS_KEPT_META_TAGS = {"title-group", "abstract", "trans-abstract", "kwd-group"}
+# Elements rendered as a whole when they end; the paragraphs inside them are not emitted on their own.
+JATS_FLOAT_TAGS = {"fig", "table-wrap", "supplementary-material"}
+# Text blocks; one nested in another is written as part of the outer block.
+JATS_PARAGRAPH_TAGS = {"p", "def-item", "disp-quote"}
+# Elements whose text is separated from the text around them.
+JATS_BLOCK_TAGS = JATS_PARAGRAPH_TAGS | {"list", "list-item", "disp-formula", "title", "label", "td", "th", "tr"}
+
+
+def _jats_local_name(tag):
+    return tag.split('}')[-1] if isinstance(tag, str) else ""
+
+
+def _jats_text(element):
+    return " ".join(_jats_raw_text(element).split())
+
+
+def _jats_raw_text(element):
+    # Like itertext, but block-level children (list items, nested paragraphs) are set off by spaces.
+    parts = [element.text or ""]
+    for child in element:
+        if _jats_local_name(child.tag) in JATS_BLOCK_TAGS:
+            parts.extend((" ", _jats_raw_text(child), " "))
+        elif isinstance(child.tag, str):
+            parts.append(_jats_raw_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _jats_clear(element):
+    """Free an element's content, keeping its tail, which is text of the enclosing element."""
+    tail = element.tail
+    element.clear()
+    element.tail = tail
+
+
+def _jats_table_rows(table):
+    """Render the rows of a JATS/HTML table as compact pipe-separated lines."""
+    rows = []
+    for row in table.iter():
+        if _jats_local_name(row.tag) != "tr":
+            continue
+        cells = [_jats_text(cell) for cell in row if _jats_local_name(cell.tag) in ("td", "th")]
+        if any(cells):
+            rows.append("| " + " | ".join(cells) + " |")
+    return rows
+
+
+def _jats_float(element):
+    """Render a figure, table or supplementary file with its label, caption, table rows and footnotes."""
+    tag = _jats_local_name(element.tag)
+    label = ""
+    caption = ""
+    hrefs = []
+    rows = []
+    footnotes = []
+    for child in element.iter():
+        name = _jats_local_name(child.tag)
+        if name == "label" and not label:
+            label = _jats_text(child)
+        elif name == "caption" and not caption:
+            caption = _jats_text(child)
+        elif name in ("graphic", "media"):
+            href = child.attrib.get('{http://www.w3.org/1999/xlink}href') or child.attrib.get('href')
+            if href:
+                hrefs.append(f"[{href}]")
+        elif name == "table":
+            rows.extend(_jats_table_rows(child))
+        elif name == "table-wrap-foot":
+            footnotes.append(_jats_text(child))
+    lines = [f"{tag.capitalize()}: {label}".rstrip()]
+    if caption:
+        lines.append(f"Caption: {caption}")
+    lines.extend(hrefs)
+    lines.extend(rows)
+    lines.extend(footnote for footnote in footnotes if footnote)
+    return "\n".join(lines)
+
+
+def jats_to_text(source):
+    """
+    Convert a PMC/JATS XML article into plain text, reading it as a stream.
+
+    The article title is underlined, the abstract starts with "Abstract:", section titles
+    become "#" headings (one "#" per nesting level), and figures and tables become a
+    "Fig:"/"Table-wrap:" line with their caption, followed for tables by one
+    pipe-separated line per row. The reference list, acknowledgements and article
+    metadata other than the title, abstract and keywords are skipped.
+
+    Args:
+        source (str or file object): Path to the XML file, or an open binary file.
+
+    Returns:
+        tuple: The text, and a list of sections as dicts with ``title``, ``level`` and the
+            ``start``/``end`` character offsets of the section in the text.
+    """
+    blocks = []
+    length = 0
+    sections = []
+    open_sections = []
+    tags = []
+    skip_depth = 0
+    float_depth = 0
+    pending_floats = []
+
+    def emit(text):
+        nonlocal length
+        if not text:
+            return
+        if blocks:
+            length += 2
+        blocks.append(text)
+        length += len(text)
+
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        tag = _jats_local_name(element.tag)
+        if event == "start":
+            parent = tags[-1] if tags else ""
+            tags.append(tag)
+            if skip_depth or tag in JATS_SKIPPED_TAGS or (parent == "article-meta" and tag not in JATS_KEPT_META_TAGS):
+                skip_depth += 1
+            elif tag in JATS_FLOAT_TAGS:
+                float_depth += 1
+            elif float_depth:
+                pass
+            elif tag in ("abstract", "trans-abstract"):
+                emit("Abstract:")
+            elif tag == "sec":
+                open_sections.append({"title": "", "level": len(open_sections) + 1, "start": length + 2 if blocks else 0})
+            continue
+
+        tags.pop()
+        if skip_depth:
+            skip_depth -= 1
+            if not skip_depth:
+                element.clear()
+        elif tag in JATS_FLOAT_TAGS:
+            float_depth -= 1
+            if not float_depth:
+                if JATS_PARAGRAPH_TAGS.intersection(tags):
+                    # Inline in a paragraph: written after the paragraph, which keeps the text around it.
+                    pending_floats.append(_jats_float(element))
+                else:
+                    emit(_jats_float(element))
+                _jats_clear(element)
+        elif float_depth:
+            continue
+        elif tag == "article-title":
+            title = _jats_text(element)
+            if title:
+                emit(title + "\n" + "=" * len(title))
+        elif tag == "title":
+            title = _jats_text(element)
+            if open_sections and not open_sections[-1]["title"]:
+                open_sections[-1]["title"] = title
+            if title:
+                emit("#" * max(1, len(open_sections)) + " " + title)
+        elif tag in JATS_PARAGRAPH_TAGS:
+            if JATS_PARAGRAPH_TAGS.intersection(tags):
+                # Nested (a list inside a paragraph); the outer paragraph writes its text.
+                continue
+            emit(_jats_text(element))
+            for rendered in pending_floats:
+                emit(rendered)
+            pending_floats = []
+            _jats_clear(element)
+        elif tag == "kwd-group":
+            keywords = [_jats_text(kwd) for kwd in element if _jats_local_name(kwd.tag) == "kwd"]
+            emit("Keywords: " + ", ".join(keywords) if keywords else "")
+        elif tag == "sec" and open_sections:
+            section = open_sections.pop()
+            section["end"] = length
+            sections.append(section)
+            element.clear()
+
+    sections.sort(key=lambda section: section["start"])
+    return "\n\n".join(blocks) + "\n", sections
+
+
 def xml_to_string(xml_string):
     """
     Convert an XML string to a formatted string representation. This is what we use to get the XML documents into a
     format the LLM will be able to interpret better, with fewer artifacts.
 
+    See ``jats_to_text``, which does the conversion.
+
     Args:
         xml_string (str): The XML content as a string.
 
     Returns:
         str: A formatted string representation of the XML content.
     """
-    formatted_output = ""
-    root = ET.fromstring(xml_string)
+    data = xml_string.encode("utf-8") if isinstance(xml_string, str) else xml_string
+    return jats_to_text(io.BytesIO(data))[0]
 
-    def process_element(element, level=0):
-        nonlocal formatted_output
-        tag = element.tag.split('}')[-1]  # Remove namespace prefix
-        text = (element.text or "").strip()
 
-        # Format different types of elements
-        if tag == "article-title":
-            formatted_output += text + "\n" + "=" * len(text) + "\n\n"
-        elif tag in ["p", "sec"]:
-            formatted_output += text + "\n\n"
-        elif tag == "title":
-            formatted_output += "#" * (level + 1) + " " + text + "\n\n"
-        elif tag == "abstract":
-            formatted_output += "Abstract: " + text + "\n\n"
-        elif tag in ["fig", "table-wrap"]:
-            formatted_output += f"{tag.capitalize()}: {text}\n\n"
-        elif tag == "caption":
-            formatted_output += f"Caption: {text}\n\n"
-        elif tag == "table":
-            formatted_output += f"Table: {text}\n\n"
-        elif tag in ["graphic", "media"]:
-            href = element.attrib.get('{http://www.w3.org/1999/xlink}href') or element.attrib.get('href')
-            if href:
-                formatted_output += f"[{href}]"
-            else:
-                formatted_output += "[Image]"
-        elif tag not in [
-            "ref", "element-citation", "person-group", "name", "surname",
-            "given-names", "article-title", "source", "year", "volume",
-            "fpage", "lpage", "pub-id"
-        ]:
-            # For other tags, just append the text
-            formatted_output += text
-
-        # Process each child element recursively
-        for child in element:
-            process_element(child, level + 1)
-            # IMPORTANT: capture tail text (the text after the child's closing tag)
-            tail_text = (child.tail or "").strip()
-            if tail_text:
-                formatted_output += tail_text + " "
-
-    process_element(root)
-    return formatted_output
+# Element types unstructured uses for running headers, footers and page numbers.
+BOILERPLATE_ELEMENT_TYPES = {"Header", "Footer", "Page-header", "Page-footer", "PageNumber"}
 
 
+def _strip_element_boilerplate(elements_list):
+    """
+    Drop unstructured elements that are boilerplate rather than content.
+
+    Removes headers, footers and page numbers (by element type and by repetition across
+    pages), the reference list, back matter and licence notices (see ``src.text_cleanup``).
+    """
+    from src.text_cleanup import BoilerplateFilter, remove_running_lines
+
+    pages = {}
+    for element in elements_list:
+        if element.get("type") in BOILERPLATE_ELEMENT_TYPES:
+            continue
+        page_number = (element.get("metadata") or {}).get("page_number")
+        pages.setdefault(page_number, []).append(element)
+    block_filter = BoilerplateFilter()
+    pages = remove_running_lines(list(pages.values()), block_filter.removed, lambda element: element.get("text", ""))
+    return [element for page in pages for element in page if block_filter.keep(element.get("text", ""))]
+
 
 def elements_to_string(elements_list):
     """
@@ -420,7 +587,7 @@ def elements_to_string(elements_list):
     """
     formatted_output = ""
 
-    for element in elements_list:
+    for element in _strip_element_boilerplate(elements_list):
         element_type = element.get("type")
         text = element.get("text", "")
 
@@ -465,6 +632,107 @@ def elements_to_string(elements_list):
     return formatted_output
 
 
+def build_paper_digest(text, keywords=None, max_keyword_sentences=8, max_chars=6000):
+    """
+    Build a short digest of a processed paper for the check prompt.
+
+    The digest keeps the title, the abstract, section headings, figure/table captions
+    and the sentences with the most keyword hits. It relies on the markup written by
+    ``jats_to_text`` and ``elements_to_string`` (underlined titles, "Abstract:",
+    "#" headings, "Caption:" and parenthesised captions); for flat text, such as
+    pdf2txt output, the opening of the paper stands in for the abstract and captions
+    are found by their "Figure N"/"Table N" labels.
+
+    Args:
+    text (str): Processed paper text.
+    keywords (list): Terms describing what the job is looking for.
+    max_keyword_sentences (int): Maximum number of keyword sentences to include.
+    max_chars (int): Maximum length of the digest.
+
+    Returns:
+    str: The digest.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    title = ""
+    abstract = ""
+    headings = []
+    captions = []
+    body = []
+    skip = set()
+
+    def is_structural(line):
+        return line.startswith(("#", "Abstract:", "Caption:", "Fig:", "Table-wrap:", "Keywords:", "|")) or set(line) == {"="}
+
+    for idx, line in enumerate(lines):
+        if idx in skip or set(line) == {"="}:
+            continue
+        next_line = lines[idx + 1] if idx + 1 < len(lines) else ""
+        if next_line and set(next_line) == {"="}:
+            if not title:
+                title = line
+            else:
+                headings.append(line)
+        elif line.startswith("#"):
+            headings.append(line.lstrip("#").strip())
+        elif line.startswith("Abstract:") and not abstract:
+            abstract = line[len("Abstract:"):].strip()
+            # XML abstracts keep their text in the following paragraphs.
+            follow = idx + 1
+            while len(abstract) < 1500 and follow < len(lines) and not is_structural(lines[follow]):
+                abstract = f"{abstract} {lines[follow]}".strip()
+                skip.add(follow)
+                follow += 1
+        elif line.startswith("Caption:"):
+            caption = line[len("Caption:"):].strip()
+            if not caption and next_line and not is_structural(next_line):
+                # XML captions keep their text in the following paragraph.
+                caption = next_line
+                skip.add(idx + 1)
+            captions.append(caption)
+        elif line.startswith("(") and line.endswith(")"):
+            captions.append(line[1:-1].strip())
+        elif line.isupper() and len(line) < 120 and not is_structural(line):
+            headings.append(line.title())
+        elif not is_structural(line):
+            body.append(line)
+
+    if not captions:
+        captions = re.findall(r"((?:Fig(?:ure)?|Table)\.?\s*\d+[.:][^.]{0,300}\.)", text)
+    if not abstract:
+        abstract = " ".join(text[:1500].split())
+    abstract = abstract[:1500]
+
+    keyword_sentences = []
+    if keywords:
+        keyword_set = {keyword.lower() for keyword in keywords}
+        sentences = re.split(r"(?<=[.!?])\s+", " ".join(" ".join(body).split()))
+        scored = []
+        for position, sentence in enumerate(sentences):
+            words = set()
+            for word in re.findall(r"[a-z0-9]+", sentence.lower()):
+                # Fold simple plurals the same way the relevance scorer does.
+                if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+                    word = word[:-1]
+                words.add(word)
+            hits = len(words & keyword_set)
+            if hits and len(sentence) < 600:
+                scored.append((hits, position, sentence))
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:max_keyword_sentences]
+        keyword_sentences = [sentence for _, _, sentence in sorted(best, key=lambda item: item[1])]
+
+    parts = []
+    if title:
+        parts.append(f"Title: {title}")
+    if abstract:
+        parts.append(f"Abstract: {abstract}")
+    if headings:
+        parts.append("Section headings:\n" + "\n".join(f"- {heading}" for heading in dict.fromkeys(headings)))
+    if captions:
+        parts.append("Figure and table captions:\n" + "\n".join(f"- {caption[:400]}" for caption in dict.fromkeys(captions) if caption))
+    if keyword_sentences:
+        parts.append("Key sentences:\n" + "\n".join(f"- {sentence}" for sentence in keyword_sentences))
+    return "\n\n".join(parts)[:max_chars]
+
 
 def select_schema_file():
     """
@@ -769,7 +1037,7 @@ def load_schema_file(schema_file):
     return schema_data, key_columns
 
 
-def generate_prompt(schema_data, user_instructions, key_columns=None, target_type="small_molecule"):
+def generate_prompt(schema_data, user_instructions, key_columns=None, target_type="small_molecule", structured_output=False):
     """
     Generates a prompt for the AI model based on the schema data and user instructions. Uses a few other helper
     functions to generate text describing the schema, examples of good responses, and key column info.
@@ -778,6 +1046,7 @@ def generate_prompt(schema_data, user_instructions, key_columns=None, target_typ
     schema_data (dict): Dictionary containing the schema information.
     user_instructions (str): Additional instructions provided by the user.
     key_columns (list): List of column numbers used as keys for checking duplicates.
+    structured_output (bool): Ask for JSON rows matching ``schema_to_json_schema`` instead of CSV lines.
 
     Returns:
     str: A formatted prompt for the AI model.
@@ -848,6 +1117,25 @@ def generate_prompt(schema_data, user_instructions, key_columns=None, target_typ
         target_output_instruction = (
             "- Provide SMILES strings directly whenever possible. This has the highest priority over IUPAC or common names."
         )
+    def example_block(count):
+        examples = generate_examples(schema_data, count, normalized_target_type)
+        if not structured_output:
+            return examples
+        return json.dumps({"rows": _csv_examples_to_json_rows(examples, schema_data)})
+
+    if structured_output:
+        format_instructions = f"""- Respond with a JSON object of the form {{"rows": [...]}}, with one object per extracted row.
+- This paper has been flagged as containing relevant information and should have data to be extracted.
+- Each row object must have exactly the {num_columns} keys {schema_diagram}, in that order.
+- If information is missing for a column, use null."""
+    else:
+        format_instructions = f"""- Extract relevant information and provide it as comma-separated values.
+- This paper has been flagged as containing relevant information and should have data to be extracted.
+- Each line must contain {num_columns} values, corresponding to the {num_columns} columns in the schema.
+- If information is missing for a column, use 'null' as a placeholder.
+- Do not use anything other than 'null' as a placeholder.
+- Enclose all string values in double-quotes.
+- Never use natural language outside of a string enclosed in double-quotes."""
     prompt = f"""
 Using the research paper text provided above, extract information about {descriptor}s that fits into the following CSV schema:
 
@@ -855,13 +1143,7 @@ Using the research paper text provided above, extract information about {descrip
 {key_column_info if key_columns else ''}
 
 Extraction Instructions:
-- Extract relevant information and provide it as comma-separated values.
-- This paper has been flagged as containing relevant information and should have data to be extracted.
-- Each line must contain {num_columns} values, corresponding to the {num_columns} columns in the schema.
-- If information is missing for a column, use 'null' as a placeholder.
-- Do not use anything other than 'null' as a placeholder.
-- Enclose all string values in double-quotes.
-- Never use natural language outside of a string enclosed in double-quotes.
+{format_instructions}
 - For range values, use the format "min-max" when a range is explicitly expected.
 {target_output_instruction}
 - Do not include headers, explanations, summaries, or any additional formatting.
@@ -874,13 +1156,13 @@ Example showing only the column names:
 {schema_diagram}
 
 Example where the paper contains a single piece of information:
-{generate_examples(schema_data, 1, normalized_target_type)}
+{example_block(1)}
 
 Example where the paper contains two pieces of information:
-{generate_examples(schema_data, 2, normalized_target_type)}
+{example_block(2)}
 
 Example where the paper contains three pieces of information:
-{generate_examples(schema_data, 3, normalized_target_type)}
+{example_block(3)}
 
 User Instructions:
 {user_instructions}
@@ -964,6 +1246,44 @@ Output requirements:
 - Respond with exactly one token: yes or no
 - Any answer other than exact "yes" is treated as "no"
 """
+
+
+def generate_repair_prompt(schema_data, response, examples=None):
+    """
+    Generate a short prompt asking the model to reformat a response that could not be used.
+
+    Only the schema header and the rejected response are included, not the paper,
+    so a formatting failure costs a few hundred tokens instead of a full extraction.
+
+    Args:
+    schema_data (dict): Dictionary containing the schema information.
+    response (str): The raw model response that failed to parse or validate.
+    examples (str): Optional example rows showing the expected format.
+
+    Returns:
+    str: A formatted prompt for the AI model.
+    """
+    num_columns = len(schema_data)
+    schema_info = ""
+    for column_number, column_data in schema_data.items():
+        schema_info += f"Column {column_number}: {column_data['name']} ({column_data['type']})\n"
+    response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
+    example_block = f"\nExample of correctly formatted rows:\n{examples}\n" if examples else ""
+    return f"""
+The response below was meant to list extracted data as CSV rows, but it could not be read.
+
+Schema ({num_columns} columns, in this order):
+{schema_info}{example_block}
+Response to fix:
+{response}
+
+Reformat the response to {num_columns} columns:
+- Output one row per line, each with exactly {num_columns} comma-separated values in the schema order.
+- Enclose all string values in double-quotes.
+- Use 'null' for any missing value.
+- Keep the data from the response; do not add, guess or remove information.
+- Do not include headers, explanations or any other text.
+Response:"""
     
 
 def parse_llm_response(response, num_columns):
@@ -1008,7 +1328,134 @@ def parse_llm_response(response, num_columns):
     for row in parsed_data:
         if row not in unique_data:
             unique_data.append(row)
-    
+
+    return unique_data
+
+
+# JSON Schema types for the schema column types. Anything else is requested as a string.
+JSON_SCHEMA_TYPES = {
+    'int': 'integer',
+    'float': 'number',
+    'boolean': 'boolean',
+}
+
+
+def schema_to_json_schema(schema_data):
+    """
+    Compile a LoA schema (including injected target, solvent and comments columns) into a JSON Schema.
+
+    The model is asked for an object with a single ``rows`` list; each row is an object
+    keyed by column name in schema order. Every column is required and nullable, which
+    keeps the schema valid for OpenAI strict structured outputs as well as Ollama's
+    ``format`` parameter.
+
+    Args:
+    schema_data (dict): Dictionary containing the schema information.
+
+    Returns:
+    dict: A JSON Schema describing the expected response.
+    """
+    properties = {}
+    for column_number in sorted(schema_data):
+        column_data = schema_data[column_number]
+        json_type = JSON_SCHEMA_TYPES.get(column_data['type'], 'string')
+        column_schema = {"type": [json_type, "null"]}
+        if column_data.get('description'):
+            column_schema["description"] = column_data['description']
+        if json_type == 'string' and column_data.get('allowed_values'):
+            column_schema["enum"] = list(column_data['allowed_values']) + [None]
+        properties[column_data['name']] = column_schema
+    return {
+        "type": "object",
+        "properties": {
+            "rows": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(properties),
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["rows"],
+        "additionalProperties": False,
+    }
+
+
+def _csv_examples_to_json_rows(examples, schema_data):
+    """Convert CSV example rows from ``generate_examples`` into row objects for structured output prompts."""
+    columns = [schema_data[column_number] for column_number in sorted(schema_data)]
+    rows = []
+    for values in csv.reader(examples.splitlines(), quotechar='"', skipinitialspace=True):
+        row = {}
+        for column_data, value in zip(columns, values):
+            json_type = JSON_SCHEMA_TYPES.get(column_data['type'], 'string')
+            try:
+                if json_type == 'integer':
+                    value = int(value)
+                elif json_type == 'number':
+                    value = float(value)
+            except ValueError:
+                pass
+            row[column_data['name']] = value
+        rows.append(row)
+    return rows
+
+
+def _json_value_to_string(value):
+    """Render a decoded JSON value the way the CSV parser would have returned it."""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+def parse_json_response(response, schema_data):
+    """
+    Parse a structured (JSON) response from a language model into rows of strings.
+
+    This is the counterpart of ``parse_llm_response`` for responses constrained by
+    ``schema_to_json_schema``. Rows come back in schema column order with missing or
+    null values as 'null', so they can be validated exactly like parsed CSV rows.
+
+    Args:
+    response (str): The raw text response from the language model.
+    schema_data (dict): Dictionary containing the schema information.
+
+    Returns:
+    list: A list of unique rows, where each row is a list of column values.
+    """
+    text = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
+    try:
+        decoded = json.loads(text)
+    except ValueError:
+        # Tolerate code fences or stray text around the object.
+        start, end = text.find('{'), text.rfind('}')
+        if start == -1 or end <= start:
+            return []
+        try:
+            decoded = json.loads(text[start:end + 1])
+        except ValueError:
+            return []
+
+    rows = decoded.get("rows", []) if isinstance(decoded, dict) else decoded
+    if not isinstance(rows, list):
+        return []
+    names = [schema_data[column_number]['name'] for column_number in sorted(schema_data)]
+    unique_data = []
+    for item in rows:
+        if isinstance(item, dict):
+            row = [_json_value_to_string(item.get(name)) for name in names]
+        elif isinstance(item, list) and len(item) == len(names):
+            row = [_json_value_to_string(value) for value in item]
+        else:
+            continue
+        if row not in unique_data:
+            unique_data.append(row)
     return unique_data
 
 
@@ -1681,29 +2128,38 @@ def write_to_csv(data, headers, filename="extracted_data.csv"):
     headers (list): The column headers for the CSV.
     filename (str): The name of the CSV file to write to.
     """
-    file_exists = os.path.isfile(filename)
-    with open(filename, mode='a', newline='') as csv_file:
-        writer = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL, quotechar='"')
-        if not file_exists:
-            writer.writerow(headers)
-        writer.writerows(data)
+    with _CSV_WRITE_LOCK:
+        file_exists = os.path.isfile(filename)
+        with open(filename, mode='a', newline='') as csv_file:
+            writer = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL, quotechar='"')
+            if not file_exists:
+                writer.writerow(headers)
+            writer.writerows(data)
 
 
-def generate_examples(schema_data, num_examples=3, target_type="small_molecule"):
+def generate_examples(schema_data, num_examples=3, target_type="small_molecule", seed=None):
     """
     Generate example data based on the provided schema.
 
     This function creates random example data that conforms to the schema,
     which can be used to illustrate the expected format of the data.
+    The random values are seeded from the schema itself (unless ``seed`` is given),
+    so the same schema always yields the same examples and prompts built from it
+    stay byte-identical between calls.
 
     Args:
     schema_data (dict): The schema defining the structure and constraints of the data.
     num_examples (int): The number of example rows to generate.
+    seed (int): Optional seed overriding the schema-derived one.
 
     Returns:
     str: A string containing the generated examples, with each row separated by a newline.
     """
     normalized_target_type = normalize_target_type(target_type)
+    if seed is None:
+        schema_repr = json.dumps(schema_data, sort_keys=True, default=str)
+        seed = int(hashlib.sha1(schema_repr.encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
     examples = []
     polymer_targets = [
         '"{[$]CC[$]}"',
@@ -1730,26 +2186,24 @@ def generate_examples(schema_data, num_examples=3, target_type="small_molecule")
             ):
                 example_value = reaction_examples[(_ + column_number) % len(reaction_examples)]
             elif allowed_values:
-                example_value = random.choice(allowed_values)
+                example_value = rng.choice(allowed_values)
             elif column_type == 'str':
                 example_value = f'"example_string_{column_number}"'
             elif column_type == 'int':
                 min_value = column_data.get('min_value', column_number)
                 max_value = column_data.get('max_value', column_number + 10)
-                example_value = random.randint(min_value, max_value)
+                example_value = rng.randint(min_value, max_value)
             elif column_type == 'float':
                 min_value = column_data.get('min_value', float(column_number))
                 max_value = column_data.get('max_value', float(column_number) + 1.0)
-                example_value = round(random.uniform(min_value, max_value), 2)
+                example_value = round(rng.uniform(min_value, max_value), 2)
             elif column_type == 'range':
                 min_value = column_data.get('min_value', column_number)
                 max_value = column_data.get('max_value', column_number + 10)
 
                 # Generate two random integers for the range
-                random.seed(datetime.now().timestamp())
-                rand1 = random.randint(min_value, max_value)
-                random.seed(datetime.now().timestamp())
-                rand2 = random.randint(min_value, max_value)
+                rand1 = rng.randint(min_value, max_value)
+                rand2 = rng.randint(min_value, max_value)
 
                 # Ensure the first number is smaller
                 if rand1 > rand2:
@@ -1800,9 +2254,92 @@ def _supports_feature(page_text, label):
     return None
 
 
+MODEL_INFO_CACHE_PATH = os.path.join(os.getcwd(), 'llm_cache', 'model_info.json')
+# Seconds a server's /api/tags listing (used for model digests) is reused.
+MODEL_DIGEST_TTL = 60
+_model_info_cache = {}
+_model_digests = {}
+_model_info_lock = threading.Lock()
+
+
+def _model_digest(model_name_version, ollama_url):
+    """Return the digest Ollama reports for a model in ``/api/tags``, or None if it is unknown."""
+    now = time.monotonic()
+    with _model_info_lock:
+        cached = _model_digests.get(ollama_url)
+    if cached is None or now - cached[0] > MODEL_DIGEST_TTL:
+        try:
+            response = requests.get(f"{ollama_url}/api/tags", timeout=5)
+            response.raise_for_status()
+            digests = {}
+            for model in response.json().get("models", []):
+                name = model.get("name") or model.get("model")
+                if name:
+                    digests[name] = model.get("digest")
+                    if name.endswith(":latest"):
+                        digests[name[:-len(":latest")]] = model.get("digest")
+        except (requests.exceptions.RequestException, ValueError):
+            digests = {}
+        cached = (now, digests)
+        with _model_info_lock:
+            _model_digests[ollama_url] = cached
+    return cached[1].get(model_name_version)
+
+
+def _load_model_info_file():
+    try:
+        with open(MODEL_INFO_CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
 def get_model_info(model_name_version, ollama_url="http://localhost:11434", use_openai=False, api_key=None):
     """Return context length and capabilities for a model.
 
+    Results are cached in memory and, for Ollama models, in
+    ``llm_cache/model_info.json``, keyed by the server, the model and the
+    model's digest from ``/api/tags``, so pulling a new version of a model
+    invalidates its entry. ``ollama_url`` may be a list of servers, in which
+    case the first is asked. See ``_lookup_model_info`` for how the
+    information is found.
+    """
+    if use_openai:
+        key = f"openai|{model_name_version}"
+        digest = None
+    else:
+        from src.ollama_router import as_url_list
+        ollama_url = (as_url_list(ollama_url) or ["http://localhost:11434"])[0]
+        digest = _model_digest(model_name_version, ollama_url)
+        key = f"{ollama_url}|{model_name_version}|{digest}"
+
+    with _model_info_lock:
+        cached = _model_info_cache.get(key)
+        if cached is None and digest is not None:
+            cached = _load_model_info_file().get(key)
+    if cached is not None:
+        info = {"context_length": cached["context_length"], "capabilities": set(cached["capabilities"])}
+        with _model_info_lock:
+            _model_info_cache[key] = info
+        return {"context_length": info["context_length"], "capabilities": set(info["capabilities"])}
+
+    info = _lookup_model_info(model_name_version, ollama_url, use_openai, api_key)
+    with _model_info_lock:
+        _model_info_cache[key] = info
+        if digest is not None:
+            all_info = _load_model_info_file()
+            all_info[key] = {"context_length": info["context_length"], "capabilities": sorted(info["capabilities"])}
+            os.makedirs(os.path.dirname(MODEL_INFO_CACHE_PATH), exist_ok=True)
+            tmp_path = f"{MODEL_INFO_CACHE_PATH}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(all_info, f, indent=2)
+            os.replace(tmp_path, MODEL_INFO_CACHE_PATH)
+    return {"context_length": info["context_length"], "capabilities": set(info["capabilities"])}
+
+
+def _lookup_model_info(model_name_version, ollama_url="http://localhost:11434", use_openai=False, api_key=None):
+    """Look up context length and capabilities for a model.
+
     Attempts to run ``ollama show`` via subprocess. If that fails or the needed
     information cannot be parsed, this function falls back to the Ollama HTTP
     API. The result is a dictionary with ``context_length`` and ``capabilities``
@@ -2166,52 +2703,17 @@ def get_yn_response(prompt, attempts=5):
 
 
 def begin_ollama_server():
-    # Ping ollama port to see if it is running
-    try:
-        response = requests.get("http://localhost:11434")
+    """
+    Make sure the local Ollama server is running and ready, starting it if needed.
 
-    except Exception:
-        try:
-            response.status_code = 404
-        except Exception:
-            is_ollama_running = False
-        
-    # If so, cool, if not, start it!
-    try:
-        if response.status_code == 200:
-            is_ollama_running = True
-        else:
-            is_ollama_running = False
-    except Exception:
-        is_ollama_running = False
+    The server process is owned by the process-wide ``OllamaSupervisor``, so calling this
+    again never spawns a second server.
 
-    if is_ollama_running:
-        print("Ollama is running.")
-    else:
-        # print("Ollama is not running, starting...")
-    
-        # Check for ollama binary and download if not present
-        if not os.path.isfile('ollama'):
-            print("ollama binary not found. Downloading the latest release...")
-            download_ollama()
-        else:
-            # print("ollama binary already exists in the current directory.")
-            None
-        
-        try:
-            # Start ollama server
-            subprocess.Popen(
-                ["./ollama", "serve"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.STDOUT,
-            )
-        except Exception:
-            # print("Failed to start ollama using portable install, trying with full install")
-            subprocess.Popen(
-                ["ollama", "serve"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.STDOUT,
-            )
+    Returns:
+    bool: True once the server answers.
+    """
+    from src.ollama_supervisor import get_ollama_supervisor
+    return get_ollama_supervisor().ensure_running()
 
 def check_model_file(model_name_version):
     model_name, model_version = model_name_version.split(":")